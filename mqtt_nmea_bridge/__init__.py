@@ -13,8 +13,90 @@
 #
 # --------------------------------------------------------------------------------
 #
-from mqtt_nmea_bridge.mqtt_str_utils import from_mqtt_str_to_shipstate, from_mqtt_str_to_traj, from_mqtt_str_to_windstate
-from mqtt_nmea_bridge.mqtt_str_utils import from_shipstate_to_mqtt_str, from_traj_to_mqtt_str, from_windstate_to_mqtt_str
-from mqtt_nmea_bridge.data_objects import Trajectory, ShipState, WindState
-from mqtt_nmea_bridge.subscribers import TrajectorySubscriber, ShipStateSubscriber, WindStateSubscriber
-from mqtt_nmea_bridge.publishers import TrajectoryPublisher, ShipStatePublisher, WindStatePublisher
\ No newline at end of file
+'''
+The public names are imported on first use, with a module '__getattr__', so that e.g. importing
+only the codecs or the data classes does not load paho-mqtt and NumPy.
+'''
+from typing import TYPE_CHECKING
+import importlib
+
+
+# Module of each public name
+_EXPORTS = {
+    "from_mqtt_str_to_shipstate": "mqtt_str_utils",
+    "from_mqtt_str_to_traj": "mqtt_str_utils",
+    "from_mqtt_str_to_windstate": "mqtt_str_utils",
+    "from_shipstate_to_mqtt_str": "mqtt_str_utils",
+    "from_traj_to_mqtt_str": "mqtt_str_utils",
+    "from_windstate_to_mqtt_str": "mqtt_str_utils",
+    "Trajectory": "data_objects",
+    "ShipState": "data_objects",
+    "WindState": "data_objects",
+    "TrajectorySubscriber": "subscribers",
+    "ShipStateSubscriber": "subscribers",
+    "WindStateSubscriber": "subscribers",
+    "FleetSubscriber": "subscribers",
+    "TrajectoryPublisher": "publishers",
+    "ShipStatePublisher": "publishers",
+    "WindStatePublisher": "publishers",
+    "MetricsRegistry": "metrics",
+    "REGISTRY": "metrics",
+    "TopicScheme": "topics",
+    "FleetCache": "fleet",
+    "VesselState": "fleet",
+    "SharedSubscriberPool": "shared",
+    "LoopbackBroker": "loopback",
+    "ReplayScheduler": "replay",
+    "ReplayStats": "replay",
+    "merge_streams": "replay",
+    "replay_streams": "replay",
+    "LogWriter": "recorder",
+    "LogReader": "recorder",
+    "RecorderSubscriber": "recorder",
+    "replay_log": "recorder",
+    "Profiler": "profiling",
+    "MovingTrajectory": "horizon",
+    "SQLiteSink": "sink",
+}
+
+# The submodules that were imported with the package, available as attributes like 'mnb.loopback'
+_SUBMODULES = {"mqtt_str_utils", "data_objects", "subscribers", "publishers", "metrics", "topics", "fleet",
+               "shared", "loopback", "replay", "recorder", "profiling", "horizon", "tracing", "datasets", "wind",
+               "sink"}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is not None:
+        value = getattr(importlib.import_module(f"{__name__}.{module}"), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module(f"{__name__}.{name}")
+    else:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    # Cached, so '__getattr__' is only called on the first use of a name
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | _SUBMODULES)
+
+
+if TYPE_CHECKING:
+    from mqtt_nmea_bridge.mqtt_str_utils import from_mqtt_str_to_shipstate, from_mqtt_str_to_traj, from_mqtt_str_to_windstate
+    from mqtt_nmea_bridge.mqtt_str_utils import from_shipstate_to_mqtt_str, from_traj_to_mqtt_str, from_windstate_to_mqtt_str
+    from mqtt_nmea_bridge.data_objects import Trajectory, ShipState, WindState
+    from mqtt_nmea_bridge.subscribers import TrajectorySubscriber, ShipStateSubscriber, WindStateSubscriber, FleetSubscriber
+    from mqtt_nmea_bridge.publishers import TrajectoryPublisher, ShipStatePublisher, WindStatePublisher
+    from mqtt_nmea_bridge.metrics import MetricsRegistry, REGISTRY
+    from mqtt_nmea_bridge.topics import TopicScheme
+    from mqtt_nmea_bridge.fleet import FleetCache, VesselState
+    from mqtt_nmea_bridge.shared import SharedSubscriberPool
+    from mqtt_nmea_bridge.loopback import LoopbackBroker
+    from mqtt_nmea_bridge.replay import ReplayScheduler, ReplayStats, merge_streams, replay_streams
+    from mqtt_nmea_bridge.recorder import LogWriter, LogReader, RecorderSubscriber, replay_log
+    from mqtt_nmea_bridge.profiling import Profiler
+    from mqtt_nmea_bridge.horizon import MovingTrajectory
+    from mqtt_nmea_bridge.sink import SQLiteSink
@@ -0,0 +1,15 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
@@ -0,0 +1,237 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+'''
+Encode and decode benchmarks of the functions in 'mqtt_str_utils', on inputs built from the datasets
+in 'example_data'.
+
+Run from the root folder:
+
+    python -m mqtt_nmea_bridge.benchmarks.codec_bench --out codec_bench.json
+    python -m mqtt_nmea_bridge.benchmarks.codec_bench --out new.json --compare codec_bench.json
+'''
+import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge import mqtt_str_utils
+from mqtt_nmea_bridge.replay import data_point_source
+from mqtt_nmea_bridge.datasets import data_point_to_shipstate
+import statistics
+import tracemalloc
+import platform
+import argparse
+import json
+import math
+import time
+import os
+
+
+DATASETS = ["example_data/example_docking_trajectory.csv", "example_data/example_trajectory_noisy_model.csv"]
+TRAJECTORY_SIZES = [10, 100, 1000, None] # None is the full dataset
+
+
+def build_cases(path):
+    '''
+    Builds the benchmark inputs from a dataset.
+
+    The wind states are built from the course and speed over ground of the dataset, since the
+    datasets contain no wind.
+
+    --------------------------------------------------------------------
+    Input:
+        path (str): Path to the dataset CSV file.
+    Output:
+        cases (lst of (str, str, object)): Message kind, case name and data object.
+    --------------------------------------------------------------------
+    '''
+    data_points = list(data_point_source(path))
+    shipstates = [data_point_to_shipstate(data_point) for data_point in data_points]
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    cases = [
+        ("ship_state", f"{name}/ship_state", shipstates[0]),
+        ("wind_state", f"{name}/wind_state", mnb.WindState(time=data_points[0][0],
+                                                           speed=data_points[0][2][1],
+                                                           direction=data_points[0][2][0])),
+    ]
+    for size in TRAJECTORY_SIZES:
+        if size is not None and size > len(shipstates):
+            continue
+        n = len(shipstates) if size is None else size
+        label = "full" if size is None else str(size)
+        cases.append(("trajectory", f"{name}/trajectory_{label}", mnb.Trajectory(shipstates[:n])))
+    return cases
+
+
+_ENCODERS = {
+    "ship_state": mqtt_str_utils.from_shipstate_to_mqtt_str,
+    "wind_state": mqtt_str_utils.from_windstate_to_mqtt_str,
+    "trajectory": mqtt_str_utils.from_traj_to_mqtt_str,
+}
+
+_DECODERS = {
+    "ship_state": mqtt_str_utils.from_mqtt_str_to_shipstate,
+    "wind_state": mqtt_str_utils.from_mqtt_str_to_windstate,
+    "trajectory": mqtt_str_utils.from_mqtt_str_to_traj,
+}
+
+
+def measure(function, argument, min_time=0.2, repeats=5):
+    '''
+    Measures the run time and the allocations of a function call.
+
+    The number of calls per repeat is calibrated so that each repeat takes at least 'min_time'
+    seconds. The allocations are measured on a separate call with tracemalloc.
+
+    --------------------------------------------------------------------
+    Input:
+        function (callable): The function to benchmark.
+        argument: The argument of the function.
+        min_time (float): Minimum duration of each repeat in seconds.
+        repeats (int): Number of repeats.
+    Output:
+        result (dict): Seconds per call (min, median, mean), calls per second and peak allocated bytes.
+    --------------------------------------------------------------------
+    '''
+    # Calibrate the number of calls
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function(argument)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(math.ceil(min_time / elapsed))))
+
+    per_call = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            function(argument)
+        per_call.append((time.perf_counter() - start) / number)
+
+    # Restarted, so the peak is counted from here also if tracemalloc was already tracing.
+    # 'tracemalloc.reset_peak' would avoid this, but needs Python 3.9
+    tracemalloc.stop()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        function(argument)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(per_call)
+    return {
+        "calls": number * repeats,
+        "min_s": min(per_call),
+        "median_s": median,
+        "mean_s": statistics.mean(per_call),
+        "ops_per_s": 1.0 / median if median > 0 else None,
+        "peak_alloc_bytes": peak,
+    }
+
+
+def run(datasets=DATASETS, min_time=0.2, repeats=5, verbose=True):
+    '''
+    Runs the encode and decode benchmarks of every case built from the datasets.
+
+    --------------------------------------------------------------------
+    Input:
+        datasets (lst of str): Paths to the dataset CSV files.
+        min_time (float): Minimum duration of each repeat in seconds.
+        repeats (int): Number of repeats.
+        verbose (bool): Print each result.
+    Output:
+        report (dict): Environment information and a list of results.
+    --------------------------------------------------------------------
+    '''
+    results = []
+    for path in datasets:
+        for kind, case, data_object in build_cases(path):
+            mqtt_str = _ENCODERS[kind](data_object)
+            waypoints = len(data_object.shipstates) if kind == "trajectory" else 1
+            functions = [
+                (_ENCODERS[kind], data_object, "encode"),
+                (_DECODERS[kind], mqtt_str, "decode"),
+                (mqtt_str_utils._parse_mqtt_str, mqtt_str, "decode"),
+            ]
+            for function, argument, direction in functions:
+                result = measure(function, argument, min_time, repeats)
+                result.update({
+                    "function": function.__name__,
+                    "direction": direction,
+                    "case": case,
+                    "waypoints": waypoints,
+                    "payload_bytes": len(mqtt_str),
+                    "mb_per_s": len(mqtt_str) / result["median_s"] / 1e6 if result["median_s"] > 0 else None,
+                })
+                results.append(result)
+                if verbose:
+                    print(f"{case:55s} {function.__name__:28s} {result['median_s']*1e6:12.1f} us "
+                          f"{result['mb_per_s']:8.1f} MB/s {result['peak_alloc_bytes']:12d} B")
+    return {"environment": _environment(), "results": results}
+
+
+def compare(new, old):
+    '''
+    Prints the speedup of each result in 'new' relative to the same function and case in 'old'.
+    '''
+    old_results = {(r["function"], r["case"]): r for r in old["results"]}
+    for result in new["results"]:
+        previous = old_results.get((result["function"], result["case"]))
+        if previous is None:
+            continue
+        speedup = previous["median_s"] / result["median_s"]
+        alloc = result["peak_alloc_bytes"] - previous["peak_alloc_bytes"]
+        print(f"{result['case']:55s} {result['function']:28s} x{speedup:6.2f} {alloc:+12d} B")
+
+
+def _environment():
+    try:
+        from importlib.metadata import version
+        package_version = version("mqtt_nmea_bridge")
+    except Exception:
+        package_version = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "package_version": package_version,
+        "timestamp": time.time(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the encode and decode functions of mqtt_str_utils.")
+    parser.add_argument("--out", default="codec_benchmark.json", help="Path of the JSON results file.")
+    parser.add_argument("--datasets", nargs="+", default=DATASETS, help="Dataset CSV files to build the inputs from.")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum duration of each repeat in seconds.")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of repeats.")
+    parser.add_argument("--compare", help="JSON results file of a previous run to compare with.")
+    args = parser.parse_args()
+
+    report = run(args.datasets, args.min_time, args.repeats)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to '{args.out}'.")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+'''
+Import time benchmark of the package, to guard the lazy imports of 'mqtt_nmea_bridge/__init__.py'
+against regressions.
+
+Each case is run in a fresh interpreter, and reports the wall time of the import statements and
+which of the heavy dependencies they loaded. Run from the root folder:
+
+    python -m mqtt_nmea_bridge.benchmarks.import_time
+    python -m mqtt_nmea_bridge.benchmarks.import_time --budget 50 --out import_time.json
+
+With '--budget', the exit code is 1 if a case that should not load paho-mqtt or NumPy loads them,
+or if a case takes longer than the budget in milliseconds.
+'''
+import statistics
+import subprocess
+import argparse
+import json
+import sys
+
+
+HEAVY_MODULES = ("paho.mqtt.client", "numpy", "pyproj", "matplotlib")
+
+# Name, import statements, and the heavy modules the statements may load
+CASES = [
+    ("package", "import mqtt_nmea_bridge", ()),
+    ("codecs", "from mqtt_nmea_bridge import mqtt_str_utils", ()),
+    ("data_objects", "from mqtt_nmea_bridge import ShipState, Trajectory, WindState", ()),
+    ("encode", "import mqtt_nmea_bridge as mnb; mnb.from_shipstate_to_mqtt_str", ()),
+    ("publishers", "from mqtt_nmea_bridge import ShipStatePublisher", ("paho.mqtt.client",)),
+    ("everything", "from mqtt_nmea_bridge import *", ("paho.mqtt.client", "numpy")),
+]
+
+_SCRIPT = '''
+import sys, time, json
+start = time.perf_counter()
+{statements}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def measure(statements, repeats=5):
+    '''
+    Measures the import time of statements in fresh interpreters.
+
+    --------------------------------------------------------------------
+    Input:
+        statements (str): The import statements.
+        repeats (int): Number of interpreters started.
+    Output:
+        seconds (lst of floats): The import time of each run.
+        loaded (lst of str): The heavy modules loaded by the statements.
+    --------------------------------------------------------------------
+    '''
+    script = _SCRIPT.format(statements=statements, heavy=HEAVY_MODULES)
+    seconds = []
+    loaded = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        seconds.append(result["seconds"])
+        loaded = result["loaded"]
+    return seconds, loaded
+
+
+def run(repeats=5, cases=CASES):
+    '''
+    Runs the import time cases, and returns a report with the median time of each case.
+    '''
+    report = {"python": sys.version.split()[0], "cases": []}
+    for name, statements, allowed in cases:
+        seconds, loaded = measure(statements, repeats)
+        report["cases"].append({
+            "name": name,
+            "statements": statements,
+            "median_ms": statistics.median(seconds)*1e3,
+            "loaded": loaded,
+            "allowed": list(allowed),
+            "unexpected": [module for module in loaded if module not in allowed],
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the package.")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of fresh interpreters per case.")
+    parser.add_argument("--budget", type=float, help="Maximum median import time in milliseconds of the lazy cases.")
+    parser.add_argument("--out", help="Path of the JSON results file.")
+    args = parser.parse_args()
+
+    report = run(args.repeats)
+    failed = False
+    print(f"{'case':<14}{'median':>12}  loaded")
+    for case in report["cases"]:
+        print(f"{case['name']:<14}{case['median_ms']:>9.2f} ms  {', '.join(case['loaded']) or '-'}")
+        if case["unexpected"]:
+            print(f"  '{case['statements']}' loaded {', '.join(case['unexpected'])}")
+            failed = True
+        elif args.budget is not None and not case["allowed"] and case["median_ms"] > args.budget:
+            print(f"  '{case['statements']}' took more than {args.budget} ms")
+            failed = True
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to '{args.out}'.")
+    if failed and args.budget is not None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
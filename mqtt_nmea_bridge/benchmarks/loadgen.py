@@ -0,0 +1,381 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+'''
+Synthetic fleet load generator. Simulates N vessels that publish ship states, wind states and
+trajectory horizons at fixed rates, and reports the achieved throughput, the broker acknowledgement
+latency and the CPU time per message.
+
+Run from the root folder, against a broker:
+
+    python -m mqtt_nmea_bridge.benchmarks.loadgen --vessels 50 --duration 30 --qos 1 --broker localhost
+
+or without a broker, against the in-process loopback broker:
+
+    python -m mqtt_nmea_bridge.benchmarks.loadgen --vessels 50 --duration 10 --qos 1 --loopback --subscribe
+'''
+import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge.publishers import ShipStatePublisher, WindStatePublisher, TrajectoryPublisher
+from mqtt_nmea_bridge.subscribers import FleetSubscriber
+from mqtt_nmea_bridge.replay import ReplayScheduler, merge_streams
+from mqtt_nmea_bridge.loopback import LoopbackBroker
+from mqtt_nmea_bridge.metrics import MetricsRegistry
+from mqtt_nmea_bridge import topics
+import paho.mqtt.client as mqtt
+import threading
+import argparse
+import json
+import math
+import time
+
+
+# Centre of the simulated fleet, in degrees
+ORIGIN = (63.4305, 10.3951)
+# Metres per degree of latitude
+_M_PER_DEG = 111320.0
+
+
+class SyntheticVessel:
+    '''
+    Vessel sailing in a circle at constant speed, with slowly varying actuators and wind.
+
+    --------------------------------------------------------------------
+    Parameters:
+        vessel_id (str): The vessel ID.
+        index (int): Index of the vessel in the fleet. Spreads the vessels around the origin.
+        nr_of_actuators (int): Number of actuators of the vessel.
+        radius (float): Radius of the circle in metres.
+        speed (float): Speed over ground in m/s.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, vessel_id, index=0, nr_of_actuators=7, radius=200.0, speed=2.0):
+        self.vessel_id = vessel_id
+        self.nr_of_actuators = nr_of_actuators
+        self.radius = radius
+        self.speed = speed
+        self.phase = 2 * math.pi * ((index * 0.618034) % 1.0)
+        self.centre = (ORIGIN[0] + 0.01 * (index % 32), ORIGIN[1] + 0.02 * (index // 32))
+
+    def ship_state(self, t):
+        angle = self.phase + self.speed / self.radius * t
+        dlat = self.radius * math.sin(angle) / _M_PER_DEG
+        dlon = self.radius * math.cos(angle) / (_M_PER_DEG * math.cos(math.radians(self.centre[0])))
+        # Sailing counter-clockwise, the course is perpendicular to the radius
+        course = (90.0 - math.degrees(angle + math.pi / 2)) % 360.0
+        return mnb.ShipState(time=t,
+                             latitude=self.centre[0] + dlat,
+                             longitude=self.centre[1] + dlon,
+                             heading=course,
+                             cog=course,
+                             sog=self.speed,
+                             nr_of_actuators=self.nr_of_actuators,
+                             actuator_values=[round(math.sin(0.1 * t + i), 4) for i in range(self.nr_of_actuators)])
+
+    def wind_state(self, t):
+        # A wind from about south, in degrees in [-180, 180) like the wire format
+        direction = (10.0 * math.sin(0.01 * t)) % 360.0 - 180.0
+        return mnb.WindState(time=t, speed=5.0 + math.sin(0.05 * t + self.phase), direction=direction)
+
+    def trajectory(self, t, horizon, waypoint_interval):
+        return mnb.Trajectory([self.ship_state(t + i * waypoint_interval) for i in range(horizon)])
+
+
+class AckTracker:
+    '''
+    Measures the time from 'publish' to the 'on_publish' callback of an MQTT client.
+
+    With QoS 1 the callback is run when the PUBACK of the broker arrives, so the latency is the
+    broker round trip. With QoS 0 it is run when the message is written to the socket.
+
+    --------------------------------------------------------------------
+    Parameters:
+        clock (callable): The clock of the latencies.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sent = {}
+        # Acks that arrived before 'sent' was called for their message ID
+        self._early = {}
+        self.latencies = []
+        self.failed = 0
+
+    def attach(self, client):
+        '''
+        Chains the tracker to the 'on_publish' callback of a client.
+        '''
+        previous = client.on_publish
+
+        def on_publish(client, userdata, mid):
+            self.acked(client, mid)
+            if previous is not None:
+                previous(client, userdata, mid)
+
+        client.on_publish = on_publish
+
+    def sent(self, client, info, start):
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            with self._lock:
+                self.failed += 1
+            return
+        key = (id(client), info.mid)
+        with self._lock:
+            acked = self._early.pop(key, None)
+            if acked is None:
+                self._sent[key] = start
+            else:
+                self.latencies.append(acked - start)
+
+    def acked(self, client, mid):
+        now = self._clock()
+        key = (id(client), mid)
+        with self._lock:
+            start = self._sent.pop(key, None)
+            if start is None:
+                self._early[key] = now
+            else:
+                self.latencies.append(now - start)
+
+    @property
+    def outstanding(self):
+        with self._lock:
+            return len(self._sent)
+
+
+def run(n_vessels=10, ship_state_rate=10.0, wind_state_rate=1.0, trajectory_rate=1.0, horizon=100,
+        waypoint_interval=1.0, nr_of_actuators=7, duration=10.0, connections=1, qos=0, broker="localhost",
+        port=1883, username="", password="", client_factory=mqtt.Client, subscribe=False, drain=5.0,
+        verbose=True):
+    '''
+    Runs the load generator and returns the report.
+
+    Each connection has one ship state, one wind state and one trajectory publisher, and the vessels
+    are spread over the connections. Every message is published on the topic of its vessel.
+
+    --------------------------------------------------------------------
+    Input:
+        n_vessels (int): Number of simulated vessels.
+        ship_state_rate (float): Ship states per second and vessel. 0 disables them.
+        wind_state_rate (float): Wind states per second and vessel. 0 disables them.
+        trajectory_rate (float): Trajectories per second and vessel. 0 disables them.
+        horizon (int): Number of waypoints of each trajectory.
+        waypoint_interval (float): Seconds between the waypoints of a trajectory.
+        nr_of_actuators (int): Number of actuators of each vessel.
+        duration (float): Seconds to generate load for.
+        connections (int): Number of client connections per publisher kind.
+        qos (int): The QoS level of the published messages.
+        broker (str): The IP address of the MQTT broker.
+        port (int): The port number of the MQTT broker.
+        username (str): The username of the broker.
+        password (str): The password of the broker.
+        client_factory (callable): Creates the MQTT clients, e.g. 'LoopbackBroker.client'.
+        subscribe (bool): Also run a fleet subscriber and report the delivery latency and loss.
+        drain (float): Maximum seconds to wait for outstanding acknowledgements after the run.
+        verbose (bool): Print the report.
+    Output:
+        report (dict): The configuration and the results.
+    --------------------------------------------------------------------
+    '''
+    registry = MetricsRegistry()
+    tracker = AckTracker()
+    vessels = [SyntheticVessel(f"vessel{i:04d}", i, nr_of_actuators) for i in range(n_vessels)]
+    connections = max(1, min(connections, n_vessels))
+
+    publishers = []
+    for c in range(connections):
+        group = {}
+        for kind, cls in ((topics.SHIP_STATE, ShipStatePublisher), (topics.WIND_STATE, WindStatePublisher),
+                          (topics.TRAJECTORY, TrajectoryPublisher)):
+            group[kind] = cls(f"loadgen-{kind}-{c}", broker, port, metrics=registry, client_factory=client_factory, qos=qos)
+            tracker.attach(group[kind].client)
+        publishers.append(group)
+
+    subscriber = None
+    if subscribe:
+        subscriber = FleetSubscriber("loadgen-subscriber", broker, port, history=1, metrics=registry,
+                                     client_factory=client_factory, qos=qos)
+        subscriber.connect(username, password)
+        subscriber.loop_start()
+
+    all_publishers = [publisher for group in publishers for publisher in group.values()]
+    for publisher in all_publishers:
+        publisher.connect(username, password)
+        publisher.loop_start()
+    _wait_for(lambda: all(p._connected for p in all_publishers) and (subscriber is None or subscriber._connected), 10.0)
+
+    streams = []
+    for i, vessel in enumerate(vessels):
+        group = publishers[i % connections]
+        for kind, rate in ((topics.SHIP_STATE, ship_state_rate), (topics.WIND_STATE, wind_state_rate),
+                           (topics.TRAJECTORY, trajectory_rate)):
+            if rate > 0:
+                # Stagger the vessels so that their messages are not sent in bursts
+                offset = (i / n_vessels) / rate
+                streams.append(_vessel_stream(vessel, kind, group[kind], rate, offset, duration))
+
+    def send(item):
+        publisher, topic, vessel, kind, t = item
+        if kind == topics.SHIP_STATE:
+            message = vessel.ship_state(t)
+        elif kind == topics.WIND_STATE:
+            message = vessel.wind_state(t)
+        else:
+            message = vessel.trajectory(t, horizon, waypoint_interval)
+        start = time.monotonic()
+        info = publisher.publish(message, topic)
+        tracker.sent(publisher.client, info, start)
+        counts[kind] += 1
+
+    counts = {kind: 0 for kind in topics.KINDS}
+    scheduler = ReplayScheduler()
+    cpu_start = time.process_time()
+    stats = scheduler.run(merge_streams(*streams), send)
+    _wait_for(lambda: tracker.outstanding == 0, drain)
+    cpu = time.process_time() - cpu_start
+    if subscriber is not None:
+        _wait_for(lambda: subscriber.latency.count >= sum(counts.values()), drain)
+
+    for publisher in all_publishers:
+        publisher.loop_stop()
+    if subscriber is not None:
+        subscriber.loop_stop()
+        subscriber.client.disconnect()
+
+    sent = sum(counts.values())
+    bytes_sent = sum(child.value for child in registry.get("mnb_bytes_published_total")._children.values())
+    report = {
+        "config": {
+            "vessels": n_vessels, "ship_state_rate": ship_state_rate, "wind_state_rate": wind_state_rate,
+            "trajectory_rate": trajectory_rate, "horizon": horizon, "actuators": nr_of_actuators,
+            "duration": duration, "connections": connections, "qos": qos,
+        },
+        "sent": sent,
+        "sent_by_kind": counts,
+        "elapsed_s": stats.elapsed,
+        "target_rate": stats.target_rate,
+        "rate": stats.rate,
+        "mb_per_s": bytes_sent / stats.elapsed / 1e6 if stats.elapsed > 0 else 0.0,
+        "mean_lateness_s": stats.mean_lateness,
+        "max_lateness_s": stats.max_lateness,
+        "acked": len(tracker.latencies),
+        "unacked": tracker.outstanding,
+        "failed": tracker.failed,
+        "ack_latency_s": _percentiles(tracker.latencies),
+        "cpu_s": cpu,
+        "cpu_us_per_message": cpu / sent * 1e6 if sent > 0 else None,
+    }
+    if subscriber is not None:
+        report["received"] = subscriber.latency.count
+        report["delivery_latency_s"] = {str(q): v for q, v in subscriber.latency.percentiles((50, 90, 99)).items()}
+        report["sequence_gaps"] = subscriber.latency.gaps
+    if verbose:
+        _print_report(report)
+    return report
+
+
+def _vessel_stream(vessel, kind, publisher, rate, offset, duration):
+    topic = topics.resolve_topic(kind, vessel.vessel_id, None)
+    interval = 1.0 / rate
+    n = 0
+    while True:
+        t = offset + n * interval
+        if t >= duration:
+            return
+        yield t, (publisher, topic, vessel, kind, t)
+        n += 1
+
+
+def _wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def _percentiles(values, qs=(50, 90, 99)):
+    if not values:
+        return {**{str(q): None for q in qs}, "max": None}
+    values = sorted(values)
+    n = len(values)
+    # Nearest-rank percentiles, as in 'LatencyTracker'
+    result = {str(q): values[min(n - 1, max(0, math.ceil(q / 100 * n) - 1))] for q in qs}
+    result["max"] = values[-1]
+    return result
+
+
+def _ms(value):
+    return "-" if value is None else f"{value*1e3:.3f} ms"
+
+
+def _print_report(report):
+    print(f"Sent {report['sent']} messages in {report['elapsed_s']:.2f} s "
+          f"({', '.join(f'{kind}: {n}' for kind, n in report['sent_by_kind'].items())})")
+    print(f"Throughput: {report['rate']:.0f} msg/s (target {report['target_rate']:.0f} msg/s), {report['mb_per_s']:.2f} MB/s")
+    print(f"Scheduling lateness: mean {_ms(report['mean_lateness_s'])}, max {_ms(report['max_lateness_s'])}")
+    ack = report["ack_latency_s"]
+    print(f"Ack latency (QoS {report['config']['qos']}): p50 {_ms(ack['50'])}, p90 {_ms(ack['90'])}, "
+          f"p99 {_ms(ack['99'])}, max {_ms(ack['max'])}; {report['acked']} acked, {report['unacked']} unacked, "
+          f"{report['failed']} failed")
+    if report["cpu_us_per_message"] is not None:
+        print(f"CPU: {report['cpu_s']:.2f} s, {report['cpu_us_per_message']:.1f} us per message")
+    if "received" in report:
+        delivery = report["delivery_latency_s"]
+        print(f"Received {report['received']} messages, {report['sequence_gaps']} sequence gaps; delivery latency "
+              f"p50 {_ms(delivery['50'])}, p90 {_ms(delivery['90'])}, p99 {_ms(delivery['99'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic fleet traffic and measure the publish performance.")
+    parser.add_argument("--vessels", type=int, default=10, help="Number of simulated vessels.")
+    parser.add_argument("--ship-state-rate", type=float, default=10.0, help="Ship states per second and vessel.")
+    parser.add_argument("--wind-state-rate", type=float, default=1.0, help="Wind states per second and vessel.")
+    parser.add_argument("--trajectory-rate", type=float, default=1.0, help="Trajectories per second and vessel.")
+    parser.add_argument("--horizon", type=int, default=100, help="Number of waypoints of each trajectory.")
+    parser.add_argument("--waypoint-interval", type=float, default=1.0, help="Seconds between the waypoints of a trajectory.")
+    parser.add_argument("--actuators", type=int, default=7, help="Number of actuators of each vessel.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to generate load for.")
+    parser.add_argument("--connections", type=int, default=1, help="Number of client connections per message kind.")
+    parser.add_argument("--qos", type=int, default=0, choices=[0, 1, 2], help="QoS level of the published messages.")
+    parser.add_argument("--broker", default="localhost", help="The IP address of the MQTT broker.")
+    parser.add_argument("--port", type=int, default=1883, help="The port number of the MQTT broker.")
+    parser.add_argument("--username", default="", help="The username of the broker.")
+    parser.add_argument("--password", default="", help="The password of the broker.")
+    parser.add_argument("--loopback", action="store_true", help="Use the in-process loopback broker instead of a broker.")
+    parser.add_argument("--loopback-latency", type=float, default=0.0, help="Latency of the loopback broker in seconds.")
+    parser.add_argument("--subscribe", action="store_true", help="Also subscribe to the fleet and report the delivery latency.")
+    parser.add_argument("--out", help="Path of a JSON file to write the report to.")
+    args = parser.parse_args()
+
+    loopback = None
+    client_factory = mqtt.Client
+    if args.loopback:
+        loopback = LoopbackBroker(latency=args.loopback_latency)
+        client_factory = loopback.client
+    try:
+        report = run(args.vessels, args.ship_state_rate, args.wind_state_rate, args.trajectory_rate, args.horizon,
+                     args.waypoint_interval, args.actuators, args.duration, args.connections, args.qos, args.broker,
+                     args.port, args.username, args.password, client_factory, args.subscribe)
+    finally:
+        if loopback is not None:
+            loopback.close()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to '{args.out}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+'''
+Soak test harness. Runs a publisher and subscriber pair for each message kind at fixed rates for a
+long time, samples the memory use, the queue depths and the delivery latency, and fails if the
+memory or the p99 latency drifts past the set limits. The published ship states also move the
+receding horizon of a MovingTrajectory over the planned path of the vessel, whose cache of ship
+states is sampled with the other gauges.
+
+Run from the root folder, against the in-process loopback broker:
+
+    python -m mqtt_nmea_bridge.benchmarks.soak --duration 3600 --max-rss-growth-mb 50 --max-p99-ms 20
+
+The exit code is 1 if a limit was exceeded.
+'''
+from mqtt_nmea_bridge.publishers import ShipStatePublisher, WindStatePublisher, TrajectoryPublisher
+from mqtt_nmea_bridge.subscribers import ShipStateSubscriber, WindStateSubscriber, TrajectorySubscriber
+from mqtt_nmea_bridge.benchmarks.loadgen import SyntheticVessel
+from mqtt_nmea_bridge.replay import ReplayScheduler, merge_streams
+from mqtt_nmea_bridge.loopback import LoopbackBroker
+from mqtt_nmea_bridge.metrics import MetricsRegistry
+from mqtt_nmea_bridge.horizon import MovingTrajectory
+from mqtt_nmea_bridge.datasets import Dataset
+from mqtt_nmea_bridge import topics
+from dataclasses import dataclass, field
+import numpy as np
+import tracemalloc
+import threading
+import argparse
+import resource
+import json
+import time
+import sys
+import os
+
+
+_PAIRS = {
+    topics.SHIP_STATE: (ShipStatePublisher, ShipStateSubscriber),
+    topics.WIND_STATE: (WindStatePublisher, WindStateSubscriber),
+    topics.TRAJECTORY: (TrajectoryPublisher, TrajectorySubscriber),
+}
+
+
+@dataclass
+class SoakLimits:
+    '''
+    Limits of a soak run. A limit of None is not checked.
+
+    The growth limits are relative to the baseline, which is the first sample after the warmup.
+
+    --------------------------------------------------------------------
+    Parameters:
+
+    max_rss_growth (int): Growth of the resident set size in bytes
+    max_traced_growth (int): Growth of the memory traced by tracemalloc in bytes
+    max_p99 (float): The p99 delivery latency of each message kind in seconds
+    max_p99_growth (float): The p99 delivery latency relative to the baseline p99, e.g. 2.0 for a doubling
+    max_queue_depth (int): The depth of each subscriber queue
+    max_horizon_cache (int): The number of ship states cached by the moving trajectory
+    --------------------------------------------------------------------
+    '''
+    max_rss_growth: int = 64 * 1024 * 1024
+    max_traced_growth: int = 32 * 1024 * 1024
+    max_p99: float = None
+    max_p99_growth: float = None
+    max_queue_depth: int = None
+    max_horizon_cache: int = None
+
+
+@dataclass
+class SoakSample:
+    '''
+    A sample of a soak run.
+
+    --------------------------------------------------------------------
+    Parameters:
+
+    elapsed (float): Seconds since the start of the run
+    rss (int): Resident set size in bytes
+    traced (int): Memory traced by tracemalloc in bytes, or None if tracemalloc is not used
+    queue_depths (dict): Message kind -> messages in the subscriber queue
+    p99 (dict): Message kind -> p99 delivery latency in seconds, None before any delivery
+    received (dict): Message kind -> messages received since the start
+    horizon_cache (int): Ship states cached by the moving trajectory, or None if it is not run
+    --------------------------------------------------------------------
+    '''
+    elapsed: float
+    rss: int
+    traced: int
+    queue_depths: dict
+    p99: dict
+    received: dict
+    horizon_cache: int = None
+
+
+@dataclass
+class SoakReport:
+    '''
+    The result of a soak run.
+
+    --------------------------------------------------------------------
+    Parameters:
+
+    samples (lst of SoakSample): The samples, oldest first
+    violations (lst of str): Descriptions of the exceeded limits
+    top_allocators (lst of str): The tracemalloc lines with the largest growth since the baseline
+    sent (int): Messages published
+    --------------------------------------------------------------------
+    '''
+    samples: list = field(default_factory=list)
+    violations: list = field(default_factory=list)
+    top_allocators: list = field(default_factory=list)
+    sent: int = 0
+
+    @property
+    def passed(self):
+        return not self.violations
+
+
+def rss_bytes():
+    '''
+    Returns the resident set size of the process in bytes.
+
+    Read from '/proc/self/statm' on Linux. Elsewhere the peak resident set size is returned.
+    '''
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run(duration=60.0, ship_state_rate=50.0, wind_state_rate=10.0, trajectory_rate=1.0, horizon=300,
+        sample_interval=5.0, warmup=10.0, limits=None, queue_maxsize=0, consume=True, trace_malloc=True,
+        top_allocators=10, client_factory=None, broker="localhost", port=1883, username="", password="",
+        verbose=True, moving_trajectory=True):
+    '''
+    Runs a soak test.
+
+    One publisher and subscriber pair is run per message kind, publishing the messages of one
+    synthetic vessel. A consumer thread empties the subscriber queues, unless 'consume' is False,
+    which simulates a stalled consumer. Unless 'moving_trajectory' is False, each published ship
+    state also updates a MovingTrajectory over the planned path of the vessel, with one waypoint
+    per second and a time horizon of 'horizon' seconds, and its trajectory is extracted.
+
+    --------------------------------------------------------------------
+    Input:
+        duration (float): Seconds to run for.
+        ship_state_rate (float): Ship states per second.
+        wind_state_rate (float): Wind states per second.
+        trajectory_rate (float): Trajectories per second.
+        horizon (int): Number of waypoints of each trajectory.
+        sample_interval (float): Seconds between the samples.
+        warmup (float): Seconds before the baseline sample is taken.
+        limits (SoakLimits): The limits. Defaults to 'SoakLimits()'.
+        queue_maxsize (int): Maximum size of the subscriber queues. 0 means unbounded.
+        consume (bool): Empty the subscriber queues.
+        trace_malloc (bool): Trace the allocations with tracemalloc.
+        top_allocators (int): Number of tracemalloc lines in the report.
+        client_factory (callable): Creates the MQTT clients. Defaults to the clients of a new 'LoopbackBroker'.
+        broker (str): The IP address of the MQTT broker, if 'client_factory' is given.
+        port (int): The port number of the MQTT broker.
+        username (str): The username of the broker.
+        password (str): The password of the broker.
+        verbose (bool): Print each sample and the result.
+        moving_trajectory (bool): Run the moving trajectory on the ship states.
+    Output:
+        report (SoakReport): The samples and the exceeded limits.
+    --------------------------------------------------------------------
+    '''
+    limits = limits or SoakLimits()
+    loopback = None
+    if client_factory is None:
+        loopback = LoopbackBroker()
+        client_factory = loopback.client
+    if trace_malloc:
+        tracemalloc.start()
+
+    registry = MetricsRegistry()
+    vessel = SyntheticVessel("soak", nr_of_actuators=7)
+    # Built before the baseline, so only the cache of the horizon counts towards the memory growth
+    moving = None
+    if moving_trajectory and ship_state_rate > 0:
+        moving = MovingTrajectory(_planned_path(vessel, duration + horizon), horizon)
+    pairs = {}
+    for kind, (publisher_cls, subscriber_cls) in _PAIRS.items():
+        subscriber = subscriber_cls(f"soak-{kind}-sub", broker, port, vessel_id=vessel.vessel_id,
+                                    queue_maxsize=queue_maxsize, metrics=registry, client_factory=client_factory)
+        publisher = publisher_cls(f"soak-{kind}-pub", broker, port, vessel_id=vessel.vessel_id, metrics=registry,
+                                  client_factory=client_factory)
+        for client in (subscriber, publisher):
+            client.connect(username, password)
+            client.loop_start()
+        pairs[kind] = (publisher, subscriber)
+    _wait_for(lambda: all(p._connected and s._connected for p, s in pairs.values()), 10.0)
+    # Let the subscriptions reach the broker before publishing
+    time.sleep(0.1)
+
+    report = SoakReport()
+    stop = threading.Event()
+    threads = []
+    if consume:
+        threads.append(threading.Thread(target=_consume, args=([s for _, s in pairs.values()], stop), daemon=True))
+
+    scheduler = ReplayScheduler()
+    streams = [_stream(vessel, kind, rate, duration, horizon) for kind, rate in
+               ((topics.SHIP_STATE, ship_state_rate), (topics.WIND_STATE, wind_state_rate),
+                (topics.TRAJECTORY, trajectory_rate)) if rate > 0]
+
+    def send(item):
+        kind, message = item
+        pairs[kind][0].publish(message)
+        report.sent += 1
+        if moving is not None and kind == topics.SHIP_STATE:
+            moving.update_moving_trajectory(message)
+            # Extracted as a publisher of the horizon would, which fills the cache of ship states
+            moving.trajectory
+
+    def publish():
+        scheduler.run(merge_streams(*streams), send)
+        stop.set()
+
+    threads.append(threading.Thread(target=publish, daemon=True))
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+
+    baseline = None
+    baseline_snapshot = None
+    next_sample = start
+    try:
+        while True:
+            next_sample += sample_interval
+            finished = stop.wait(max(0.0, next_sample - time.monotonic()))
+            sample = _sample(start, pairs, trace_malloc, moving)
+            report.samples.append(sample)
+            if verbose:
+                _print_sample(sample)
+            if baseline is None and sample.elapsed >= warmup:
+                baseline = sample
+                if trace_malloc:
+                    baseline_snapshot = tracemalloc.take_snapshot()
+            elif baseline is not None:
+                report.violations.extend(_check(sample, baseline, limits))
+            if finished or report.violations:
+                break
+    finally:
+        scheduler.stop()
+        stop.set()
+        for thread in threads:
+            thread.join()
+        if trace_malloc:
+            if baseline_snapshot is not None:
+                snapshot = tracemalloc.take_snapshot()
+                stats = sorted(snapshot.compare_to(baseline_snapshot, "lineno"), key=lambda stat: stat.size_diff, reverse=True)
+                report.top_allocators = [str(stat) for stat in stats[:top_allocators]]
+            tracemalloc.stop()
+        for publisher, subscriber in pairs.values():
+            publisher.loop_stop()
+            subscriber.loop_stop()
+            subscriber.client.disconnect()
+        if loopback is not None:
+            loopback.close()
+
+    if baseline is None:
+        report.violations.append(f"The run ended before the warmup of {warmup} s, so no limits were checked.")
+    if verbose:
+        _print_report(report)
+    return report
+
+
+def _stream(vessel, kind, rate, duration, horizon):
+    interval = 1.0 / rate
+    n = 0
+    while n * interval < duration:
+        t = n * interval
+        if kind == topics.SHIP_STATE:
+            yield t, (kind, vessel.ship_state(t))
+        elif kind == topics.WIND_STATE:
+            yield t, (kind, vessel.wind_state(t))
+        else:
+            yield t, (kind, vessel.trajectory(t, horizon, 1.0))
+        n += 1
+
+
+def _planned_path(vessel, duration):
+    # The path of the vessel as a dataset, with one waypoint per second
+    rows = []
+    for t in range(int(duration) + 1):
+        shipstate = vessel.ship_state(float(t))
+        rows.append([shipstate.time, shipstate.latitude, shipstate.longitude, shipstate.heading, shipstate.sog, 0.0, 0.0,
+                     shipstate.cog, shipstate.sog] + shipstate.actuator_values)
+    return Dataset(np.array(rows))
+
+
+def _consume(subscribers, stop):
+    while not stop.is_set():
+        idle = True
+        for subscriber in subscribers:
+            while subscriber.get() != 0:
+                idle = False
+        if idle:
+            time.sleep(0.001)
+
+
+def _sample(start, pairs, trace_malloc, moving=None):
+    return SoakSample(
+        elapsed=time.monotonic() - start,
+        rss=rss_bytes(),
+        traced=tracemalloc.get_traced_memory()[0] if trace_malloc else None,
+        queue_depths={kind: subscriber.queue.qsize() for kind, (_, subscriber) in pairs.items()},
+        p99={kind: subscriber.latency.percentile(99) for kind, (_, subscriber) in pairs.items()},
+        received={kind: subscriber.latency.count for kind, (_, subscriber) in pairs.items()},
+        horizon_cache=None if moving is None else len(moving._shipstates),
+    )
+
+
+def _check(sample, baseline, limits):
+    '''
+    Returns the descriptions of the limits a sample exceeds.
+    '''
+    at = f"at {sample.elapsed:.1f} s"
+    violations = []
+    if limits.max_rss_growth is not None and sample.rss - baseline.rss > limits.max_rss_growth:
+        violations.append(f"RSS grew by {(sample.rss - baseline.rss)/1e6:.1f} MB {at}, "
+                          f"the limit is {limits.max_rss_growth/1e6:.1f} MB.")
+    if (limits.max_traced_growth is not None and sample.traced is not None
+            and sample.traced - baseline.traced > limits.max_traced_growth):
+        violations.append(f"Traced memory grew by {(sample.traced - baseline.traced)/1e6:.1f} MB {at}, "
+                          f"the limit is {limits.max_traced_growth/1e6:.1f} MB.")
+    for kind, p99 in sample.p99.items():
+        if p99 is None:
+            continue
+        if limits.max_p99 is not None and p99 > limits.max_p99:
+            violations.append(f"The {kind} p99 latency is {p99*1e3:.2f} ms {at}, the limit is {limits.max_p99*1e3:.2f} ms.")
+        base = baseline.p99.get(kind)
+        if limits.max_p99_growth is not None and base and p99 > base * limits.max_p99_growth:
+            violations.append(f"The {kind} p99 latency grew from {base*1e3:.2f} ms to {p99*1e3:.2f} ms {at}, "
+                              f"the limit is x{limits.max_p99_growth}.")
+    if limits.max_queue_depth is not None:
+        for kind, depth in sample.queue_depths.items():
+            if depth > limits.max_queue_depth:
+                violations.append(f"The {kind} queue holds {depth} messages {at}, the limit is {limits.max_queue_depth}.")
+    if (limits.max_horizon_cache is not None and sample.horizon_cache is not None
+            and sample.horizon_cache > limits.max_horizon_cache):
+        violations.append(f"The moving trajectory caches {sample.horizon_cache} ship states {at}, "
+                          f"the limit is {limits.max_horizon_cache}.")
+    return violations
+
+
+def _wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def _print_sample(sample):
+    traced = "-" if sample.traced is None else f"{sample.traced/1e6:.1f} MB"
+    p99 = ", ".join(f"{kind} {'-' if v is None else f'{v*1e3:.2f} ms'}" for kind, v in sample.p99.items())
+    horizon = "" if sample.horizon_cache is None else f"  horizon cache {sample.horizon_cache}"
+    print(f"{sample.elapsed:8.1f} s  RSS {sample.rss/1e6:7.1f} MB  traced {traced}  "
+          f"queues {sample.queue_depths}  p99 {p99}{horizon}")
+
+
+def _print_report(report):
+    print(f"Published {report.sent} messages in {report.samples[-1].elapsed if report.samples else 0:.1f} s.")
+    if report.top_allocators:
+        print("Largest allocation growth since the baseline:")
+        for line in report.top_allocators:
+            print(f"  {line}")
+    if report.passed:
+        print("PASSED")
+    else:
+        print("FAILED")
+        for violation in report.violations:
+            print(f"  {violation}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test the publishers and subscribers against memory and latency limits.")
+    parser.add_argument("--duration", type=float, default=600.0, help="Seconds to run for.")
+    parser.add_argument("--ship-state-rate", type=float, default=50.0, help="Ship states per second.")
+    parser.add_argument("--wind-state-rate", type=float, default=10.0, help="Wind states per second.")
+    parser.add_argument("--trajectory-rate", type=float, default=1.0, help="Trajectories per second.")
+    parser.add_argument("--horizon", type=int, default=300, help="Number of waypoints of each trajectory.")
+    parser.add_argument("--sample-interval", type=float, default=5.0, help="Seconds between the samples.")
+    parser.add_argument("--warmup", type=float, default=10.0, help="Seconds before the baseline sample.")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=64.0, help="Limit of the RSS growth in MB.")
+    parser.add_argument("--max-traced-growth-mb", type=float, default=32.0, help="Limit of the traced memory growth in MB.")
+    parser.add_argument("--max-p99-ms", type=float, help="Limit of the p99 latency in ms.")
+    parser.add_argument("--max-p99-growth", type=float, help="Limit of the p99 latency relative to the baseline.")
+    parser.add_argument("--max-queue-depth", type=int, help="Limit of the subscriber queue depths.")
+    parser.add_argument("--max-horizon-cache", type=int, help="Limit of the ship states cached by the moving trajectory.")
+    parser.add_argument("--queue-maxsize", type=int, default=0, help="Maximum size of the subscriber queues.")
+    parser.add_argument("--no-consume", action="store_true", help="Do not empty the subscriber queues.")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="Do not trace the allocations.")
+    parser.add_argument("--no-moving-trajectory", action="store_true", help="Do not run the moving trajectory.")
+    parser.add_argument("--out", help="Path of a JSON file to write the samples and the result to.")
+    args = parser.parse_args()
+
+    limits = SoakLimits(max_rss_growth=args.max_rss_growth_mb * 1e6,
+                        max_traced_growth=args.max_traced_growth_mb * 1e6,
+                        max_p99=args.max_p99_ms / 1e3 if args.max_p99_ms is not None else None,
+                        max_p99_growth=args.max_p99_growth,
+                        max_queue_depth=args.max_queue_depth,
+                        max_horizon_cache=args.max_horizon_cache)
+    report = run(args.duration, args.ship_state_rate, args.wind_state_rate, args.trajectory_rate, args.horizon,
+                 args.sample_interval, args.warmup, limits, args.queue_maxsize, not args.no_consume,
+                 not args.no_tracemalloc, moving_trajectory=not args.no_moving_trajectory)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"passed": report.passed, "violations": report.violations, "sent": report.sent,
+                       "top_allocators": report.top_allocators,
+                       "samples": [sample.__dict__ for sample in report.samples]}, f, indent=2)
+    sys.exit(0 if report.passed else 1)
+
+
+if __name__ == "__main__":
+    main()
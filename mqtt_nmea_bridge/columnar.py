@@ -0,0 +1,242 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+'''
+Columnar on-disk format for datasets on the 'timestamp, X, CS, U' layout.
+
+A dataset is a folder with one file of little-endian float64 values per field, 'time.f64', 'X.f64',
+'CS.f64' and 'U.f64', each holding a fixed number of values per row, and a 'meta.json' file with
+the number of rows and the width of each field. The files are memory-mapped by the reader, and a
+time range is found by binary search on the time column, so only the pages of the window and the
+O(log n) pages visited by the search are read from disk.
+
+Convert a CSV file from the root folder:
+
+    python -m mqtt_nmea_bridge.columnar example_data/example_docking_trajectory.csv docking.mnbcol
+'''
+from mqtt_nmea_bridge.datasets import Dataset, read_blocks
+import numpy as np
+import argparse
+import json
+import os
+
+
+FORMAT_VERSION = 1
+FIELDS = ("time", "X", "CS", "U")
+_DTYPE = np.dtype("<f8")
+
+
+class ColumnarWriter:
+    '''
+    Writes a dataset to the columnar format, one block of rows at a time.
+
+    The rows must be appended in time order. The metadata file is written by 'close', so a folder
+    without it is an incomplete conversion.
+
+    --------------------------------------------------------------------
+    Parameters:
+        path (str): The folder of the dataset. Created if it does not exist.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta = os.path.join(path, "meta.json")
+        if os.path.exists(meta):
+            os.remove(meta)
+        self._files = {field: open(os.path.join(path, f"{field}.f64"), "wb") for field in FIELDS}
+        self._widths = None
+        self._last_time = -np.inf
+        self.rows = 0
+
+    def append(self, dataset):
+        '''
+        Appends the rows of a Dataset.
+        '''
+        if len(dataset) == 0:
+            return
+        widths = {"time": 1, "X": dataset.X.shape[1], "CS": dataset.CS.shape[1], "U": dataset.U.shape[1]}
+        if self._widths is None:
+            self._widths = widths
+        elif widths != self._widths:
+            raise ValueError(f"Expected fields of widths {self._widths}, got {widths}.")
+        time = dataset.time
+        if time[0] < self._last_time or np.any(np.diff(time) < 0):
+            raise ValueError("The rows must be appended in time order.")
+        self._last_time = time[-1]
+        for field in FIELDS:
+            np.ascontiguousarray(getattr(dataset, field), dtype=_DTYPE).tofile(self._files[field])
+        self.rows += len(dataset)
+
+    def close(self, complete=True):
+        '''
+        Closes the field files and writes the metadata file, or leaves the folder incomplete without
+        it if 'complete' is False.
+        '''
+        if self._files is None:
+            return
+        for f in self._files.values():
+            f.close()
+        self._files = None
+        if not complete:
+            return
+        meta = {"version": FORMAT_VERSION, "rows": self.rows,
+                "widths": self._widths or {"time": 1, "X": 6, "CS": 2, "U": 7}}
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # A conversion that failed partway must not look complete
+        self.close(complete=exc_type is None)
+
+
+class ColumnarDataset:
+    '''
+    Memory-mapped reader of a dataset in the columnar format.
+
+    The fields are read-only memory-mapped arrays. 'window' and 'between' return a Dataset holding
+    a copy of the rows of a time range only.
+
+    --------------------------------------------------------------------
+    Parameters:
+        path (str): The folder of the dataset.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar format version {meta.get('version')} in '{path}'.")
+        self.rows = meta["rows"]
+        self.widths = meta["widths"]
+        self._fields = {}
+        for field in FIELDS:
+            shape = (self.rows,) if field == "time" else (self.rows, self.widths[field])
+            if self.rows == 0:
+                self._fields[field] = np.empty(shape, dtype=_DTYPE)
+            else:
+                self._fields[field] = np.memmap(os.path.join(path, f"{field}.f64"), dtype=_DTYPE, mode="r", shape=shape)
+
+    @property
+    def time(self):
+        return self._fields["time"]
+
+    @property
+    def X(self):
+        return self._fields["X"]
+
+    @property
+    def CS(self):
+        return self._fields["CS"]
+
+    @property
+    def U(self):
+        return self._fields["U"]
+
+    @property
+    def nr_of_actuators(self):
+        return self.widths["U"]
+
+    @property
+    def start_time(self):
+        return float(self.time[0]) if self.rows else None
+
+    @property
+    def end_time(self):
+        return float(self.time[-1]) if self.rows else None
+
+    def __len__(self):
+        return self.rows
+
+    def index(self, timestamp, side="left"):
+        '''
+        Returns the index of the first row at or after a timestamp, or after it if 'side' is 'right'.
+        '''
+        return int(np.searchsorted(self.time, timestamp, side=side))
+
+    def between(self, start, end):
+        '''
+        Returns the rows from 'start' up to, but not including, 'end' as a Dataset.
+        '''
+        return self.rows_slice(self.index(start), self.index(end))
+
+    def window(self, start, duration):
+        '''
+        Returns the rows from 'start' up to, but not including, 'start + duration' as a Dataset.
+        '''
+        return self.between(start, start + duration)
+
+    def rows_slice(self, first, last):
+        '''
+        Returns the rows with indices from 'first' up to, but not including, 'last' as a Dataset.
+        '''
+        return Dataset(np.column_stack([self.time[first:last]] + [self._fields[field][first:last] for field in FIELDS[1:]]))
+
+    def blocks(self, block_size=4096, start=None, end=None):
+        '''
+        Iterates over the rows of a time range in Datasets of at most 'block_size' rows.
+        '''
+        first = 0 if start is None else self.index(start)
+        last = self.rows if end is None else self.index(end)
+        for i in range(first, last, block_size):
+            yield self.rows_slice(i, min(i + block_size, last))
+
+    def to_dataset(self):
+        return self.rows_slice(0, self.rows)
+
+
+def write_columnar(path, dataset):
+    '''
+    Writes a Dataset to the columnar format.
+    '''
+    with ColumnarWriter(path) as writer:
+        writer.append(dataset)
+
+
+def convert_dataset(csv_path, path, block_size=65536):
+    '''
+    Converts a dataset CSV file to the columnar format.
+
+    --------------------------------------------------------------------
+    Input:
+        csv_path (str): Path to the CSV file.
+        path (str): The folder of the columnar dataset.
+        block_size (int): Number of rows written at a time.
+    Output:
+        dataset (ColumnarDataset): The converted dataset.
+    --------------------------------------------------------------------
+    '''
+    # Streamed in blocks, so files larger than the memory can be converted
+    with ColumnarWriter(path) as writer:
+        for block in read_blocks(csv_path, block_size):
+            writer.append(block)
+    return ColumnarDataset(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a dataset CSV file to the columnar format.")
+    parser.add_argument("csv_path", help="Path to the CSV file.")
+    parser.add_argument("path", help="The folder of the columnar dataset.")
+    args = parser.parse_args()
+    dataset = convert_dataset(args.csv_path, args.path)
+    print(f"Converted {len(dataset)} rows from {dataset.start_time} s to {dataset.end_time} s.")
+
+
+if __name__ == "__main__":
+    main()
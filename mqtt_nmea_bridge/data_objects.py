@@ -13,7 +13,7 @@
 #
 # --------------------------------------------------------------------------------
 #
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 @dataclass
@@ -27,9 +27,11 @@ class Trajectory:
     Parameters:
 
     shipstates: list of ShipState objects
+    header (dict): Transport header of a received message, see 'tracing.make_header'. None if not available.
     --------------------------------------------------------------------
     '''
     shipstates: list
+    header: dict = field(default=None, compare=False, repr=False)
 
     def __post_init__(self):
         self._nr_of_waypoints: int = len(self.shipstates)
@@ -56,6 +58,7 @@ class ShipState:
     sog (float): Speed Over Ground in radians n m/s
     actuator_values (lst of floats / lst of lsts of floats): On the format [a1, a2, ...]
     nr_of_actuators (int)
+    header (dict): Transport header of a received message, see 'tracing.make_header'. None if not available.
     --------------------------------------------------------------------
     '''
     time: float
@@ -66,6 +69,7 @@ class ShipState:
     sog: float
     nr_of_actuators: int
     actuator_values: list
+    header: dict = field(default=None, compare=False, repr=False)
 
 
 @dataclass
@@ -78,9 +82,11 @@ class WindState:
 
     time: (float) In UTC seconds since 1970-01-01 00:00:00
     speed: (float) In m/s
-    direction: (float) In radians from north (0) to east (pi/2) to south (pi or -pi) to west (-pi/2)
+    direction: (float) In degrees from north (0) to east (90) to south (180 or -180) to west (-90)
+    header: (dict) Transport header of a received message, see 'tracing.make_header'. None if not available.
     --------------------------------------------------------------------
     '''
     time: float
     speed: float
-    direction: float
\ No newline at end of file
+    direction: float
+    header: dict = field(default=None, compare=False, repr=False)
\ No newline at end of file
@@ -0,0 +1,270 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+import mqtt_nmea_bridge as mnb
+import numpy as np
+import itertools
+import tempfile
+import os
+
+
+# Column layout of the 'timestamp, X, CS, U' datasets in 'example_data'
+TIME = 0
+X = slice(1, 7)
+CS = slice(7, 9)
+U = slice(9, None)
+_FIXED_COLUMNS = 9
+
+# Bump when the parsing or the cache layout changes, to invalidate existing caches
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".cache.npz"
+
+# Removes the quotes and brackets around the vector columns, and joins the lines with commas
+_STRIP_TABLE = str.maketrans({'"': None, "[": None, "]": None, "\r": None, "\n": ","})
+
+
+class Dataset:
+    '''
+    A dataset on the 'timestamp, X, CS, U' layout, held as one NumPy array with one row per data point.
+
+    X = [latitude, longitude, heading, surge_velocity, sway_velocity, yaw_rate]
+    CS = [course_over_ground, speed_over_ground]
+    U = [actuator_1, actuator_2, ...]
+
+    The fields are views of the array, so slicing a dataset does not copy the data.
+
+    --------------------------------------------------------------------
+    Parameters:
+        data (np.ndarray): Array of shape (n, 9 + nr_of_actuators).
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, data):
+        data = np.asarray(data, dtype=np.float64)
+        if data.ndim != 2 or data.shape[1] < _FIXED_COLUMNS:
+            raise ValueError(f"Expected an array of shape (n, {_FIXED_COLUMNS} + nr_of_actuators), got {data.shape}.")
+        self.data = data
+
+    @property
+    def time(self):
+        return self.data[:, TIME]
+
+    @property
+    def X(self):
+        return self.data[:, X]
+
+    @property
+    def CS(self):
+        return self.data[:, CS]
+
+    @property
+    def U(self):
+        return self.data[:, U]
+
+    @property
+    def nr_of_actuators(self):
+        return self.data.shape[1] - _FIXED_COLUMNS
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, index):
+        '''
+        Returns the data point at an integer index on the format [time, X, CS, U], or a Dataset for a slice or mask.
+        '''
+        if isinstance(index, (int, np.integer)):
+            row = self.data[index].tolist()
+            return [row[TIME], row[X], row[CS], row[U]]
+        return Dataset(self.data[index])
+
+    def __iter__(self):
+        for row in self.data.tolist():
+            yield [row[TIME], row[X], row[CS], row[U]]
+
+    def to_list(self):
+        '''
+        Returns the dataset as a list of data points on the format [time, X, CS, U], like the
+        loaders of the examples.
+        '''
+        return list(self)
+
+    def shipstate(self, index, nr_of_actuators=None):
+        '''
+        Returns the data point at an index as a ShipState.
+        '''
+        row = self.data[index].tolist()
+        return mnb.ShipState(time=row[TIME],
+                             latitude=row[1],
+                             longitude=row[2],
+                             heading=row[3],
+                             cog=row[7],
+                             sog=row[8],
+                             nr_of_actuators=self.nr_of_actuators if nr_of_actuators is None else nr_of_actuators,
+                             actuator_values=row[U])
+
+
+def parse_dataset(text):
+    '''
+    Parses the text of a dataset CSV file, including the header line.
+
+    The quotes and brackets are removed with one 'str.translate' over the whole text, and the
+    numbers are parsed in one call to NumPy, instead of field by field.
+
+    --------------------------------------------------------------------
+    Input:
+        text (str): The contents of the CSV file.
+    Output:
+        dataset (Dataset): The dataset.
+    --------------------------------------------------------------------
+    '''
+    _, _, body = text.partition("\n")
+    return Dataset(_parse_rows(body.strip()))
+
+
+def read_blocks(path, block_size=4096):
+    '''
+    Streams a dataset CSV file in blocks of rows, so that memory use does not depend on the file size.
+
+    Only 'block_size' lines are read and parsed at a time, so the first block is available after
+    parsing 'block_size' lines, whatever the size of the file.
+
+    --------------------------------------------------------------------
+    Input:
+        path (str): Path to the CSV file.
+        block_size (int): Maximum number of rows per block.
+    Output:
+        blocks (iterator of Dataset): The blocks, in file order.
+    --------------------------------------------------------------------
+    '''
+    with open(path, "r") as f:
+        # Skip the header
+        f.readline()
+        while True:
+            lines = [line for line in itertools.islice(f, block_size) if not line.isspace()]
+            if not lines:
+                return
+            yield Dataset(_parse_rows("".join(lines).strip()))
+
+
+def read_data_points(path, block_size=4096):
+    '''
+    Streams the data points of a dataset CSV file, parsed in blocks of 'block_size' rows.
+
+    --------------------------------------------------------------------
+    Input:
+        path (str): Path to the CSV file.
+        block_size (int): Number of rows parsed at a time.
+    Output:
+        data_points (iterator of lsts): Data points on the format [time, X, CS, U].
+    --------------------------------------------------------------------
+    '''
+    for block in read_blocks(path, block_size):
+        yield from block
+
+
+def data_point_to_shipstate(data_point, nr_of_actuators=None):
+    '''
+    Converts a data point on the format [time, X, CS, U] to a ShipState.
+
+    --------------------------------------------------------------------
+    Input:
+        data_point (lst): The data point.
+        nr_of_actuators (int): Number of actuators of the vessel. Defaults to the length of U.
+    Output:
+        shipstate (ShipState): The ship state.
+    --------------------------------------------------------------------
+    '''
+    return mnb.ShipState(time=data_point[0],
+                         latitude=data_point[1][0],
+                         longitude=data_point[1][1],
+                         heading=data_point[1][2],
+                         cog=data_point[2][0],
+                         sog=data_point[2][1],
+                         nr_of_actuators=len(data_point[3]) if nr_of_actuators is None else nr_of_actuators,
+                         actuator_values=list(data_point[3]))
+
+
+def load_dataset(path, cache=True):
+    '''
+    Loads a dataset from a CSV file on the 'timestamp, X, CS, U' layout of the files in 'example_data'.
+
+    With 'cache', the parsed array is stored in a binary sidecar file next to the CSV file, named
+    '<path>.cache.npz', and later loads read the sidecar instead of parsing the CSV file. The
+    sidecar is ignored and rewritten if the modification time or the size of the CSV file has
+    changed. If the sidecar can not be written, e.g. in a read-only folder, the dataset is still returned.
+
+    --------------------------------------------------------------------
+    Input:
+        path (str): Path to the CSV file.
+        cache (bool): Read and write the sidecar file.
+    Output:
+        dataset (Dataset): The dataset.
+    --------------------------------------------------------------------
+    '''
+    stat = os.stat(path)
+    signature = np.array([CACHE_VERSION, stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+    sidecar = path + CACHE_SUFFIX
+    if cache:
+        data = _read_cache(sidecar, signature)
+        if data is not None:
+            return Dataset(data)
+
+    with open(path, "r") as f:
+        dataset = parse_dataset(f.read())
+
+    if cache:
+        _write_cache(sidecar, signature, dataset.data)
+    return dataset
+
+
+def _parse_rows(body):
+    '''
+    Parses the data lines of a dataset CSV file, without the header, to an array with one row per line.
+    '''
+    if not body:
+        return np.empty((0, _FIXED_COLUMNS + 7))
+    first_line = body.partition("\n")[0].translate(_STRIP_TABLE)
+    n_columns = first_line.count(",") + 1
+    n_rows = body.count("\n") + 1
+    values = np.fromstring(body.translate(_STRIP_TABLE), dtype=np.float64, sep=",")
+    if values.size != n_rows * n_columns:
+        raise ValueError(f"Expected {n_rows} rows of {n_columns} values, got {values.size} values. "
+                         "The rows must have the same number of actuators and no empty lines.")
+    return values.reshape(n_rows, n_columns)
+
+
+def _read_cache(sidecar, signature):
+    try:
+        with np.load(sidecar, allow_pickle=False) as cached:
+            if np.array_equal(cached["signature"], signature):
+                return cached["data"]
+    except (OSError, KeyError, ValueError):
+        pass
+    return None
+
+
+def _write_cache(sidecar, signature, data):
+    # Written to a temporary file and renamed, so a concurrent reader never sees a partial sidecar
+    folder = os.path.dirname(os.path.abspath(sidecar))
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, signature=signature, data=data)
+        os.replace(tmp_path, sidecar)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,75 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+
+from utils import *
+from mqtt_nmea_bridge.replay import ship_state_source, wind_state_source, trajectory_source, data_point_source
+import mqtt_nmea_bridge as mnb
+import math
+
+
+def multi_stream_replay(sim_speed=10, time_horizon=300, publish_interval=30, wind_interval=1.0, data_path="example_data/example_docking_trajectory.csv"):
+    '''
+    Replays the ship state, a wind series and the moving trajectory horizons of a dataset at the same time,
+    interleaved by their timestamps.
+
+    The ship states are streamed from the CSV file, and the wind series is generated on the fly,
+    so only the trajectory dataset is loaded into memory.
+
+    --------------------------------------------------------------------
+    In:
+        sim_speed (float): The speed of the simulation. 1.0 is real-time.
+        time_horizon (float): The time horizon (in seconds) for the predicted trajectory.
+        publish_interval (float): The interval at which the trajectory is published.
+        wind_interval (float): The interval between each wind state.
+        data_path (str): The path to the dataset.
+    --------------------------------------------------------------------
+    '''
+    ip = "localhost"
+    port = 1883
+    ship_state_pub = mnb.ShipStatePublisher("ship_state_pub", ip, port)
+    wind_state_pub = mnb.WindStatePublisher("wind_state_pub", ip, port)
+    trajectory_pub = mnb.TrajectoryPublisher("trajectory_pub", ip, port)
+
+    dataset = load_dataset(data_path)
+    moving_trajectory = mnb.MovingTrajectory(dataset, time_horizon)
+
+    def wind_states():
+        # A slowly veering wind with gusts, covering the same time span as the dataset
+        t = dataset[0][0]
+        while t <= dataset[-1][0]:
+            yield mnb.WindState(time=t, speed=5.0 + 2.0*math.sin(t/7.0), direction=-115.0 + 6.0*math.sin(t/300.0))
+            t += wind_interval
+
+    streams = [
+        (ship_state_source(data_path), ship_state_pub),
+        (wind_state_source(wind_states()), wind_state_pub),
+        (trajectory_source(moving_trajectory, data_point_source(data_path), publish_interval), trajectory_pub),
+    ]
+
+    for publisher, client_id in [(ship_state_pub, "ship_state_pub"), (wind_state_pub, "wind_state_pub"), (trajectory_pub, "trajectory_pub")]:
+        publisher.connect(client_id, "password")
+        publisher.loop_start()
+
+    print("Replaying ship state, wind state and trajectory from dataset...")
+    stats = mnb.replay_streams(streams, mnb.ReplayScheduler(sim_speed=sim_speed))
+    print(f"Published {stats.sent} messages at {stats.rate:.1f} msg/s, jitter {stats.jitter*1e3:.3f} ms.")
+
+    for publisher in [ship_state_pub, wind_state_pub, trajectory_pub]:
+        publisher.loop_stop()
+
+
+if __name__ == "__main__":
+    multi_stream_replay()
@@ -14,8 +14,7 @@
 # --------------------------------------------------------------------------------
 #
 import mqtt_nmea_bridge as mnb
-import numpy as np
-import time
+from mqtt_nmea_bridge.datasets import read_data_points
 
 
 def ship_state_from_dset_publisher_ex(interval=0.5, simulation_speed=1, data_path = "example_data/example_docking_trajectory.csv"):
@@ -49,8 +48,8 @@ def ship_state_from_dset_publisher_ex(interval=0.5, simulation_speed=1, data_pat
     port = 1883
     ship_state_pub = mnb.ShipStatePublisher(client_id, ip, port)
 
-    # Load the dataset
-    dataset = load_dataset(data_path)
+    # Stream the dataset, so publishing starts at once whatever the size of the file
+    data_points = read_data_points(data_path)
 
     print("Publishing ship state from dataset...")
 
@@ -58,60 +57,32 @@ def ship_state_from_dset_publisher_ex(interval=0.5, simulation_speed=1, data_pat
     ship_state_pub.connect(client_id, "password")
     ship_state_pub.loop_start()
 
-    t = 0
-    for data_point in dataset:
-        # Publish the ship state
-        shipState = mnb.ShipState(time=data_point[0],
-                                  latitude=data_point[1][0],
-                                  longitude=data_point[1][1],
-                                  heading=data_point[1][2],
-                                  cog=data_point[2][0],
-                                  sog=data_point[2][1],
-                                  nr_of_actuators=7,
-                                  actuator_values=[float(data_point[3][0]), float(data_point[3][1]), float(data_point[3][2]), float(data_point[3][3]), float(data_point[3][4]), float(data_point[3][5]), float(data_point[3][6])]
-                                  )
-        ship_state_pub.publish(shipState)
-        # Wait for the next data point
-        time.sleep(interval/simulation_speed)
-        t += interval
-
-
-def load_dataset(path):
-    '''
-    Loads a dataset from a CSV file.
-
-    Columns:
-    - timestamp: Time in seconds since the start of the trajectory
-    - X: Ship state vector
-    - CS: Course over ground and speed over ground
-    - U: Actuator values vector given in percentages of maximum actuator value
-
-    --------------------------------------------------------------------
-    In:
-        path (str): Path to the CSV file.
-    Out:
-        dataset (lst of lsts of floats): The dataset.
-    --------------------------------------------------------------------
-    '''
-    dataset = []
-    # Read the first line
-    with open(path, "r") as f:
-        line = f.readline()
-        line = line.strip()
-        line = line.split(",")
-        # Read the rest of the lines
-        for line in f:
-            line = line.strip()
-            line = line.split(",")
-            time = float(line[0])
-            X = [float(x.replace("\"", "").replace("[", "").replace("]", "")) for x in line[1:7]]
-            COG = float(line[7].replace("\"", "").replace("[", "").replace("]", ""))
-            SOG = float(line[8].replace("\"", "").replace("[", "").replace("]", ""))
-            CS = [COG, SOG]
-            U = [float(u.replace("\"", "").replace("[", "").replace("]", "")) for u in line[9:]]
-            dataline = [time, X, CS, U]
-            dataset.append(dataline)
-    return dataset
+    def ship_states():
+        next_time = None
+        for data_point in data_points:
+            if next_time is None:
+                next_time = data_point[0]
+            # Skip data points until 'interval' seconds have passed in the dataset
+            if data_point[0] < next_time:
+                continue
+            next_time = data_point[0] + interval
+            shipState = mnb.ShipState(time=data_point[0],
+                                      latitude=data_point[1][0],
+                                      longitude=data_point[1][1],
+                                      heading=data_point[1][2],
+                                      cog=data_point[2][0],
+                                      sog=data_point[2][1],
+                                      nr_of_actuators=7,
+                                      actuator_values=[float(u) for u in data_point[3]]
+                                      )
+            yield data_point[0], shipState
+
+    # Publish each ship state at its timestamp in the dataset, scaled by the simulation speed
+    scheduler = mnb.ReplayScheduler(sim_speed=simulation_speed)
+    stats = scheduler.run(ship_states(), ship_state_pub.publish)
+    print(f"Published {stats.sent} ship states at {stats.rate:.1f} msg/s (target {stats.target_rate:.1f} msg/s), "
+          f"jitter {stats.jitter*1e3:.3f} ms, max lateness {stats.max_lateness*1e3:.3f} ms.")
+    ship_state_pub.loop_stop()
 
 
 def main():
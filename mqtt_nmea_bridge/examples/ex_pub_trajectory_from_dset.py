@@ -16,6 +16,7 @@
 
 from utils import *
 import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge import datasets, resample
 import time
 
 def trajectory_from_dset_publisher(interval, remove_uneventful_points, percnt_U_change, data_path = "example_data/example_docking_trajectory.csv"):
@@ -46,17 +47,18 @@ def trajectory_from_dset_publisher(interval, remove_uneventful_points, percnt_U_
     trajectory_pub = mnb.TrajectoryPublisher(client_id, ip, port)
 
     # Load the dataset
-    dataset = load_dataset(data_path, remove_uneventful_points, percnt_U_change)
+    dataset = datasets.load_dataset(data_path)
 
     # Find the time interval between each waypoint
-    dataset_interval = dataset[1][0] - dataset[0][0] # The time interval between each waypoint in the dataset
+    dataset_interval = dataset.time[1] - dataset.time[0] # The time interval between each waypoint in the dataset
 
-    # If the interval is larger than the dataset interval, downsample the dataset
+    # If the interval is larger than the dataset interval, resample the dataset onto a grid with a step of 'interval'
+    # The headings are interpolated along the shortest turn, and the actuator values are held from the last waypoint
     if interval > dataset_interval:
-        n = int(interval / dataset_interval)
-        dataset = [dataset[i] for i in range(0, len(dataset), n)]
+        dataset = resample.resample_dataset(dataset, interval)
     else:
         interval = dataset_interval
+    dataset = dataset.to_list()
     
     # Remove the 'uneventful' data points
     if remove_uneventful_points:
@@ -16,10 +16,10 @@
 
 from utils import *
 import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge import geo
 import time
 import copy
 import numpy as np
-import matplotlib.pyplot as plt
 
 def trajectory_from_dset_subscriber(visualize=False):
     '''
@@ -34,6 +34,8 @@ def trajectory_from_dset_subscriber(visualize=False):
     trajectory = 0
 
     if visualize:
+        # Only imported when plotting, since matplotlib is slow to import
+        import matplotlib.pyplot as plt
         plt.ion()
         size = [6010, 5560]
         origin = [5680540.00, 586485.00]
@@ -61,11 +63,9 @@ def trajectory_from_dset_subscriber(visualize=False):
         if trajectory is not None and trajectory != 0:
             print(f"Received trajectory with {len(trajectory.shipstates)} ship states.")
             if visualize:
-                latitudes = [shipstate.latitude for shipstate in trajectory.shipstates]
-                longitudes = [shipstate.longitude for shipstate in trajectory.shipstates]
-                utm_coordinates = [latlon_to_UTM(lat, lon) for lat, lon in zip(latitudes, longitudes)]
-                ned_coordinates = UTM_to_NED(utm_coordinates, origin)
-                ax.scatter([coord[1] for coord in ned_coordinates], [coord[0] for coord in ned_coordinates], color='b', s=5)
+                # All waypoints are transformed in one call
+                ned_coordinates = geo.trajectory_to_ned(trajectory, origin, crs="EPSG:32631")
+                ax.scatter(ned_coordinates[:, 1], ned_coordinates[:, 0], color='b', s=5)
                 plt.pause(0.1)
 
     
@@ -15,6 +15,7 @@
 #
 from utils import *
 import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge import geo
 import matplotlib.pyplot as plt
 import numpy as np
 import time
@@ -35,27 +36,20 @@ def trajectory_subscriber_ex():
         if trajectory is not None and trajectory != 0:
             break
     
-    # Extract the latitudes and longitudes from the trajectory
-    latitudes = [shipstate.latitude for shipstate in trajectory.shipstates]
-    longitudes = [shipstate.longitude for shipstate in trajectory.shipstates]
-
-    # Convert the lat/lon to UTM coordinates
-    utm_coordinates = [latlon_to_UTM(lat, lon) for lat, lon in zip(latitudes, longitudes)]
-
-    # Convert UTM to NED coordinates
-    origin = [586485.00, 5680540.00]
-    ned_coordinates = UTM_to_NED(utm_coordinates, origin)
+    # Convert the lat/lon of the waypoints to NED coordinates, through UTM zone 31
+    origin = [5680540.00, 586485.00]
+    ned_coordinates = geo.trajectory_to_ned(trajectory, origin, crs="EPSG:32631")
 
     plot_type = "line"
     if plot_type != "none":
         if plot_type == "line":
-            plt.plot([coord[0] for coord in ned_coordinates], [coord[1] for coord in ned_coordinates])
+            plt.plot(ned_coordinates[:, 1], ned_coordinates[:, 0])
             plt.xlabel("Y [NED] (m)")
             plt.ylabel("X [NED] (m)")
             plt.title("Trajectory", fontsize=24, fontname='Times New Roman')
         elif plot_type == "points":
             # Plot the trajectory as individual points
-            plt.scatter([coord[0] for coord in ned_coordinates], [coord[1] for coord in ned_coordinates])
+            plt.scatter(ned_coordinates[:, 1], ned_coordinates[:, 0])
             plt.xlabel("Y [NED] (m)", fontsize=18, fontname='Times New Roman')
             plt.ylabel("X [NED] (m)", fontsize=18, fontname='Times New Roman')
             plt.title("Trajectory", fontsize=24, fontname='Times New Roman')
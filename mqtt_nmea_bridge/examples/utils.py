@@ -14,7 +14,8 @@
 # --------------------------------------------------------------------------------
 #
 
-from pyproj import Transformer
+from mqtt_nmea_bridge import datasets, geo, simplify
+import numpy as np
 
 
 def load_dataset(path, optimize=True, percentage=0.1):
@@ -27,6 +28,9 @@ def load_dataset(path, optimize=True, percentage=0.1):
     - CS: Course over ground and speed over ground
     - U: Actuator values vector given in percentages of maximum actuator value
 
+    The file is parsed by 'mqtt_nmea_bridge.datasets.load_dataset', which caches the parsed dataset
+    in a sidecar file next to the CSV file.
+
     --------------------------------------------------------------------
     In:
         path (str): Path to the CSV file.
@@ -34,25 +38,7 @@ def load_dataset(path, optimize=True, percentage=0.1):
         dataset (lst of lsts of floats): The dataset.
     --------------------------------------------------------------------
     '''
-    dataset = []
-    # Read the first line
-    with open(path, "r") as f:
-        line = f.readline()
-        line = line.strip()
-        line = line.split(",")
-        # Read the rest of the lines
-        for line in f:
-            line = line.strip()
-            line = line.split(",")
-            time = float(line[0])
-            X = [float(x.replace("\"", "").replace("[", "").replace("]", "")) for x in line[1:7]]
-            COG = float(line[7].replace("\"", "").replace("[", "").replace("]", ""))
-            SOG = float(line[8].replace("\"", "").replace("[", "").replace("]", ""))
-            CS = [COG, SOG]
-            U = [float(u.replace("\"", "").replace("[", "").replace("]", "")) for u in line[9:]]
-            dataline = [time, X, CS, U]
-            dataset.append(dataline)
-    return dataset
+    return datasets.load_dataset(path).to_list()
 
 def optimize_dataset_horizon(dataset, percentage):
     '''
@@ -65,16 +51,10 @@ def optimize_dataset_horizon(dataset, percentage):
     Out:
         dataset (lst of lsts of floats): The optimized dataset.
     '''
-    optimized_dataset = []
-    prev_U = dataset[0][3]
-    optimized_dataset.append(dataset[0])
-    for data_point in dataset[1:]:
-        U = data_point[3]
-        if not has_changed(prev_U, U, percentage):
-            continue
-        else:
-            optimized_dataset.append(data_point)
-            prev_U = U
+    # Same filter as 'has_changed' applied point by point, computed with NumPy
+    U = np.array([data_point[3] for data_point in dataset])
+    indices = simplify.actuator_change_indices(U, percentage/100)
+    optimized_dataset = [dataset[i] for i in indices]
     print(f"Optimized dataset from {len(dataset)} to {len(optimized_dataset)} datapoints.")
     return optimized_dataset
 
@@ -108,12 +88,9 @@ def latlon_to_UTM(lat, lon):
         northing: (Float) Northing coordinate
         easting: (Float) Easting coordinate
     '''
-    # Create a transformer object for converting from WGS84 to UTM Zone 31
-    transformer = Transformer.from_crs("EPSG:4326", "EPSG:32631")
-    
-    # Convert
-    easting, northing = transformer.transform(lat, lon)
-    
+    # The transformer is created once and reused, use 'geo.latlon_to_utm' to convert arrays of positions
+    easting, northing = geo.transformer(geo.WGS84, "EPSG:32631").transform(lon, lat)
+
     return northing, easting
 
 
@@ -142,9 +119,10 @@ def UTM_to_NED(UTM, origin, is_dict=False):
             return UTM
         if isinstance(UTM[0], list) or isinstance(UTM[0], tuple):
             if isinstance(UTM[0][0], list) or isinstance(UTM[0][0], tuple):
-                NED = [[[point[0]-origin[0], point[1]-origin[1]] for point in poly] for poly in UTM]
+                # The polygons may have different numbers of points
+                NED = [geo.utm_to_ned(poly, origin[:2]).tolist() for poly in UTM]
             else:
-                NED = [[point[0]-origin[0], point[1]-origin[1]] for point in UTM]
+                NED = geo.utm_to_ned(UTM, origin[:2]).tolist()
         else:
             NED = [UTM[0]-origin[0], UTM[1]-origin[1]]
         return NED
\ No newline at end of file
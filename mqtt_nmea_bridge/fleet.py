@@ -0,0 +1,102 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+from mqtt_nmea_bridge.topics import KINDS, SHIP_STATE, TRAJECTORY, WIND_STATE
+from collections import deque
+
+
+class VesselState:
+    '''
+    Latest message and bounded history of each message kind for one vessel.
+
+    --------------------------------------------------------------------
+    Parameters:
+        vessel_id (str): The ID of the vessel.
+        history (int): Number of messages kept per message kind.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, vessel_id, history=100):
+        self.vessel_id = vessel_id
+        self.latest = dict.fromkeys(KINDS)
+        self.history = {kind: deque(maxlen=history) for kind in KINDS}
+
+    def update(self, kind, message):
+        self.latest[kind] = message
+        self.history[kind].append(message)
+
+    @property
+    def ship_state(self):
+        return self.latest[SHIP_STATE]
+
+    @property
+    def trajectory(self):
+        return self.latest[TRAJECTORY]
+
+    @property
+    def wind_state(self):
+        return self.latest[WIND_STATE]
+
+
+class FleetCache:
+    '''
+    Per-vessel cache of the latest messages and their histories.
+
+    Vessels are added on their first message. Every lookup and update is a dictionary access,
+    so the cost does not grow with the number of vessels.
+
+    --------------------------------------------------------------------
+    Parameters:
+        history (int): Number of messages kept per vessel and message kind.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, history=100):
+        self._history = history
+        self._vessels = {}
+
+    def update(self, vessel_id, kind, message):
+        vessel = self._vessels.get(vessel_id)
+        if vessel is None:
+            vessel = self._vessels.setdefault(vessel_id, VesselState(vessel_id, self._history))
+        vessel.update(kind, message)
+
+    def latest(self, vessel_id, kind):
+        '''
+        Returns the latest message of a kind from a vessel, or None if none has been received.
+        '''
+        vessel = self._vessels.get(vessel_id)
+        if vessel is None:
+            return None
+        return vessel.latest[kind]
+
+    def history(self, vessel_id, kind):
+        '''
+        Returns the history of a message kind from a vessel as a list, oldest first.
+        '''
+        vessel = self._vessels.get(vessel_id)
+        if vessel is None:
+            return []
+        return list(vessel.history[kind])
+
+    def vessel_ids(self):
+        return list(self._vessels)
+
+    def __getitem__(self, vessel_id):
+        return self._vessels[vessel_id]
+
+    def __contains__(self, vessel_id):
+        return vessel_id in self._vessels
+
+    def __len__(self):
+        return len(self._vessels)
@@ -0,0 +1,208 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+'''
+Coordinate transforms between latitude/longitude, UTM and local NED coordinates.
+
+Positions are transformed as whole NumPy arrays, one call per trajectory. The pyproj transformers
+are created once per pair of coordinate reference systems and thread, and reused, since creating
+a transformer is far slower than transforming a point. pyproj is an optional dependency, installed with
+
+    pip install mqtt_nmea_bridge[geo]
+
+UTM and NED coordinates are given as arrays of shape (n, 2) on the format [northing, easting] and
+[north, east], like in the examples.
+'''
+import numpy as np
+import threading
+
+
+WGS84 = "EPSG:4326"
+
+_local = threading.local()
+
+
+def utm_zone(latitude, longitude):
+    '''
+    Returns the UTM zone of a position, including the exceptions around Norway and Svalbard.
+
+    --------------------------------------------------------------------
+    Input:
+        latitude (float): In degrees.
+        longitude (float): In degrees.
+    Output:
+        zone (int): The zone number, from 1 to 60.
+        north (bool): True on the northern hemisphere.
+    --------------------------------------------------------------------
+    '''
+    longitude = (longitude + 180.0) % 360.0 - 180.0
+    zone = int((longitude + 180.0) // 6.0) + 1
+    if 56.0 <= latitude < 64.0 and 3.0 <= longitude < 12.0:
+        zone = 32
+    elif 72.0 <= latitude < 84.0 and longitude >= 0.0:
+        if longitude < 9.0:
+            zone = 31
+        elif longitude < 21.0:
+            zone = 33
+        elif longitude < 33.0:
+            zone = 35
+        elif longitude < 42.0:
+            zone = 37
+    return min(zone, 60), latitude >= 0.0
+
+
+def utm_crs(latitude, longitude):
+    '''
+    Returns the EPSG code of the WGS 84 UTM zone of a position, e.g. 'EPSG:32631' for zone 31 north.
+    '''
+    zone, north = utm_zone(latitude, longitude)
+    return f"EPSG:{(32600 if north else 32700) + zone}"
+
+
+def transformer(source, target):
+    '''
+    Returns a cached pyproj Transformer between two coordinate reference systems.
+
+    The coordinates are in the 'x, y' order, i.e. longitude before latitude and easting before
+    northing. The transformers are cached per thread, since pyproj transformers must not be shared
+    between threads.
+
+    --------------------------------------------------------------------
+    Input:
+        source (str): The source CRS, e.g. 'EPSG:4326'.
+        target (str): The target CRS.
+    Output:
+        transformer (pyproj.Transformer): The transformer.
+    --------------------------------------------------------------------
+    '''
+    cache = getattr(_local, "transformers", None)
+    if cache is None:
+        cache = _local.transformers = {}
+    key = (source, target)
+    cached = cache.get(key)
+    if cached is None:
+        cached = cache[key] = _pyproj().Transformer.from_crs(source, target, always_xy=True)
+    return cached
+
+
+def latlon_to_utm(latitude, longitude, crs=None):
+    '''
+    Transforms latitudes and longitudes to UTM coordinates.
+
+    --------------------------------------------------------------------
+    Input:
+        latitude (float / array of floats): In degrees.
+        longitude (float / array of floats): In degrees.
+        crs (str): The UTM CRS. If None, the zone of the first position is used, see 'utm_crs'.
+    Output:
+        points (np.ndarray): Array of shape (n, 2) on the format [northing, easting].
+        crs (str): The UTM CRS used.
+    --------------------------------------------------------------------
+    '''
+    latitude = np.atleast_1d(np.asarray(latitude, dtype=np.float64))
+    longitude = np.atleast_1d(np.asarray(longitude, dtype=np.float64))
+    if crs is None:
+        if latitude.size == 0:
+            raise ValueError("Can not select the UTM zone without positions, give 'crs'.")
+        crs = utm_crs(latitude[0], longitude[0])
+    easting, northing = transformer(WGS84, crs).transform(longitude, latitude)
+    return np.column_stack((northing, easting)), crs
+
+
+def utm_to_latlon(points, crs):
+    '''
+    Transforms UTM coordinates to latitudes and longitudes.
+
+    --------------------------------------------------------------------
+    Input:
+        points (array of floats): Array of shape (n, 2) on the format [northing, easting].
+        crs (str): The UTM CRS of the points.
+    Output:
+        latitude (np.ndarray): In degrees.
+        longitude (np.ndarray): In degrees.
+    --------------------------------------------------------------------
+    '''
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    longitude, latitude = transformer(crs, WGS84).transform(points[:, 1], points[:, 0])
+    return np.asarray(latitude), np.asarray(longitude)
+
+
+def utm_to_ned(points, origin):
+    '''
+    Converts UTM coordinates to NED coordinates relative to an origin.
+
+    --------------------------------------------------------------------
+    Input:
+        points (array of floats): Array of shape (..., 2) on the format [northing, easting].
+        origin (array of floats): The origin on the format [northing, easting].
+    Output:
+        points (np.ndarray): Array of the same shape on the format [north, east].
+    --------------------------------------------------------------------
+    '''
+    return np.asarray(points, dtype=np.float64) - np.asarray(origin, dtype=np.float64)
+
+
+def ned_to_utm(points, origin):
+    '''
+    Converts NED coordinates relative to an origin to UTM coordinates. The inverse of 'utm_to_ned'.
+    '''
+    return np.asarray(points, dtype=np.float64) + np.asarray(origin, dtype=np.float64)
+
+
+def latlon_to_ned(latitude, longitude, origin, crs=None):
+    '''
+    Transforms latitudes and longitudes to NED coordinates relative to an origin in UTM coordinates.
+
+    --------------------------------------------------------------------
+    Input:
+        latitude (float / array of floats): In degrees.
+        longitude (float / array of floats): In degrees.
+        origin (array of floats): The origin on the format [northing, easting].
+        crs (str): The UTM CRS of the origin. If None, the zone of the first position is used.
+    Output:
+        points (np.ndarray): Array of shape (n, 2) on the format [north, east].
+    --------------------------------------------------------------------
+    '''
+    points, _ = latlon_to_utm(latitude, longitude, crs)
+    return utm_to_ned(points, origin)
+
+
+def trajectory_to_ned(trajectory, origin, crs=None):
+    '''
+    Transforms the waypoints of a Trajectory to NED coordinates relative to an origin in UTM coordinates.
+
+    --------------------------------------------------------------------
+    Input:
+        trajectory (Trajectory): The trajectory.
+        origin (array of floats): The origin on the format [northing, easting].
+        crs (str): The UTM CRS of the origin. If None, the zone of the first waypoint is used.
+    Output:
+        points (np.ndarray): Array of shape (n, 2) on the format [north, east].
+    --------------------------------------------------------------------
+    '''
+    shipstates = trajectory.shipstates
+    if not shipstates:
+        return np.empty((0, 2))
+    latitude = np.fromiter((shipstate.latitude for shipstate in shipstates), dtype=np.float64, count=len(shipstates))
+    longitude = np.fromiter((shipstate.longitude for shipstate in shipstates), dtype=np.float64, count=len(shipstates))
+    return latlon_to_ned(latitude, longitude, origin, crs)
+
+
+def _pyproj():
+    try:
+        import pyproj
+    except ImportError as e:
+        raise ImportError("The coordinate transforms need pyproj, install it with 'pip install mqtt_nmea_bridge[geo]'.") from e
+    return pyproj
@@ -0,0 +1,119 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge.datasets import Dataset, data_point_to_shipstate
+from bisect import bisect_left
+import numpy as np
+
+
+class MovingTrajectory:
+    '''
+    Receding horizon over a time-sorted dataset, for publishing the predicted trajectory of a vessel.
+
+    The horizon at time t holds the waypoints from t up to and including the first waypoint at or
+    after t + time_horizon. If no waypoint has timestamp t, the current ship state is the first
+    waypoint. The edges of the horizon are found by binary search on the timestamps, and the
+    ShipState of each waypoint is created once and reused by later horizons while it is in the
+    horizon, so an update costs O(log n) and a trajectory of k waypoints costs O(k), whatever the
+    size of the dataset. Only the ship states of the current horizon are kept.
+
+    --------------------------------------------------------------------
+    Parameters:
+        dataset (Dataset / lst of lsts of floats): The waypoints on the format [time, X, CS, U], sorted by time.
+        time_horizon (float): The time horizon (in seconds) of the trajectory.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, dataset, time_horizon):
+        if isinstance(dataset, Dataset):
+            times = dataset.time.tolist()
+        else:
+            times = [data_point[0] for data_point in dataset]
+        if np.any(np.diff(times) < 0):
+            raise ValueError("The waypoints of the dataset must be sorted by time.")
+        self._dataset = dataset
+        self._times = times
+        # The ship states of the waypoints in the horizon, by index
+        self._shipstates = {}
+        self._time_horizon = time_horizon
+        self._current = None
+        self._current_time = None
+        self._start = 0
+        self._end = 0
+        if times:
+            self.update_moving_trajectory(dataset[0])
+
+    def update_moving_trajectory(self, current_shipstate):
+        '''
+        Moves the horizon to the time of the current ship state.
+
+        --------------------------------------------------------------------
+        In:
+            current_shipstate (lst of floats / ShipState): The current ship state, as a data point on
+                the format [time, X, CS, U] or as a ShipState.
+        --------------------------------------------------------------------
+        '''
+        timestamp = current_shipstate.time if isinstance(current_shipstate, mnb.ShipState) else current_shipstate[0]
+        times = self._times
+        # The pointers only move forward while the time does, which bounds the binary searches
+        forward = self._current_time is not None and timestamp >= self._current_time
+        start = bisect_left(times, timestamp, self._start if forward else 0)
+        if forward:
+            # The ship states cached so far are in [_start, _end), so those behind the horizon are evicted
+            for index in range(self._start, min(start, self._end)):
+                self._shipstates.pop(index, None)
+        else:
+            self._shipstates.clear()
+        self._start = start
+        self._end = min(bisect_left(times, timestamp + self._time_horizon, start) + 1, len(times))
+        self._current_time = timestamp
+        if self._start < len(times) and times[self._start] == timestamp:
+            self._current = None
+        else:
+            self._current = current_shipstate
+
+    @property
+    def indices(self):
+        '''
+        The range of the dataset in the horizon, as (start, end), not counting the current ship state.
+        '''
+        return self._start, self._end
+
+    @property
+    def trajectory(self):
+        shipstates = [self._shipstate(i) for i in range(self._start, self._end)]
+        if self._current is not None and shipstates:
+            current = self._current
+            if not isinstance(current, mnb.ShipState):
+                current = data_point_to_shipstate(current)
+            shipstates = [current] + shipstates
+        return mnb.Trajectory(shipstates)
+
+    def __len__(self):
+        '''
+        The number of waypoints in the horizon, or 0 if the end of the dataset is passed.
+        '''
+        n = self._end - self._start
+        return n + 1 if n and self._current is not None else n
+
+    def _shipstate(self, index):
+        shipstate = self._shipstates.get(index)
+        if shipstate is None:
+            if isinstance(self._dataset, Dataset):
+                shipstate = self._dataset.shipstate(index)
+            else:
+                shipstate = data_point_to_shipstate(self._dataset[index])
+            self._shipstates[index] = shipstate
+        return shipstate
@@ -0,0 +1,231 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+'''
+Course over ground, speed over ground, distances and bearings derived from timestamped positions.
+
+The functions work on whole arrays of positions, or on the waypoints of a Trajectory, and
+'CourseSpeedEstimator' derives the course and speed of a live stream one position at a time.
+
+Latitudes, longitudes and courses are in degrees, with the course from north (0) to east (90) to
+south (180 or -180) to west (-90), like the datasets in 'example_data'. Distances are in metres
+and speeds in m/s. The distance of a leg is either the great circle distance ('haversine') or the
+distance in a local east-north plane at the middle of the leg ('enu'), which is faster and accurate
+to well below a millimetre for the legs of a few metres between the samples of a vessel.
+'''
+import numpy as np
+import math
+
+
+# Mean radius of the earth in metres
+EARTH_RADIUS = 6371008.8
+
+METHODS = ("haversine", "enu")
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    '''
+    Returns the great circle distance in metres between positions in degrees. The arguments are broadcast.
+    '''
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2 - lon1)/2)**2
+    return 2*EARTH_RADIUS*np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    '''
+    Returns the initial great circle bearing in degrees, in [-180, 180], from the first to the
+    second positions in degrees. The arguments are broadcast.
+    '''
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    y = np.sin(dlon)*np.cos(lat2)
+    x = np.cos(lat1)*np.sin(lat2) - np.sin(lat1)*np.cos(lat2)*np.cos(dlon)
+    return np.degrees(np.arctan2(y, x))
+
+
+def legs(latitude, longitude, method="haversine"):
+    '''
+    Returns the distance and the bearing of each leg between consecutive positions.
+
+    --------------------------------------------------------------------
+    Input:
+        latitude (array of floats): In degrees.
+        longitude (array of floats): In degrees.
+        method (str): 'haversine' or 'enu', see the module documentation.
+    Output:
+        distances (np.ndarray): The n - 1 leg distances in metres.
+        bearings (np.ndarray): The n - 1 leg bearings in degrees.
+    --------------------------------------------------------------------
+    '''
+    latitude = np.asarray(latitude, dtype=np.float64)
+    longitude = np.asarray(longitude, dtype=np.float64)
+    if method == "haversine":
+        lat1, lon1, lat2, lon2 = latitude[:-1], longitude[:-1], latitude[1:], longitude[1:]
+        return haversine(lat1, lon1, lat2, lon2), bearing(lat1, lon1, lat2, lon2)
+    if method == "enu":
+        north = np.radians(np.diff(latitude))*EARTH_RADIUS
+        dlon = (np.diff(longitude) + 180.0) % 360.0 - 180.0
+        east = np.radians(dlon)*EARTH_RADIUS*np.cos(np.radians(latitude[:-1] + latitude[1:])/2)
+        return np.hypot(north, east), np.degrees(np.arctan2(east, north))
+    raise ValueError(f"Unknown method '{method}', expected one of {METHODS}.")
+
+
+def course_and_speed(time, latitude, longitude, method="haversine"):
+    '''
+    Derives the course and speed over ground at each position from the leg to it from the previous position.
+
+    The first position gets the course and speed of the first leg. A leg without movement keeps the
+    course of the leg before it, and the course is NaN until the vessel has moved. The speed is NaN
+    for legs that do not advance in time.
+
+    --------------------------------------------------------------------
+    Input:
+        time (array of floats): In seconds, non-decreasing.
+        latitude (array of floats): In degrees.
+        longitude (array of floats): In degrees.
+        method (str): 'haversine' or 'enu', see the module documentation.
+    Output:
+        cog (np.ndarray): Course over ground in degrees.
+        sog (np.ndarray): Speed over ground in m/s.
+    --------------------------------------------------------------------
+    '''
+    time = np.asarray(time, dtype=np.float64)
+    if time.size < 2:
+        return np.full(time.shape, np.nan), np.full(time.shape, np.nan)
+    distances, bearings = legs(latitude, longitude, method)
+    dt = np.diff(time)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speeds = np.where(dt > 0, distances/dt, np.nan)
+    # Forward fill the course over the legs without movement
+    moved = distances > 0
+    last_moved = np.maximum.accumulate(np.where(moved, np.arange(moved.size), -1))
+    courses = np.where(last_moved >= 0, bearings[np.maximum(last_moved, 0)], np.nan)
+    cog = np.concatenate((courses[:1], courses))
+    sog = np.concatenate((speeds[:1], speeds))
+    return cog, sog
+
+
+def trajectory_course_and_speed(trajectory, method="haversine"):
+    '''
+    Derives the course and speed over ground at each waypoint of a Trajectory, see 'course_and_speed'.
+    '''
+    shipstates = trajectory.shipstates
+    columns = [np.fromiter((getattr(shipstate, name) for shipstate in shipstates), dtype=np.float64, count=len(shipstates))
+               for name in ("time", "latitude", "longitude")]
+    return course_and_speed(*columns, method=method)
+
+
+def fill_course_and_speed(trajectory, method="haversine"):
+    '''
+    Sets the course and speed over ground of the waypoints of a Trajectory where they are None.
+
+    Values that can not be derived, e.g. for a single waypoint, are left as None.
+
+    --------------------------------------------------------------------
+    Input:
+        trajectory (Trajectory): The trajectory, changed in place.
+        method (str): 'haversine' or 'enu', see the module documentation.
+    Output:
+        trajectory (Trajectory): The same trajectory.
+    --------------------------------------------------------------------
+    '''
+    shipstates = trajectory.shipstates
+    if not any(shipstate.cog is None or shipstate.sog is None for shipstate in shipstates):
+        return trajectory
+    cog, sog = trajectory_course_and_speed(trajectory, method)
+    for shipstate, c, s in zip(shipstates, cog.tolist(), sog.tolist()):
+        if shipstate.cog is None and not math.isnan(c):
+            shipstate.cog = c
+        if shipstate.sog is None and not math.isnan(s):
+            shipstate.sog = s
+    return trajectory
+
+
+class CourseSpeedEstimator:
+    '''
+    Derives the course and speed over ground of a stream of positions, in constant time per position.
+
+    Each position is compared with the last reference position, which is only moved when the vessel
+    is at least 'min_distance' metres away from it, so the course does not follow the position noise
+    of a vessel lying still. The speed is smoothed exponentially with the time constant
+    'time_constant', or not smoothed if it is 0.
+
+    --------------------------------------------------------------------
+    Parameters:
+        min_distance (float): The minimum leg distance in metres for a new course.
+        time_constant (float): The time constant in seconds of the speed smoothing.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, min_distance=0.0, time_constant=0.0):
+        self.min_distance = min_distance
+        self.time_constant = time_constant
+        self.cog = None
+        self.sog = None
+        self._reference = None
+
+    def update(self, time, latitude, longitude):
+        '''
+        Adds a position, and returns the course and speed over ground, or None until they are known.
+
+        --------------------------------------------------------------------
+        Input:
+            time (float): In seconds.
+            latitude (float): In degrees.
+            longitude (float): In degrees.
+        Output:
+            cog (float): Course over ground in degrees.
+            sog (float): Speed over ground in m/s.
+        --------------------------------------------------------------------
+        '''
+        if self._reference is None:
+            self._reference = (time, latitude, longitude)
+            return self.cog, self.sog
+        ref_time, ref_latitude, ref_longitude = self._reference
+        dt = time - ref_time
+        if dt <= 0:
+            return self.cog, self.sog
+        # The same plane approximation as the 'enu' method, in scalar maths
+        north = math.radians(latitude - ref_latitude)*EARTH_RADIUS
+        east = math.radians((longitude - ref_longitude + 180.0) % 360.0 - 180.0)*EARTH_RADIUS*math.cos(math.radians(latitude + ref_latitude)/2)
+        distance = math.hypot(north, east)
+        speed = distance/dt
+        # Closer than 'min_distance', the course is kept and the reference is kept for the next position
+        if distance >= self.min_distance:
+            if distance > 0:
+                self.cog = math.degrees(math.atan2(east, north))
+            self._reference = (time, latitude, longitude)
+        if self.sog is None or self.time_constant <= 0:
+            self.sog = speed
+        else:
+            alpha = 1.0 - math.exp(-dt/self.time_constant)
+            self.sog += alpha*(speed - self.sog)
+        return self.cog, self.sog
+
+    def fill(self, shipstate):
+        '''
+        Adds the position of a ShipState, and sets its course and speed over ground where they are None.
+        '''
+        cog, sog = self.update(shipstate.time, shipstate.latitude, shipstate.longitude)
+        if shipstate.cog is None:
+            shipstate.cog = cog
+        if shipstate.sog is None:
+            shipstate.sog = sog
+        return shipstate
+
+    def reset(self):
+        self.cog = None
+        self.sog = None
+        self._reference = None
@@ -0,0 +1,361 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+from collections import defaultdict
+import itertools
+import threading
+import random
+import heapq
+import time
+
+
+def topic_matches(topic_filter, topic):
+    '''
+    Returns True if the topic matches the subscription filter, with the '+' and '#' wildcards.
+    '''
+    filter_segments = topic_filter.split("/")
+    topic_segments = topic.split("/")
+    # Wildcards at the first level do not match topics starting with '$'
+    if topic.startswith("$") and filter_segments[0] in ("+", "#"):
+        return False
+    for i, segment in enumerate(filter_segments):
+        if segment == "#":
+            return True
+        if i >= len(topic_segments):
+            return False
+        if segment != "+" and segment != topic_segments[i]:
+            return False
+    return len(filter_segments) == len(topic_segments)
+
+
+def _split_shared(topic_filter):
+    '''
+    Splits a '$share/<group>/<filter>' subscription into the group and the filter.
+    '''
+    if topic_filter.startswith("$share/"):
+        _, group, topic_filter = topic_filter.split("/", 2)
+        return group, topic_filter
+    return None, topic_filter
+
+
+class LoopbackMessage:
+    '''
+    Message delivered to the 'on_message' callback, with the attributes of a paho MQTTMessage.
+    '''
+    def __init__(self, topic, payload, qos=0, retain=False, mid=0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = mid
+        self.timestamp = time.monotonic()
+
+
+class LoopbackMessageInfo:
+    '''
+    Returned by 'LoopbackClient.publish', with the interface of a paho MQTTMessageInfo.
+    '''
+    def __init__(self, mid, rc=0):
+        self.mid = mid
+        self.rc = rc
+        self._published = threading.Event()
+
+    def is_published(self):
+        return self._published.is_set()
+
+    def wait_for_publish(self, timeout=None):
+        return self._published.wait(timeout)
+
+    def _set_published(self):
+        self._published.set()
+
+
+class LoopbackBroker:
+    '''
+    In-process stand-in for an MQTT broker, for throughput and latency tests without outside services.
+
+    Clients are created with 'client', which can be passed as 'client_factory' to the publishers and
+    subscribers. Topic filters with the '+' and '#' wildcards, '$share/<group>/<filter>' shared
+    subscriptions and QoS 0 and 1 are supported. Messages are delivered from a dispatcher thread,
+    like the network thread of a paho client. An exception raised by a client callback is printed
+    and counted in 'stats["callback_errors"]', like paho with 'suppress_exceptions', so it does not
+    stop the deliveries to the other clients.
+
+    Latency and packet loss can be injected. A lost QoS 0 message is dropped, while a lost QoS 1
+    message is retransmitted after 'retry_interval' until it is delivered. With 'jitter', messages
+    can be delivered out of order. If a client has 'max_queued' messages waiting to be delivered,
+    further QoS 0 messages to it are dropped.
+
+    --------------------------------------------------------------------
+    Parameters:
+        latency (float): Delay in seconds from publish to delivery, and from publish to the QoS 1 acknowledgement.
+        jitter (float): Maximum random delay in seconds added to 'latency'.
+        loss (float): Probability of losing each transmission, between 0 and 1.
+        retry_interval (float): Seconds before a lost QoS 1 message is retransmitted.
+        max_queued (int): Maximum number of messages waiting to be delivered per client. 0 means unbounded.
+        seed (int): Seed of the random loss and jitter.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, latency=0.0, jitter=0.0, loss=0.0, retry_interval=0.01, max_queued=0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.retry_interval = retry_interval
+        self.max_queued = max_queued
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._events = []
+        self._seq = itertools.count()
+        # Filter -> {client: qos}, and group -> filter -> {client: qos}
+        self._subscriptions = defaultdict(dict)
+        self._shared = defaultdict(lambda: defaultdict(dict))
+        self._round_robin = defaultdict(itertools.count)
+        self._route_cache = {}
+        self._queued = defaultdict(int)
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0, "lost": 0, "retransmitted": 0,
+                      "callback_errors": 0}
+        self._running = True
+        self._dispatcher = threading.Thread(target=self._dispatch, name="loopback-broker", daemon=True)
+        self._dispatcher.start()
+
+    def client(self, client_id="", *args, **kwargs):
+        '''
+        Creates a client connected to this broker. Takes the arguments of a paho Client.
+        '''
+        return LoopbackClient(self, client_id, kwargs.get("userdata"))
+
+    def close(self):
+        '''
+        Stops the dispatcher thread. Undelivered messages are discarded.
+        '''
+        with self._wakeup:
+            self._running = False
+            self._wakeup.notify()
+        self._dispatcher.join()
+
+    def _delay(self):
+        if self.jitter > 0:
+            return self.latency + self._random.random() * self.jitter
+        return self.latency
+
+    def _schedule(self, delay, action, *args):
+        # Must be called with the lock held
+        heapq.heappush(self._events, (time.monotonic() + delay, next(self._seq), action, args))
+        self._wakeup.notify()
+
+    def _subscribe(self, client, topic_filter, qos):
+        group, topic_filter = _split_shared(topic_filter)
+        with self._lock:
+            if group is None:
+                self._subscriptions[topic_filter][client] = qos
+            else:
+                self._shared[group][topic_filter][client] = qos
+            self._route_cache.clear()
+
+    def _unsubscribe(self, client, topic_filter=None):
+        with self._lock:
+            if topic_filter is None:
+                filters = [self._subscriptions] + [group for group in self._shared.values()]
+                for subscriptions in filters:
+                    for clients in subscriptions.values():
+                        clients.pop(client, None)
+            else:
+                group, topic_filter = _split_shared(topic_filter)
+                subscriptions = self._subscriptions if group is None else self._shared[group]
+                subscriptions.get(topic_filter, {}).pop(client, None)
+            self._route_cache.clear()
+
+    def _routes(self, topic):
+        '''
+        Returns the subscribers of a topic as a list of (client, qos), and the members of each
+        shared subscription group that matches it. Must be called with the lock held.
+        '''
+        routes = self._route_cache.get(topic)
+        if routes is None:
+            direct = {}
+            for topic_filter, clients in self._subscriptions.items():
+                if topic_matches(topic_filter, topic):
+                    for client, qos in clients.items():
+                        direct[client] = max(qos, direct.get(client, 0))
+            shared = []
+            for group, subscriptions in self._shared.items():
+                members = {}
+                for topic_filter, clients in subscriptions.items():
+                    if topic_matches(topic_filter, topic):
+                        for client, qos in clients.items():
+                            members[client] = max(qos, members.get(client, 0))
+                if members:
+                    shared.append((group, list(members.items())))
+            routes = self._route_cache[topic] = (list(direct.items()), shared)
+        return routes
+
+    def _publish(self, sender, topic, payload, qos, retain, info):
+        with self._lock:
+            self.stats["published"] += 1
+            direct, shared = self._routes(topic)
+            targets = list(direct)
+            for group, members in shared:
+                targets.append(members[next(self._round_robin[group]) % len(members)])
+            for client, sub_qos in targets:
+                effective_qos = min(qos, sub_qos)
+                if effective_qos == 0 and self.max_queued and self._queued[client] >= self.max_queued:
+                    self.stats["dropped"] += 1
+                    continue
+                self._queued[client] += 1
+                message = LoopbackMessage(topic, payload, effective_qos, retain, info.mid)
+                self._schedule(self._delay(), self._deliver, client, message)
+            if qos == 0:
+                info._set_published()
+                if sender.on_publish is not None:
+                    self._schedule(0.0, sender._handle_publish, info)
+            else:
+                self._schedule(self._delay(), sender._handle_publish, info)
+
+    def _deliver(self, client, message):
+        # Called from the dispatcher thread with the lock held
+        if self.loss > 0 and self._random.random() < self.loss:
+            self.stats["lost"] += 1
+            if message.qos > 0:
+                self.stats["retransmitted"] += 1
+                self._schedule(self.retry_interval + self._delay(), self._deliver, client, message)
+            else:
+                self._queued[client] -= 1
+            return None
+        self._queued[client] -= 1
+        self.stats["delivered"] += 1
+        return client._handle_message, message
+
+    def _dispatch(self):
+        while True:
+            with self._wakeup:
+                while self._running and (not self._events or self._events[0][0] > time.monotonic()):
+                    timeout = None if not self._events else self._events[0][0] - time.monotonic()
+                    self._wakeup.wait(timeout)
+                if not self._running:
+                    return
+                _, _, action, args = heapq.heappop(self._events)
+                if action == self._deliver:
+                    callback = self._deliver(*args)
+                else:
+                    callback = (action, *args)
+            # Run the client callbacks without holding the lock, so they can publish
+            if callback is not None:
+                try:
+                    callback[0](*callback[1:])
+                except Exception as e:
+                    client = callback[0].__self__
+                    print(f"Callback of loopback client '{client._client_id}' failed: {e!r}")
+                    with self._lock:
+                        self.stats["callback_errors"] += 1
+
+
+class LoopbackClient:
+    '''
+    Client of a 'LoopbackBroker', with the subset of the paho Client interface used by the
+    publishers and subscribers.
+    '''
+    def __init__(self, broker, client_id="", userdata=None):
+        self._broker = broker
+        self._client_id = client_id
+        self._userdata = userdata
+        self._mid = itertools.count(1)
+        self._connected = False
+        self._stopped = threading.Event()
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.on_publish = None
+        self.on_subscribe = None
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def user_data_set(self, userdata):
+        self._userdata = userdata
+
+    def connect(self, host="localhost", port=1883, keepalive=60, *args, **kwargs):
+        self._connected = True
+        self._stopped.clear()
+        with self._broker._lock:
+            self._broker._schedule(self._broker._delay(), self._handle_connect)
+        return 0
+
+    def reconnect(self):
+        return self.connect()
+
+    def disconnect(self, *args, **kwargs):
+        if self._connected:
+            self._connected = False
+            self._broker._unsubscribe(self)
+            if self.on_disconnect is not None:
+                self.on_disconnect(self, self._userdata, 0)
+        self._stopped.set()
+        return 0
+
+    def is_connected(self):
+        return self._connected
+
+    def subscribe(self, topic, qos=0, *args, **kwargs):
+        subscriptions = [(topic, qos)] if isinstance(topic, str) else list(topic)
+        mid = next(self._mid)
+        for topic_filter, sub_qos in subscriptions:
+            self._broker._subscribe(self, topic_filter, min(sub_qos, 1))
+        if self.on_subscribe is not None:
+            self.on_subscribe(self, self._userdata, mid, tuple(min(q, 1) for _, q in subscriptions))
+        return 0, mid
+
+    def unsubscribe(self, topic, *args, **kwargs):
+        for topic_filter in ([topic] if isinstance(topic, str) else topic):
+            self._broker._unsubscribe(self, topic_filter)
+        return 0, next(self._mid)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, *args, **kwargs):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        elif payload is None:
+            payload = b""
+        elif isinstance(payload, (int, float)):
+            payload = str(payload).encode()
+        info = LoopbackMessageInfo(next(self._mid))
+        if not self._connected:
+            # Like paho, the message is queued by a disconnected client, but here it is dropped
+            info.rc = 4  # MQTT_ERR_NO_CONN
+            return info
+        self._broker._publish(self, topic, bytes(payload), min(qos, 1), retain, info)
+        return info
+
+    def loop_start(self):
+        return 0
+
+    def loop_stop(self, force=False):
+        return 0
+
+    def loop_forever(self, *args, **kwargs):
+        self._stopped.wait()
+        return 0
+
+    def _handle_connect(self):
+        if self.on_connect is not None:
+            self.on_connect(self, self._userdata, {"session present": 0}, 0)
+
+    def _handle_message(self, message):
+        if self._connected and self.on_message is not None:
+            self.on_message(self, self._userdata, message)
+
+    def _handle_publish(self, info):
+        info._set_published()
+        if self.on_publish is not None:
+            self.on_publish(self, self._userdata, info.mid)
@@ -0,0 +1,276 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import bisect
+import math
+
+
+# Latency buckets in seconds, from 10 us to 1 s
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0)
+
+
+class _Metric:
+    '''
+    Parent class of the metric types. A metric has one child per combination of label values.
+    '''
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        '''
+        Return the child of the metric with the given label values.
+        '''
+        if kwargs:
+            values = tuple(str(kwargs[name]) for name in self.labelnames)
+        else:
+            values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"Metric '{self.name}' expects the labels {self.labelnames}.")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_str(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self):
+        # Unlike the label values, the help text only escapes backslashes and line feeds
+        help = self.help.replace("\\", "\\\\").replace("\n", "\\n")
+        lines = [f"# HELP {self.name} {help}", f"# TYPE {self.name} {self.type}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    '''
+    Monotonically increasing count, e.g. of messages or bytes.
+    '''
+    type = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{self._label_str(values)} {_format(child.value)}"]
+
+
+class Gauge(_Metric):
+    '''
+    Value that can go up and down, e.g. a queue depth.
+    '''
+    type = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{self._label_str(values)} {_format(child.value)}"]
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    '''
+    Distribution of observed values, e.g. of encode latencies, counted in cumulative buckets.
+    '''
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), child.counts):
+            cumulative += count
+            le = "+Inf" if bound == math.inf else _format(bound)
+            lines.append(f"{self.name}_bucket{self._label_str(values, [('le', le)])} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_str(values)} {_format(child.sum)}")
+        lines.append(f"{self.name}_count{self._label_str(values)} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    '''
+    Collection of metrics that can be exported on the Prometheus text format.
+
+    The metrics are pulled with 'render', or served over HTTP with 'start_http_server'.
+    '''
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def get(self, name):
+        '''
+        Return the metric with the given name, or None if it is not registered.
+        '''
+        return self._metrics.get(name)
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric '{name}' is already registered with another type or labels.")
+            return metric
+
+    def render(self):
+        '''
+        Return every metric on the Prometheus text exposition format.
+        '''
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port=9100, addr="127.0.0.1"):
+        '''
+        Serve the metrics on 'http://<addr>:<port>/metrics' from a daemon thread.
+
+        --------------------------------------------------------------------
+        Input:
+            port (int): The port to listen on. 0 picks a free port.
+            addr (str): The address to listen on.
+        Output:
+            server (ThreadingHTTPServer): The server. Call 'shutdown' on it to stop serving.
+        --------------------------------------------------------------------
+        '''
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((addr, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class ClientMetrics:
+    '''
+    The metrics of the publishers and subscribers, labelled by client ID and topic.
+
+    --------------------------------------------------------------------
+    Parameters:
+        registry (MetricsRegistry): The registry the metrics are registered in.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, registry):
+        self.messages_sent = registry.counter("mnb_messages_published_total", "Messages published.", ("client_id", "topic"))
+        self.bytes_sent = registry.counter("mnb_bytes_published_total", "Payload bytes published.", ("client_id", "topic"))
+        self.messages_received = registry.counter("mnb_messages_received_total", "Messages received.", ("client_id", "topic"))
+        self.bytes_received = registry.counter("mnb_bytes_received_total", "Payload bytes received.", ("client_id", "topic"))
+        self.encode_seconds = registry.histogram("mnb_encode_seconds", "Time spent encoding messages.", ("client_id", "topic"))
+        self.decode_seconds = registry.histogram("mnb_decode_seconds", "Time spent decoding messages.", ("client_id", "topic"))
+        self.queue_depth = registry.gauge("mnb_queue_depth", "Messages waiting in the subscriber queue.", ("client_id",))
+        self.dropped = registry.counter("mnb_messages_dropped_total", "Messages dropped because of a full queue or a failed publish.", ("client_id",))
+        self.malformed = registry.counter("mnb_messages_malformed_total", "Received messages that could not be decoded.", ("client_id", "topic"))
+        self.reconnects = registry.counter("mnb_reconnects_total", "Reconnects to the broker after the first connect.", ("client_id",))
+        self.delivery_seconds = registry.histogram("mnb_delivery_latency_seconds", "Time from publish to delivery, from the message headers.", ("client_id",))
+        self.sequence_gaps = registry.counter("mnb_sequence_gaps_total", "Gaps in the sequence numbers of the message headers.", ("client_id",))
+        self.reorders = registry.counter("mnb_reorders_total", "Messages received after a message with a higher sequence number.", ("client_id",))
+        self.duplicates = registry.counter("mnb_duplicates_total", "Messages received with a sequence number that was already received.", ("client_id",))
+        self.publisher_restarts = registry.counter("mnb_publisher_restarts_total", "Publishers that started a new sequence.", ("client_id",))
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
@@ -14,6 +14,7 @@
 # --------------------------------------------------------------------------------
 #
 import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge import profiling
 import warnings
 import json
 
@@ -32,22 +33,24 @@ def _calculate_checksum(sentence):
 
 def _parse_mqtt_str(mqtt_str):
     '''
-    Parses an mqtt JSON string and returns the message type and body
+    Parses an mqtt JSON string and returns the message type, body and header
 
     --------------------------------------------------------------------
     Input:
         mqtt_str (str): The JSON formatted string.
 
     Output:
-        tuple: message_type (str), message_body (dict)
+        tuple: message_type (str), message_body (dict), message_header (dict or None)
     --------------------------------------------------------------------
     '''
     # Split the message into its components
-    mqtt_dict = json.loads(mqtt_str)
+    with profiling.span(profiling.PARSE):
+        mqtt_dict = json.loads(mqtt_str)
     message_type = mqtt_dict["type"]
     message_body = mqtt_dict["body"]
+    message_header = mqtt_dict.get("header")
 
-    return message_type, message_body
+    return message_type, message_body, message_header
 
 # \************************************************************************************************
 
@@ -67,7 +70,7 @@ def from_mqtt_str_to_traj(mqtt_str):
     --------------------------------------------------------------------
     '''
     # Parse the mqtt string
-    msg_type, msg_body = _parse_mqtt_str(mqtt_str)
+    msg_type, msg_body, msg_header = _parse_mqtt_str(mqtt_str)
 
     # Check if the message type is 'TRAJ'
     if msg_type != 'TRAJ':
@@ -103,7 +106,8 @@ def from_mqtt_str_to_traj(mqtt_str):
                 actuator_values=ship_state["actuator_values"]
             )
             for ship_state in [body["body"] for body in msg_body]
-        ]
+        ],
+        header=msg_header
     )
 
     return trajectory
@@ -122,7 +126,7 @@ def from_mqtt_str_to_shipstate(mqtt_str):
     --------------------------------------------------------------------
     '''
     # Parse the mqtt string
-    msg_type, msg_body = _parse_mqtt_str(mqtt_str)
+    msg_type, msg_body, msg_header = _parse_mqtt_str(mqtt_str)
 
     # Check if the message type is 'SHIP_STATE'
     if msg_type != 'SHIP_STATE':
@@ -143,7 +147,8 @@ def from_mqtt_str_to_shipstate(mqtt_str):
         cog=msg_body["cog"],
         sog=msg_body["sog"],
         nr_of_actuators=msg_body["nr_of_actuators"],
-        actuator_values=msg_body["actuator_values"]
+        actuator_values=msg_body["actuator_values"],
+        header=msg_header
     )
 
     return ship_state
@@ -162,7 +167,7 @@ def from_mqtt_str_to_windstate(mqtt_str):
     --------------------------------------------------------------------
     '''
     # Parse the mqtt string
-    msg_type, msg_body = _parse_mqtt_str(mqtt_str)
+    msg_type, msg_body, msg_header = _parse_mqtt_str(mqtt_str)
 
     # Check if the message type is 'WIND_STATE'
     if msg_type != 'WIND_STATE':
@@ -178,7 +183,8 @@ def from_mqtt_str_to_windstate(mqtt_str):
     wind_state = mnb.WindState(
         time=msg_body["time"],
         speed=msg_body["speed"],
-        direction=msg_body["direction"]
+        direction=msg_body["direction"],
+        header=msg_header
     )
 
     return wind_state
@@ -189,7 +195,7 @@ def from_mqtt_str_to_windstate(mqtt_str):
 # Functions to convert data objects to custom NMEA0183 messages
 # *************************************************************************************************
 
-def from_traj_to_mqtt_str(trajectory):
+def from_traj_to_mqtt_str(trajectory, header=None):
     '''
     Converts a Trajectory object to a JSON string.
 
@@ -232,6 +238,7 @@ def from_traj_to_mqtt_str(trajectory):
     --------------------------------------------------------------------
     Input:
         trajectory (Trajectory): The Trajectory object.
+        header (dict): Optional transport header, added as the "header" field. See 'tracing.make_header'.
     Output:
         mqtt_str (str): JSON formatted string of trajectory object.
     --------------------------------------------------------------------
@@ -261,12 +268,16 @@ def from_traj_to_mqtt_str(trajectory):
         }
         trajectory_dict["body"].append(ship_state_dict)
 
+    if header is not None:
+        trajectory_dict["header"] = header
+
     # Convert the dictionary to a JSON string
-    trajectory_str = json.dumps(trajectory_dict)
+    with profiling.span(profiling.SERIALIZE):
+        trajectory_str = json.dumps(trajectory_dict)
     return trajectory_str
 
 
-def from_shipstate_to_mqtt_str(ship_state):
+def from_shipstate_to_mqtt_str(ship_state, header=None):
     '''
     Converts a ShipState object to a JSON string
 
@@ -288,6 +299,7 @@ def from_shipstate_to_mqtt_str(ship_state):
     --------------------------------------------------------------------
     Input:
         ship_state (ShipState): The ShipState object.
+        header (dict): Optional transport header, added as the "header" field. See 'tracing.make_header'.
     Output:
         mqtt_str (str): JSON formatted string of ship_state object.
     --------------------------------------------------------------------
@@ -311,12 +323,16 @@ def from_shipstate_to_mqtt_str(ship_state):
         }
     }
 
+    if header is not None:
+        ship_state_dict["header"] = header
+
     # Convert the dictionary to a JSON string
-    ship_state_str = json.dumps(ship_state_dict)
+    with profiling.span(profiling.SERIALIZE):
+        ship_state_str = json.dumps(ship_state_dict)
     return ship_state_str
 
 
-def from_windstate_to_mqtt_str(wind_state):
+def from_windstate_to_mqtt_str(wind_state, header=None):
     '''
     Converts a WindState object to a JSON string
 
@@ -333,6 +349,7 @@ def from_windstate_to_mqtt_str(wind_state):
     --------------------------------------------------------------------
     Input:
         wind_state (WindState): The WindState object.
+        header (dict): Optional transport header, added as the "header" field. See 'tracing.make_header'.
     Output:
         nmwa_msg (str): JSON formatted string of wind_state object.
     --------------------------------------------------------------------
@@ -351,8 +368,12 @@ def from_windstate_to_mqtt_str(wind_state):
         }
     }
 
+    if header is not None:
+        wind_state_dict["header"] = header
+
     # Convert the dictionary to a JSON string
-    wind_state_str = json.dumps(wind_state_dict)
+    with profiling.span(profiling.SERIALIZE):
+        wind_state_str = json.dumps(wind_state_dict)
 
     return wind_state_str
 
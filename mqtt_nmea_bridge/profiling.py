@@ -0,0 +1,282 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+'''
+Opt-in profiling hooks on the publish and subscribe hot paths.
+
+The publishers, subscribers and codecs open a named span around each step of handling a message.
+No profiler is installed by default, and a span is then a shared no-op context manager. A
+'Profiler' installed with 'enable', or used as a context manager, samples every Nth span of each
+name and times it, calls a callback with the duration and can wrap it in a context manager, e.g.
+to run cProfile or tracemalloc on the sampled messages only.
+
+    profile = cProfile.Profile()
+    with Profiler(sample_every=100, spans=("decode",), context=cprofile_context(profile)) as profiler:
+        ...
+    profile.print_stats("cumulative")
+    print(profiler.summary())
+'''
+import contextlib
+import tracemalloc
+import itertools
+import threading
+import time
+
+
+# Span names, in the order a message passes them
+ENCODE = "encode"       # Publisher: data object to payload, including 'serialize'
+SERIALIZE = "serialize" # mqtt_str_utils: JSON serialization of a data object
+PUBLISH = "publish"     # Publisher: handing the payload to the MQTT client
+RECEIVE = "receive"     # Subscriber: handling a received message, including 'decode'
+DECODE = "decode"       # Subscriber: payload to data object, including 'parse'
+PARSE = "parse"         # mqtt_str_utils: JSON parsing of a payload
+ENQUEUE = "enqueue"     # Subscriber: putting the data object in the queue
+SPANS = (ENCODE, SERIALIZE, PUBLISH, RECEIVE, DECODE, PARSE, ENQUEUE)
+
+
+class _NullSpan:
+    '''
+    The span returned when profiling is disabled, or the span is not sampled.
+    '''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+# The installed profiler. Read once per span, so installing and removing it is thread-safe.
+_profiler = None
+
+
+def span(name, key=None):
+    '''
+    Opens a span on the installed profiler. Used as 'with profiling.span("decode", topic): ...'.
+
+    --------------------------------------------------------------------
+    Input:
+        name (str): The name of the span, one of 'SPANS'.
+        key (str): Optional key passed on to the callback and context, e.g. the topic.
+    Output:
+        span (context manager): The span, or a no-op if profiling is disabled or the span is not sampled.
+    --------------------------------------------------------------------
+    '''
+    profiler = _profiler
+    if profiler is None:
+        return _NULL_SPAN
+    return profiler.span(name, key)
+
+
+def enable(profiler):
+    '''
+    Installs a profiler on the hot paths of every publisher, subscriber and codec in the process.
+    Returns the previously installed profiler, or None.
+    '''
+    global _profiler
+    previous, _profiler = _profiler, profiler
+    return previous
+
+
+def disable():
+    '''
+    Removes the installed profiler. Returns it, or None if none was installed.
+    '''
+    return enable(None)
+
+
+def active():
+    '''
+    Returns the installed profiler, or None if profiling is disabled.
+    '''
+    return _profiler
+
+
+class _SpanStats:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class _Span:
+    __slots__ = ("_profiler", "_name", "_key", "_context", "_start")
+
+    def __init__(self, profiler, name, key):
+        self._profiler = profiler
+        self._name = name
+        self._key = key
+        self._context = None
+
+    def __enter__(self):
+        if self._profiler.context is not None:
+            self._context = self._profiler.context(self._name, self._key)
+            self._context.__enter__()
+        self._start = self._profiler.clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = self._profiler.clock() - self._start
+        if self._context is not None:
+            self._context.__exit__(*exc_info)
+        self._profiler._record(self._name, self._key, duration)
+        return False
+
+
+class Profiler:
+    '''
+    Samples and times the spans on the publish and subscribe hot paths.
+
+    Every 'sample_every'-th span of each name is sampled; the others cost one counter increment.
+    A sampled span is timed and added to the statistics in 'summary'. If given, 'context' is called
+    with the span name and key, and the returned context manager is entered around the span, and
+    'callback' is called with the name, key and duration after the span.
+
+    Spans are nested: 'receive' contains 'decode', which contains 'parse', and 'encode' contains
+    'serialize'. They are sampled independently, so restrict 'spans' to the steps of interest.
+
+    --------------------------------------------------------------------
+    Parameters:
+        sample_every (int): Sample every Nth span of each name. 1 samples every span.
+        spans (tuple of str): The span names to sample. Defaults to all of 'SPANS'.
+        callback (callable): Called as callback(name, key, seconds) after each sampled span.
+        context (callable): Called as context(name, key) before each sampled span, returning a context manager.
+        clock (callable): Clock of the durations.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, sample_every=1, spans=SPANS, callback=None, context=None, clock=time.perf_counter):
+        if sample_every < 1:
+            raise ValueError("sample_every must be at least 1.")
+        self.sample_every = sample_every
+        self.callback = callback
+        self.context = context
+        self.clock = clock
+        self._counters = {name: itertools.count() for name in spans}
+        self._stats = {name: _SpanStats() for name in spans}
+        self._lock = threading.Lock()
+        self._previous = None
+
+    def span(self, name, key=None):
+        counter = self._counters.get(name)
+        if counter is None or next(counter) % self.sample_every:
+            return _NULL_SPAN
+        return _Span(self, name, key)
+
+    def _record(self, name, key, duration):
+        stats = self._stats[name]
+        with self._lock:
+            stats.count += 1
+            stats.total += duration
+            if duration > stats.max:
+                stats.max = duration
+        if self.callback is not None:
+            self.callback(name, key, duration)
+
+    def summary(self):
+        '''
+        Returns the statistics of the sampled spans.
+
+        --------------------------------------------------------------------
+        Output:
+            summary (dict): Span name -> {"count", "total_s", "mean_s", "max_s"}, for the spans that were sampled.
+        --------------------------------------------------------------------
+        '''
+        with self._lock:
+            return {name: {"count": stats.count,
+                           "total_s": stats.total,
+                           "mean_s": stats.total / stats.count,
+                           "max_s": stats.max}
+                    for name, stats in self._stats.items() if stats.count > 0}
+
+    def reset(self):
+        with self._lock:
+            for name in self._stats:
+                self._stats[name] = _SpanStats()
+
+    def __enter__(self):
+        self._previous = enable(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        enable(self._previous)
+        self._previous = None
+        return False
+
+
+def cprofile_context(profile):
+    '''
+    Returns a 'context' for 'Profiler' that runs a cProfile profile during the sampled spans.
+
+    Nested sampled spans on the same thread keep the profile enabled until the outermost span ends.
+    A cProfile profile only sees the thread it is enabled on, and only one profiler can be active
+    at a time, so sample spans from a single thread, e.g. the network thread of one client.
+
+    --------------------------------------------------------------------
+    Input:
+        profile (cProfile.Profile): The profile to enable.
+    Output:
+        context (callable): The context factory.
+    --------------------------------------------------------------------
+    '''
+    local = threading.local()
+
+    @contextlib.contextmanager
+    def context(name, key):
+        depth = getattr(local, "depth", 0)
+        local.depth = depth + 1
+        if depth == 0:
+            profile.enable()
+        try:
+            yield
+        finally:
+            local.depth -= 1
+            if local.depth == 0:
+                profile.disable()
+
+    return context
+
+
+def tracemalloc_context(callback):
+    '''
+    Returns a 'context' for 'Profiler' that measures the memory allocated during the sampled spans.
+
+    tracemalloc is started if it is not already tracing. The callback is called as
+    callback(name, key, allocated_bytes), where 'allocated_bytes' is the growth of the traced memory
+    over the span, and is negative if more memory was freed than allocated.
+
+    --------------------------------------------------------------------
+    Input:
+        callback (callable): Called after each sampled span.
+    Output:
+        context (callable): The context factory.
+    --------------------------------------------------------------------
+    '''
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    @contextlib.contextmanager
+    def context(name, key):
+        before = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            callback(name, key, tracemalloc.get_traced_memory()[0] - before)
+
+    return context
@@ -15,6 +15,14 @@
 #
 import paho.mqtt.client as mqtt
 import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge import topics, profiling
+from mqtt_nmea_bridge.metrics import REGISTRY, ClientMetrics
+from mqtt_nmea_bridge.tracing import make_header, new_session
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+import itertools
+import threading
+import time
 # from marhs.utils.helper import suppress_stdout
 
 
@@ -22,18 +30,52 @@ class Publisher:
     '''
     Publisher client parent class for publishing messages to an MQTT broker.
 
+    Messages can be published asynchronously with 'publish_async', which encodes the message on a
+    worker pool and returns immediately. Messages on the same topic are published in the order
+    'publish_async' was called, regardless of which worker finishes encoding first.
+
     --------------------------------------------------------------------
     Parameters:
         client_id (str): The client ID to use when connecting to the broker.
         broker (str): The IP address of the MQTT broker.
         port (int): The port number of the MQTT broker.
+        executor (Executor): Worker pool for 'publish_async'. A thread pool is created on first use if not given.
+        vessel_id (str): Publish on the topics of this vessel, as given by 'topic_scheme'.
+        topic_scheme (TopicScheme): The topic templates. Defaults to 'vessel/{vessel_id}/<kind>'.
+        metrics (MetricsRegistry): Registry for the message, byte, latency and error metrics. Defaults to 'metrics.REGISTRY'.
+        trace (bool): Add a header with the client ID, a sequence number and the send time to each data object message.
+        clock (callable): Clock of the send time in the header. Must be comparable with the clock of the subscribers.
+        client_factory (callable): Creates the MQTT client from the client ID, e.g. 'LoopbackBroker.client'. Defaults to the paho Client.
+        qos (int): The QoS level of the published messages.
     --------------------------------------------------------------------
     '''
-    def __init__(self, client_id, broker, port):
-        self.client = mqtt.Client(client_id)
+    kind = None
+    topic = None
+
+    def __init__(self, client_id, broker, port, executor=None, vessel_id=None, topic_scheme=None, metrics=None,
+                 trace=True, clock=time.monotonic, client_factory=mqtt.Client, qos=0):
+        self.client = client_factory(client_id)
         self.client.on_connect = self.on_connect
+        self.client_id = client_id
+        self.metrics = ClientMetrics(metrics or REGISTRY)
+        self._topic_metrics = {}
+        self._connected = False
+        self.trace = trace
+        self.qos = qos
+        self._clock = clock
+        self._seq = itertools.count(1)
+        self._session = new_session()
         self.broker = broker
         self.port = port
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._pending_lock = threading.Lock()
+        self._pending = {}
+        # The topics whose encoded messages are being sent by a thread
+        self._sending = set()
+        self.vessel_id = vessel_id
+        if self.kind is not None:
+            self.topic = topics.resolve_topic(self.kind, vessel_id, topic_scheme)
 
     def connect(self, username, password):
         self.client.username_pw_set(f"{username}", f"{password}")
@@ -42,7 +84,9 @@ class Publisher:
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             print("Connected successfully.")
-            pass
+            if self._connected:
+                self.metrics.reconnects.labels(self.client_id).inc()
+            self._connected = True
         else:
             print(f"Connect failed with return code {rc}")
 
@@ -50,11 +94,120 @@ class Publisher:
         self.client.loop_start()
 
     def loop_stop(self):
+        # Let the pending asynchronous messages be published before disconnecting
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
         self.client.loop_stop()
         self.client.disconnect()
 
-    def publish(self, topic, payload):
-        self.client.publish(topic, payload)
+    def publish(self, topic, payload, qos=None, retain=False):
+        '''
+        Publishes a payload as is, with the QoS level of the publisher unless 'qos' is given.
+        '''
+        return self._send(topic, payload, qos, retain)
+
+    def encode(self, message, header=None):
+        '''
+        Converts a message to the payload that is published. The parent class publishes the message as is.
+        '''
+        return message
+
+    def publish_async(self, message, topic=None):
+        '''
+        Encodes the message on the worker pool and publishes it, without blocking the caller.
+
+        --------------------------------------------------------------------
+        Input:
+            message: The message to publish. A data object for the specialized publishers.
+            topic (str): The topic to publish to. Defaults to the topic of the publisher.
+        Output:
+            future (Future): Resolves to the MQTTMessageInfo of the published message, or to the
+                exception raised while encoding or publishing it.
+        --------------------------------------------------------------------
+        '''
+        if topic is None:
+            topic = self.topic
+        result = Future()
+        with self._pending_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(thread_name_prefix="mnb-encode")
+                self._owns_executor = True
+            encoded = self._executor.submit(self._encode, message, topic, self._next_header())
+            self._pending.setdefault(topic, deque()).append((encoded, result))
+        encoded.add_done_callback(lambda _: self._publish_encoded(topic))
+        return result
+
+    def _next_header(self):
+        '''
+        Returns the header of the next data object message, or None if tracing is disabled.
+        '''
+        if not self.trace or self.kind is None:
+            return None
+        return make_header(self.client_id, next(self._seq), self._clock(), self._session)
+
+    def _encode(self, message, topic, header=None):
+        '''
+        Encodes a message and records the encode latency.
+        '''
+        start = time.perf_counter()
+        with profiling.span(profiling.ENCODE, topic):
+            payload = self.encode(message, header)
+        self._metrics_of(topic)[2].observe(time.perf_counter() - start)
+        return payload
+
+    def _send(self, topic, payload, qos=None, retain=False):
+        '''
+        Publishes an encoded message and records the message and byte counts.
+        '''
+        with profiling.span(profiling.PUBLISH, topic):
+            info = self.client.publish(topic, payload, self.qos if qos is None else qos, retain)
+        messages, nbytes, _ = self._metrics_of(topic)
+        messages.inc()
+        nbytes.inc(len(payload) if payload is not None else 0)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self.metrics.dropped.labels(self.client_id).inc()
+        return info
+
+    def _metrics_of(self, topic):
+        topic_metrics = self._topic_metrics.get(topic)
+        if topic_metrics is None:
+            topic_metrics = self._topic_metrics[topic] = (
+                self.metrics.messages_sent.labels(self.client_id, topic),
+                self.metrics.bytes_sent.labels(self.client_id, topic),
+                self.metrics.encode_seconds.labels(self.client_id, topic),
+            )
+        return topic_metrics
+
+    def _publish_encoded(self, topic):
+        '''
+        Publishes the encoded messages at the head of the topic queue, stopping at the first message
+        that is still being encoded, so that the messages of a topic are published in order.
+
+        The messages are sent outside the lock, by one thread per topic at a time. A message encoded
+        while another thread sends is left to that thread, which looks for ready messages again
+        before it stops.
+        '''
+        with self._pending_lock:
+            if topic in self._sending:
+                return
+            self._sending.add(topic)
+        while True:
+            with self._pending_lock:
+                pending = self._pending.get(topic)
+                ready = []
+                while pending and pending[0][0].done():
+                    ready.append(pending.popleft())
+                if not ready:
+                    self._sending.discard(topic)
+                    if pending is not None and not pending:
+                        del self._pending[topic]
+                    return
+            for encoded, result in ready:
+                try:
+                    result.set_result(self._send(topic, encoded.result()))
+                except Exception as e:
+                    result.set_exception(e)
 
 
 class TrajectoryPublisher(Publisher):
@@ -66,15 +219,31 @@ class TrajectoryPublisher(Publisher):
         client_id (str): The client ID to use when connecting to the broker.
         broker (str): The IP address of the MQTT broker.
         port (int): The port number of the MQTT broker.
+        executor (Executor): Worker pool for 'publish_async'.
+        vessel_id (str): Publish on the topics of this vessel. The legacy topic 'trajectory/topic' is used if not given.
+        topic_scheme (TopicScheme): The topic templates used with 'vessel_id'.
+        metrics (MetricsRegistry): Registry for the metrics.
+        trace (bool): Add a header with the client ID, a sequence number and the send time to each message.
+        clock (callable): Clock of the send time in the header.
+        client_factory (callable): Creates the MQTT client from the client ID.
+        qos (int): The QoS level of the published messages.
     --------------------------------------------------------------------
     '''
-    def publish(self, trajectory):
+    kind = topics.TRAJECTORY
+    topic = "trajectory/topic"
+
+    def publish(self, trajectory, topic=None):
+        if topic is None:
+            topic = self.topic
+        mqtt_str = self._encode(trajectory, topic, self._next_header())
+        return self._send(topic, mqtt_str)
+
+    def encode(self, trajectory, header=None):
         # Check if trajectory is a Trajectory object
         if not isinstance(trajectory, mnb.Trajectory):
             raise TypeError("trajectory must be a Trajectory object.")
         # Convert trajectory to custom NMEA string
-        mqtt_str = mnb.from_traj_to_mqtt_str(trajectory)
-        self.client.publish("trajectory/topic", mqtt_str)
+        return mnb.from_traj_to_mqtt_str(trajectory, header)
 
 
 class ShipStatePublisher(Publisher):
@@ -86,15 +255,31 @@ class ShipStatePublisher(Publisher):
         client_id (str): The client ID to use when connecting to the broker.
         broker (str): The IP address of the MQTT broker.
         port (int): The port number of the MQTT broker.
+        executor (Executor): Worker pool for 'publish_async'.
+        vessel_id (str): Publish on the topics of this vessel. The legacy topic 'ship_state/topic' is used if not given.
+        topic_scheme (TopicScheme): The topic templates used with 'vessel_id'.
+        metrics (MetricsRegistry): Registry for the metrics.
+        trace (bool): Add a header with the client ID, a sequence number and the send time to each message.
+        clock (callable): Clock of the send time in the header.
+        client_factory (callable): Creates the MQTT client from the client ID.
+        qos (int): The QoS level of the published messages.
     --------------------------------------------------------------------
     '''
-    def publish(self, ship_state):
+    kind = topics.SHIP_STATE
+    topic = "ship_state/topic"
+
+    def publish(self, ship_state, topic=None):
+        if topic is None:
+            topic = self.topic
+        mqtt_str = self._encode(ship_state, topic, self._next_header())
+        return self._send(topic, mqtt_str)
+
+    def encode(self, ship_state, header=None):
         # Check if ship_state is a ShipState object
         if not isinstance(ship_state, mnb.ShipState):
             raise TypeError("ship_state must be a ShipState object.")
         # Convert ship_state to custom NMEA string
-        mqtt_str = mnb.from_shipstate_to_mqtt_str(ship_state)
-        self.client.publish("ship_state/topic", mqtt_str)
+        return mnb.from_shipstate_to_mqtt_str(ship_state, header)
 
 
 class WindStatePublisher(Publisher):
@@ -106,12 +291,28 @@ class WindStatePublisher(Publisher):
         client_id (str): The client ID to use when connecting to the broker.
         broker (str): The IP address of the MQTT broker.
         port (int): The port number of the MQTT broker.
+        executor (Executor): Worker pool for 'publish_async'.
+        vessel_id (str): Publish on the topics of this vessel. The legacy topic 'wind_state/topic' is used if not given.
+        topic_scheme (TopicScheme): The topic templates used with 'vessel_id'.
+        metrics (MetricsRegistry): Registry for the metrics.
+        trace (bool): Add a header with the client ID, a sequence number and the send time to each message.
+        clock (callable): Clock of the send time in the header.
+        client_factory (callable): Creates the MQTT client from the client ID.
+        qos (int): The QoS level of the published messages.
     --------------------------------------------------------------------
     '''
-    def publish(self, wind_state):
+    kind = topics.WIND_STATE
+    topic = "wind_state/topic"
+
+    def publish(self, wind_state, topic=None):
+        if topic is None:
+            topic = self.topic
+        mqtt_str = self._encode(wind_state, topic, self._next_header())
+        return self._send(topic, mqtt_str)
+
+    def encode(self, wind_state, header=None):
         # Check if wind_state is a WindState object
         if not isinstance(wind_state, mnb.WindState):
             raise TypeError("wind_state must be a WindState object.")
         # Convert wind_state to custom NMEA string
-        mqtt_str = mnb.from_windstate_to_mqtt_str(wind_state)
-        self.client.publish("wind_state/topic", mqtt_str)
\ No newline at end of file
+        return mnb.from_windstate_to_mqtt_str(wind_state, header)
\ No newline at end of file
@@ -0,0 +1,487 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+'''
+Binary traffic recorder. The raw payloads received from the broker are appended, with their receive
+timestamps, to a log made of segment files. Each segment has a sparse time index, so a reader can
+memory-map the log, seek to any timestamp in O(log n) and republish the traffic with its original
+timing through a publisher.
+
+Record from the command line:
+
+    python -m mqtt_nmea_bridge.recorder record docking_log --broker localhost
+
+and replay from a timestamp at twice the original speed:
+
+    python -m mqtt_nmea_bridge.recorder replay docking_log --start 1690000000 --sim-speed 2
+'''
+import paho.mqtt.client as mqtt
+from mqtt_nmea_bridge import topics
+from mqtt_nmea_bridge.publishers import Publisher
+from mqtt_nmea_bridge.subscribers import Subscriber
+from mqtt_nmea_bridge.replay import ReplayScheduler
+import threading
+import argparse
+import bisect
+import struct
+import mmap
+import time
+import os
+
+
+# Segment file header: magic and format version
+SEGMENT_MAGIC = b"MNBLOG\x00\x01"
+SEGMENT_SUFFIX = ".mnblog"
+INDEX_SUFFIX = ".mnbidx"
+
+# Record header: receive timestamp, topic length, payload length, flags (QoS in bits 0-1, retain in bit 2)
+_RECORD = struct.Struct("<dHIB")
+# Index entry: timestamp and byte offset of a record in the segment
+_INDEX_ENTRY = struct.Struct("<dQ")
+
+
+class LogWriter:
+    '''
+    Appends records to a segmented traffic log.
+
+    The log is a folder of segment files named by their sequence number. A new segment is started
+    when the current one would grow past 'segment_size', and existing segments are never modified:
+    a writer opened on an existing log starts a new segment after the last one.
+
+    Every 'index_interval' bytes, the timestamp and offset of the next record is added to the index
+    file of the segment. The timestamps are made non-decreasing, so that the log can be searched by
+    time even if the clock steps backwards.
+
+    --------------------------------------------------------------------
+    Parameters:
+        path (str): The folder of the log. Created if it does not exist.
+        segment_size (int): Maximum size of a segment file in bytes.
+        index_interval (int): Bytes between the index entries.
+        fsync (bool): Sync the files to disk on every 'flush'.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, path, segment_size=64 * 1024 * 1024, index_interval=64 * 1024, fsync=False):
+        self.path = path
+        self.segment_size = segment_size
+        self.index_interval = index_interval
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._segment = None
+        self._index = None
+        self._last_timestamp = float("-inf")
+        self.records = 0
+        os.makedirs(path, exist_ok=True)
+        segments = _segment_numbers(path)
+        self._segment_number = segments[-1] + 1 if segments else 0
+        self._open_segment()
+
+    def write(self, topic, payload, timestamp=None, qos=0, retain=False):
+        '''
+        Appends a record to the log.
+
+        --------------------------------------------------------------------
+        Input:
+            topic (str): The topic of the message.
+            payload (bytes): The raw payload of the message.
+            timestamp (float): The receive time in seconds since the epoch. Defaults to now.
+            qos (int): The QoS level of the message.
+            retain (bool): The retain flag of the message.
+        --------------------------------------------------------------------
+        '''
+        topic = topic.encode()
+        if isinstance(payload, str):
+            payload = payload.encode()
+        size = _RECORD.size + len(topic) + len(payload)
+        with self._lock:
+            if self._segment is None:
+                raise ValueError("The log writer is closed.")
+            timestamp = time.time() if timestamp is None else timestamp
+            timestamp = max(timestamp, self._last_timestamp)
+            self._last_timestamp = timestamp
+            if self._offset + size > self.segment_size and self._offset > len(SEGMENT_MAGIC):
+                self._roll()
+            if self._offset >= self._next_index:
+                self._index.write(_INDEX_ENTRY.pack(timestamp, self._offset))
+                self._next_index = self._offset + self.index_interval
+            self._segment.write(_RECORD.pack(timestamp, len(topic), len(payload), (qos & 3) | (bool(retain) << 2)))
+            self._segment.write(topic)
+            self._segment.write(payload)
+            self._offset += size
+            self.records += 1
+
+    def on_message(self, client, userdata, msg):
+        '''
+        Records a message. Can be used directly as the 'on_message' callback of an MQTT client.
+        '''
+        self.write(msg.topic, msg.payload, qos=msg.qos, retain=msg.retain)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._segment is not None:
+                self._flush()
+                self._segment.close()
+                self._index.close()
+                self._segment = None
+                self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _flush(self):
+        # The segment is flushed first, so an index entry never points past the end of the segment
+        self._segment.flush()
+        if self.fsync:
+            os.fsync(self._segment.fileno())
+        self._index.flush()
+        if self.fsync:
+            os.fsync(self._index.fileno())
+
+    def _roll(self):
+        self._flush()
+        self._segment.close()
+        self._index.close()
+        self._segment_number += 1
+        self._open_segment()
+
+    def _open_segment(self):
+        base = os.path.join(self.path, f"{self._segment_number:08d}")
+        self._segment = open(base + SEGMENT_SUFFIX, "xb")
+        self._index = open(base + INDEX_SUFFIX, "xb")
+        self._segment.write(SEGMENT_MAGIC)
+        self._offset = len(SEGMENT_MAGIC)
+        self._next_index = self._offset
+
+
+class LogRecord:
+    '''
+    A record of the traffic log.
+
+    --------------------------------------------------------------------
+    Parameters:
+
+    timestamp (float): Receive time in seconds since the epoch
+    topic (str): The topic of the message
+    payload (bytes): The raw payload of the message
+    qos (int): The QoS level of the message
+    retain (bool): The retain flag of the message
+    --------------------------------------------------------------------
+    '''
+    __slots__ = ("timestamp", "topic", "payload", "qos", "retain")
+
+    def __init__(self, timestamp, topic, payload, qos=0, retain=False):
+        self.timestamp = timestamp
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+    def __repr__(self):
+        return f"LogRecord(timestamp={self.timestamp!r}, topic={self.topic!r}, payload={len(self.payload)} bytes)"
+
+
+class _Segment:
+    '''
+    A memory-mapped segment file and its index.
+    '''
+    def __init__(self, base):
+        self.base = base
+        with open(base + SEGMENT_SUFFIX, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size > 0 else b""
+        if self.size > 0 and self.data[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            raise ValueError(f"'{base + SEGMENT_SUFFIX}' is not a traffic log segment.")
+        self.timestamps = []
+        self.offsets = []
+        if os.path.exists(base + INDEX_SUFFIX):
+            with open(base + INDEX_SUFFIX, "rb") as f:
+                index = f.read()
+            # A partly written entry at the end of the index is ignored
+            index = index[:len(index) - len(index) % _INDEX_ENTRY.size]
+            for timestamp, offset in _INDEX_ENTRY.iter_unpack(index):
+                if offset >= self.size:
+                    break
+                self.timestamps.append(timestamp)
+                self.offsets.append(offset)
+        if not self.offsets and self.size > len(SEGMENT_MAGIC):
+            # Missing index, e.g. after a crash before the first flush: index the first record
+            first = self.record_at(len(SEGMENT_MAGIC))
+            if first is not None:
+                self.timestamps.append(first[0].timestamp)
+                self.offsets.append(len(SEGMENT_MAGIC))
+
+    @property
+    def first_timestamp(self):
+        return self.timestamps[0] if self.timestamps else None
+
+    def record_at(self, offset):
+        '''
+        Returns the record at an offset and the offset of the next record, or None at the end of
+        the segment or at a partly written record.
+        '''
+        end = offset + _RECORD.size
+        if end > self.size:
+            return None
+        timestamp, topic_len, payload_len, flags = _RECORD.unpack_from(self.data, offset)
+        topic_end = end + topic_len
+        payload_end = topic_end + payload_len
+        if payload_end > self.size:
+            return None
+        record = LogRecord(timestamp, self.data[end:topic_end].decode(), self.data[topic_end:payload_end],
+                           flags & 3, bool(flags & 4))
+        return record, payload_end
+
+    def seek(self, timestamp):
+        '''
+        Returns the offset of the first record at or after a timestamp, or None if there is none.
+        '''
+        # The last indexed record before the timestamp, then a scan of at most one index interval
+        i = bisect.bisect_left(self.timestamps, timestamp) - 1
+        offset = self.offsets[max(i, 0)] if self.offsets else len(SEGMENT_MAGIC)
+        while True:
+            result = self.record_at(offset)
+            if result is None:
+                return None
+            record, next_offset = result
+            if record.timestamp >= timestamp:
+                return offset
+            offset = next_offset
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+class LogReader:
+    '''
+    Reads a segmented traffic log through memory maps.
+
+    The segments are mapped when the reader is opened, so records appended afterwards are not seen.
+    A partly written record at the end of a segment, e.g. after a crash, ends the segment.
+
+    --------------------------------------------------------------------
+    Parameters:
+        path (str): The folder of the log.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._segments = [_Segment(os.path.join(path, f"{number:08d}")) for number in _segment_numbers(path)]
+        self._segments = [segment for segment in self._segments if segment.first_timestamp is not None]
+        self._first_timestamps = [segment.first_timestamp for segment in self._segments]
+
+    @property
+    def start(self):
+        '''
+        Timestamp of the first record, or None if the log is empty.
+        '''
+        return self._first_timestamps[0] if self._segments else None
+
+    def records(self, start=None, end=None):
+        '''
+        Iterates over the records of the log, from the first record at or after 'start' to the
+        last record before 'end'.
+
+        --------------------------------------------------------------------
+        Input:
+            start (float): Timestamp to seek to. Defaults to the start of the log.
+            end (float): Timestamp to stop at. Defaults to the end of the log.
+        Output:
+            records (iterator of LogRecord): The records, sorted by timestamp.
+        --------------------------------------------------------------------
+        '''
+        if start is None:
+            first, offset = 0, len(SEGMENT_MAGIC)
+        else:
+            # The last segment starting before the timestamp may still hold records after it
+            first = max(bisect.bisect_left(self._first_timestamps, start) - 1, 0)
+            offset = None
+            while first < len(self._segments):
+                offset = self._segments[first].seek(start)
+                if offset is not None:
+                    break
+                first += 1
+        for segment in self._segments[first:]:
+            while True:
+                result = segment.record_at(offset)
+                if result is None:
+                    break
+                record, offset = result
+                if end is not None and record.timestamp >= end:
+                    return
+                yield record
+            offset = len(SEGMENT_MAGIC)
+
+    def __iter__(self):
+        return self.records()
+
+    def close(self):
+        for segment in self._segments:
+            segment.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RecorderSubscriber(Subscriber):
+    '''
+    Client class for recording the raw traffic of the bridge topics to a traffic log.
+
+    The payloads are written as received, without decoding, so a replay reproduces them exactly.
+
+    --------------------------------------------------------------------
+    Parameters:
+        client_id (str): The client ID to use when connecting to the broker.
+        broker (str): The IP address of the MQTT broker.
+        port (int): The port number of the MQTT broker.
+        path (str): The folder of the log.
+        subscriptions (lst of str): The topic filters to record. Defaults to the topics of every
+            vessel in 'topic_scheme' and the legacy topics.
+        topic_scheme (TopicScheme): The topic templates of the default subscriptions.
+        segment_size (int): Maximum size of a segment file in bytes.
+        index_interval (int): Bytes between the index entries.
+        flush_interval (float): Seconds between flushes of the log to disk.
+        metrics (MetricsRegistry): Registry for the metrics.
+        client_factory (callable): Creates the MQTT client from the client ID.
+        qos (int): The maximum QoS level of the subscriptions.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, client_id, broker, port, path, subscriptions=None, topic_scheme=None,
+                 segment_size=64 * 1024 * 1024, index_interval=64 * 1024, flush_interval=1.0, metrics=None,
+                 client_factory=mqtt.Client, qos=0):
+        super().__init__(client_id, broker, port, metrics=metrics, client_factory=client_factory, qos=qos)
+        if subscriptions is None:
+            scheme = topic_scheme or topics.DEFAULT_SCHEME
+            subscriptions = [scheme.subscription(kind) for kind in topics.KINDS] + list(topics.LEGACY_TOPICS.values())
+        self.subscriptions = list(subscriptions)
+        self.writer = LogWriter(path, segment_size, index_interval)
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def on_connect(self, client, userdata, flags, rc):
+        super().on_connect(client, userdata, flags, rc)
+        if rc == 0:
+            client.subscribe([(topic, self.qos) for topic in self.subscriptions])
+            print(f"Subscribed to topics {self.subscriptions}")
+
+    def on_message(self, client, userdata, msg):
+        received, nbytes, _, _ = self._metrics_of(msg.topic)
+        received.inc()
+        nbytes.inc(len(msg.payload))
+        self.writer.on_message(client, userdata, msg)
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self.writer.flush()
+            self._last_flush = now
+
+    def loop_stop(self):
+        super().loop_stop()
+        self.writer.flush()
+
+    def close(self):
+        '''
+        Disconnects from the broker and closes the log.
+        '''
+        self.client.disconnect()
+        self.writer.close()
+
+
+def replay_log(path, publisher, start=None, end=None, scheduler=None):
+    '''
+    Republishes the records of a traffic log with their original timing.
+
+    The payloads are published unchanged on their recorded topics, with their recorded QoS level and
+    retain flag, with 'Publisher.publish', also if 'publisher' is one of the specialized publishers.
+
+    --------------------------------------------------------------------
+    Input:
+        path (str): The folder of the log.
+        publisher (Publisher): The connected publisher to republish with.
+        start (float): Timestamp to start the replay at. Defaults to the start of the log.
+        end (float): Timestamp to stop the replay at. Defaults to the end of the log.
+        scheduler (ReplayScheduler): The scheduler, which sets the replay speed. Defaults to real time.
+    Output:
+        stats (ReplayStats): The timing report of the replay.
+    --------------------------------------------------------------------
+    '''
+    if scheduler is None:
+        scheduler = ReplayScheduler()
+    with LogReader(path) as reader:
+        events = ((record.timestamp, record) for record in reader.records(start, end))
+        return scheduler.run(events, lambda record: Publisher.publish(publisher, record.topic, record.payload,
+                                                                        record.qos, record.retain))
+
+
+def _segment_numbers(path):
+    numbers = []
+    for name in os.listdir(path):
+        stem, suffix = os.path.splitext(name)
+        if suffix == SEGMENT_SUFFIX and stem.isdigit():
+            numbers.append(int(stem))
+    return sorted(numbers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record the traffic of the bridge topics, or replay a recording.")
+    parser.add_argument("command", choices=["record", "replay", "info"], help="What to do with the log.")
+    parser.add_argument("path", help="The folder of the log.")
+    parser.add_argument("--broker", default="localhost", help="The IP address of the MQTT broker.")
+    parser.add_argument("--port", type=int, default=1883, help="The port number of the MQTT broker.")
+    parser.add_argument("--username", default="", help="The username of the broker.")
+    parser.add_argument("--password", default="", help="The password of the broker.")
+    parser.add_argument("--topics", nargs="+", help="Topic filters to record. Defaults to the bridge topics.")
+    parser.add_argument("--start", type=float, help="Timestamp to start the replay at.")
+    parser.add_argument("--end", type=float, help="Timestamp to stop the replay at.")
+    parser.add_argument("--sim-speed", type=float, default=1.0, help="Replay speed. 1.0 is the original timing.")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        recorder = RecorderSubscriber("mnb_recorder", args.broker, args.port, args.path, args.topics)
+        recorder.connect(args.username, args.password)
+        try:
+            recorder.client.loop_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            recorder.close()
+            print(f"Recorded {recorder.writer.records} messages.")
+    elif args.command == "replay":
+        publisher = Publisher("mnb_replay", args.broker, args.port)
+        publisher.connect(args.username, args.password)
+        publisher.loop_start()
+        stats = replay_log(args.path, publisher, args.start, args.end, ReplayScheduler(args.sim_speed))
+        publisher.loop_stop()
+        print(f"Replayed {stats.sent} messages in {stats.elapsed:.1f} s, jitter {stats.jitter*1e3:.2f} ms.")
+    else:
+        with LogReader(args.path) as reader:
+            count = 0
+            last = None
+            for record in reader:
+                count += 1
+                last = record.timestamp
+            print(f"{count} records from {reader.start} to {last}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge import datasets
+from dataclasses import dataclass
+import threading
+import heapq
+import math
+import time
+
+
+@dataclass
+class ReplayStats:
+    '''
+    Timing report of a replay run.
+
+    Lateness is measured as the time between the scheduled deadline of a message and the moment
+    it was handed to 'send'. The jitter is the standard deviation of the lateness.
+
+    --------------------------------------------------------------------
+    Parameters:
+
+    sent (int): Number of messages sent
+    elapsed (float): Wall clock seconds from the first to the last send
+    span (float): Dataset seconds from the first to the last sent timestamp
+    sim_speed (float): The simulation speed used for the replay
+    mean_lateness (float): In seconds
+    max_lateness (float): In seconds
+    jitter (float): In seconds
+    --------------------------------------------------------------------
+    '''
+    sent: int = 0
+    elapsed: float = 0.0
+    span: float = 0.0
+    sim_speed: float = 1.0
+    mean_lateness: float = 0.0
+    max_lateness: float = 0.0
+    jitter: float = 0.0
+
+    @property
+    def rate(self):
+        '''
+        Achieved send rate in messages per wall clock second.
+        '''
+        if self.elapsed <= 0:
+            return 0.0
+        return (self.sent - 1) / self.elapsed
+
+    @property
+    def target_rate(self):
+        '''
+        Send rate requested by the timestamps and the simulation speed.
+        '''
+        if self.span <= 0:
+            return 0.0
+        return (self.sent - 1) * self.sim_speed / self.span
+
+
+class ReplayScheduler:
+    '''
+    Replays timestamped items at absolute deadlines on a monotonic clock.
+
+    The deadline of an item with timestamp 't' is 'start + (t - t0) / sim_speed', where 't0' is the
+    first timestamp and 'start' is the monotonic time of the first send. Since every deadline is
+    computed from the start of the replay, the time spent encoding and publishing does not add up
+    as drift. A late item is sent immediately, and the following items keep their original deadlines.
+
+    The scheduler sleeps until shortly before each deadline, and spins for the last 'spin' seconds
+    to get below the resolution of the sleep call.
+
+    --------------------------------------------------------------------
+    Parameters:
+        sim_speed (float): 1 = real-time, 2 = 2x real-time, etc.
+        spin (float): Seconds before each deadline to stop sleeping and spin. 0 disables spinning.
+        clock (callable): Monotonic clock returning seconds.
+        sleep (callable): Sleep function taking seconds.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, sim_speed=1.0, spin=0.0002, clock=time.monotonic, sleep=time.sleep):
+        if sim_speed <= 0:
+            raise ValueError("sim_speed must be positive.")
+        self.sim_speed = sim_speed
+        self.spin = spin
+        self._clock = clock
+        self._sleep = sleep
+        self._stop_event = threading.Event()
+        self.stats = ReplayStats(sim_speed=sim_speed)
+
+    def stop(self):
+        '''
+        Stop a running replay before the next item is sent.
+        '''
+        self._stop_event.set()
+
+    def run(self, events, send):
+        '''
+        Send every item of 'events' at its deadline.
+
+        --------------------------------------------------------------------
+        Input:
+            events (iterable of (float, object)): Timestamps in seconds and the items to send,
+                sorted by timestamp. The iterable is consumed lazily.
+            send (callable): Called with each item at its deadline.
+        Output:
+            stats (ReplayStats): The timing report of the replay.
+        --------------------------------------------------------------------
+        '''
+        self._stop_event.clear()
+        self.stats = stats = ReplayStats(sim_speed=self.sim_speed)
+        clock = self._clock
+        t0 = None
+        start = None
+        mean = 0.0
+        m2 = 0.0
+        now = 0.0
+        timestamp = 0.0
+
+        for timestamp, item in events:
+            if self._stop_event.is_set():
+                break
+            if t0 is None:
+                t0 = timestamp
+                start = clock()
+            deadline = start + (timestamp - t0) / self.sim_speed
+            self._wait_until(deadline)
+
+            now = clock()
+            send(item)
+
+            # Welford's running mean and variance of the lateness
+            lateness = now - deadline
+            stats.sent += 1
+            delta = lateness - mean
+            mean += delta / stats.sent
+            m2 += delta * (lateness - mean)
+            if lateness > stats.max_lateness:
+                stats.max_lateness = lateness
+
+        if stats.sent > 0:
+            stats.elapsed = now - start
+            stats.span = timestamp - t0
+            stats.mean_lateness = mean
+            stats.jitter = math.sqrt(m2 / stats.sent)
+        return stats
+
+    def _wait_until(self, deadline):
+        remaining = deadline - self._clock()
+        if remaining > self.spin:
+            self._sleep(remaining - self.spin)
+        while self._clock() < deadline:
+            pass
+
+
+# *************************************************************************************************
+# Multi-stream replay
+# *************************************************************************************************
+
+def merge_streams(*streams):
+    '''
+    Lazily merges several timestamped streams into one stream sorted by time.
+
+    Each stream must be sorted by timestamp. Only the next event of every stream is held in memory,
+    so the streams can be arbitrarily long. Events with equal timestamps are yielded in the order
+    of the streams.
+
+    --------------------------------------------------------------------
+    Input:
+        *streams (iterables of (float, object)): The timestamped streams.
+    Output:
+        events (iterator of (float, object)): The merged stream.
+    --------------------------------------------------------------------
+    '''
+    return heapq.merge(*streams, key=lambda event: event[0])
+
+
+def replay_streams(streams, scheduler=None):
+    '''
+    Replays several timestamped streams, each through its own publisher, interleaved by time.
+
+    --------------------------------------------------------------------
+    Input:
+        streams (lst of (iterable, Publisher)): Pairs of a timestamped stream and the publisher
+            the items of the stream are published with.
+        scheduler (ReplayScheduler): The scheduler to use. Defaults to a real-time scheduler.
+    Output:
+        stats (ReplayStats): The timing report of the replay.
+    --------------------------------------------------------------------
+    '''
+    if scheduler is None:
+        scheduler = ReplayScheduler()
+    routed = [_route(events, publisher) for events, publisher in streams]
+    return scheduler.run(merge_streams(*routed), _publish)
+
+
+def ship_state_source(path, nr_of_actuators=7):
+    '''
+    Streams ship states from a dataset CSV file, one line at a time.
+
+    The CSV file must have the 'timestamp, X, CS, U' layout of the files in 'example_data'.
+
+    --------------------------------------------------------------------
+    Input:
+        path (str): Path to the CSV file.
+        nr_of_actuators (int): Number of actuators of the vessel.
+    Output:
+        events (iterator of (float, ShipState)): The timestamped ship states.
+    --------------------------------------------------------------------
+    '''
+    for data_point in data_point_source(path):
+        yield data_point[0], datasets.data_point_to_shipstate(data_point, nr_of_actuators)
+
+
+def data_point_source(path):
+    '''
+    Streams the data points of a dataset CSV file. The file is parsed in blocks of 1024 lines, so
+    the first data point is available at once and memory use does not depend on the file size.
+
+    --------------------------------------------------------------------
+    Input:
+        path (str): Path to the CSV file.
+    Output:
+        data_points (iterator of lsts of floats): Data points on the format [time, X, CS, U].
+    --------------------------------------------------------------------
+    '''
+    yield from datasets.read_data_points(path, block_size=1024)
+
+
+def wind_state_source(wind_states):
+    '''
+    Streams wind states, timestamped by their 'time' field.
+
+    --------------------------------------------------------------------
+    Input:
+        wind_states (iterable of WindState): The wind states, sorted by time.
+    Output:
+        events (iterator of (float, WindState)): The timestamped wind states.
+    --------------------------------------------------------------------
+    '''
+    for wind_state in wind_states:
+        yield wind_state.time, wind_state
+
+
+def trajectory_source(moving_trajectory, data_points, publish_interval):
+    '''
+    Streams the trajectory horizons of a moving trajectory.
+
+    The first horizon is the current trajectory of 'moving_trajectory'. Every 'publish_interval'
+    seconds, the moving trajectory is updated with the current data point, and the new horizon
+    is yielded. The stream ends when the moving trajectory is empty.
+
+    --------------------------------------------------------------------
+    Input:
+        moving_trajectory (MovingTrajectory): The moving trajectory, initialized at the first data point.
+        data_points (iterable of lsts of floats): The data points of the vessel, on the dataset format.
+        publish_interval (float): The interval (in seconds) between each horizon.
+    Output:
+        events (iterator of (float, Trajectory)): The timestamped trajectory horizons.
+    --------------------------------------------------------------------
+    '''
+    next_time = None
+    for data_point in data_points:
+        if next_time is not None:
+            if data_point[0] < next_time:
+                continue
+            moving_trajectory.update_moving_trajectory(data_point)
+        if len(moving_trajectory) == 0:
+            return
+        yield data_point[0], moving_trajectory.trajectory
+        next_time = data_point[0] + publish_interval
+
+
+def _route(events, publisher):
+    for timestamp, item in events:
+        yield timestamp, (publisher, item)
+
+
+def _publish(routed_item):
+    publisher, item = routed_item
+    publisher.publish(item)
+
+
+# \************************************************************************************************
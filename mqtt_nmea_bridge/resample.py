@@ -0,0 +1,226 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+'''
+Resampling of datasets and trajectories onto a uniform or custom time grid.
+
+All fields are resampled in one pass over the time grid: the positions, velocities and speed are
+interpolated linearly, the heading and the course over ground are interpolated along the shortest
+turn, so that e.g. 179 and -179 degrees are 2 degrees apart, and the actuator values are held from
+the last waypoint at or before each time (zero-order hold), since a setpoint is not interpolated.
+
+The angles are in degrees like the datasets in 'example_data'. Give 'period=2*math.pi' for radians.
+'''
+import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge.datasets import Dataset
+from dataclasses import replace
+from datetime import datetime
+import numpy as np
+import math
+
+
+# Columns of a Dataset holding angles, the heading in X and the course over ground in CS
+_ANGLE_COLUMNS = (3, 7)
+
+
+def uniform_grid(start, end, step):
+    '''
+    Returns the times from 'start' to 'end', both included if 'end - start' is a multiple of 'step'.
+    '''
+    if step <= 0:
+        raise ValueError("The step of the time grid must be positive.")
+    n = int(np.floor((end - start)/step + 1e-9)) + 1
+    return start + step*np.arange(max(n, 0))
+
+
+def interpolate_angles(grid, time, angles, period=360.0):
+    '''
+    Interpolates angles along the shortest turn between the samples, wrapped to [-period/2, period/2).
+
+    --------------------------------------------------------------------
+    Input:
+        grid (array of floats): The times to interpolate at.
+        time (array of floats): The times of the samples, increasing.
+        angles (array of floats): The angles of the samples.
+        period (float): 360 for degrees, 2*pi for radians.
+    Output:
+        angles (np.ndarray): The interpolated angles.
+    --------------------------------------------------------------------
+    '''
+    return wrap_angles(np.interp(grid, time, _unwrap(angles, period)), period)
+
+
+def wrap_angles(angles, period=360.0):
+    '''
+    Wraps angles to [-period/2, period/2).
+    '''
+    half = period/2
+    return (np.asarray(angles, dtype=np.float64) + half) % period - half
+
+
+def hold(grid, time, values):
+    '''
+    Returns the values of the last samples at or before each time of the grid (zero-order hold).
+
+    Times before the first sample get the first sample.
+
+    --------------------------------------------------------------------
+    Input:
+        grid (array of floats): The times to sample at.
+        time (array of floats): The times of the samples, increasing.
+        values (array of floats): Array with one row per sample.
+    Output:
+        values (np.ndarray): Array with one row per time of the grid.
+    --------------------------------------------------------------------
+    '''
+    indices = np.searchsorted(time, grid, side="right") - 1
+    return np.asarray(values)[np.clip(indices, 0, None)]
+
+
+def resample_dataset(dataset, step=None, grid=None, period=360.0):
+    '''
+    Resamples a Dataset onto a time grid.
+
+    --------------------------------------------------------------------
+    Input:
+        dataset (Dataset): The dataset, sorted by time.
+        step (float): The step in seconds of a uniform grid from the first to the last timestamp.
+        grid (array of floats): A custom time grid, instead of 'step'.
+        period (float): The period of the heading and the course over ground, 360 for degrees.
+    Output:
+        dataset (Dataset): The resampled dataset, with one row per time of the grid.
+    --------------------------------------------------------------------
+    '''
+    time = dataset.time
+    if grid is None:
+        if step is None:
+            raise ValueError("Give the 'step' of a uniform grid or a custom 'grid'.")
+        grid = uniform_grid(time[0], time[-1], step) if len(dataset) else np.empty(0)
+    grid = np.asarray(grid, dtype=np.float64)
+    data = dataset.data
+    out = np.empty((grid.size, data.shape[1]))
+    out[:, 0] = grid
+    if len(dataset) == 0:
+        if grid.size:
+            raise ValueError("Can not resample an empty dataset.")
+        return Dataset(out)
+    continuous = data[:, 1:9].copy()
+    for column in _ANGLE_COLUMNS:
+        continuous[:, column - 1] = _unwrap(continuous[:, column - 1], period)
+    if len(dataset) == 1:
+        out[:, 1:9] = continuous[0]
+    else:
+        # All continuous fields are interpolated with the same indices and weights
+        indices = np.clip(np.searchsorted(time, grid, side="right"), 1, len(time) - 1)
+        t0, t1 = time[indices - 1], time[indices]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight = np.clip(np.where(t1 > t0, (grid - t0)/(t1 - t0), 1.0), 0.0, 1.0)[:, None]
+        out[:, 1:9] = continuous[indices - 1]*(1 - weight) + continuous[indices]*weight
+    for column in _ANGLE_COLUMNS:
+        out[:, column] = wrap_angles(out[:, column], period)
+    out[:, 9:] = hold(grid, time, data[:, 9:])
+    return Dataset(out)
+
+
+def resample_trajectory(trajectory, step=None, grid=None, period=360.0):
+    '''
+    Resamples the waypoints of a Trajectory onto a time grid, see 'resample_dataset'.
+
+    A course over ground or speed over ground of None is interpolated as missing, and is None at
+    the times next to it.
+
+    --------------------------------------------------------------------
+    Input:
+        trajectory (Trajectory): The trajectory, sorted by time.
+        step (float): The step in seconds of a uniform grid from the first to the last waypoint.
+        grid (array of floats): A custom time grid, instead of 'step'.
+        period (float): The period of the heading and the course over ground, 360 for degrees.
+    Output:
+        trajectory (Trajectory): The resampled trajectory.
+    --------------------------------------------------------------------
+    '''
+    shipstates = trajectory.shipstates
+    if not shipstates:
+        return mnb.Trajectory([])
+    nr_of_actuators = shipstates[0].nr_of_actuators
+    rows = [[s.time, s.latitude, s.longitude, s.heading, np.nan, np.nan, np.nan,
+             np.nan if s.cog is None else s.cog, np.nan if s.sog is None else s.sog] + list(s.actuator_values)
+            for s in shipstates]
+    resampled = resample_dataset(Dataset(rows), step, grid, period)
+    result = []
+    for row in resampled.data.tolist():
+        cog, sog = row[7], row[8]
+        result.append(mnb.ShipState(time=row[0],
+                                    latitude=row[1],
+                                    longitude=row[2],
+                                    heading=row[3],
+                                    cog=None if math.isnan(cog) else cog,
+                                    sog=None if math.isnan(sog) else sog,
+                                    nr_of_actuators=nr_of_actuators,
+                                    actuator_values=row[9:]))
+    return mnb.Trajectory(result)
+
+
+def to_relative_time(time, epoch=None):
+    '''
+    Converts absolute times to seconds since an epoch.
+
+    --------------------------------------------------------------------
+    Input:
+        time (float / array of floats): In UTC seconds since 1970-01-01 00:00:00.
+        epoch (float / datetime): The epoch, in UTC seconds or as a timezone aware datetime. The first time if None.
+    Output:
+        time (np.ndarray): In seconds since the epoch.
+        epoch (float): The epoch in UTC seconds.
+    --------------------------------------------------------------------
+    '''
+    time = np.asarray(time, dtype=np.float64)
+    if epoch is None:
+        epoch = float(time.flat[0])
+    elif isinstance(epoch, datetime):
+        epoch = epoch.timestamp()
+    return time - epoch, epoch
+
+
+def to_absolute_time(time, epoch):
+    '''
+    Converts seconds since an epoch to UTC seconds since 1970-01-01 00:00:00. The inverse of 'to_relative_time'.
+    '''
+    if isinstance(epoch, datetime):
+        epoch = epoch.timestamp()
+    return np.asarray(time, dtype=np.float64) + epoch
+
+
+def shift_time(data, offset):
+    '''
+    Returns a copy of a Dataset or a Trajectory with 'offset' seconds added to the timestamps, e.g.
+    the epoch from 'to_relative_time' to convert relative timestamps to UTC.
+    '''
+    if isinstance(data, mnb.Trajectory):
+        return mnb.Trajectory([replace(shipstate, time=shipstate.time + offset) for shipstate in data.shipstates])
+    shifted = data.data.copy()
+    shifted[:, 0] += offset
+    return Dataset(shifted)
+
+
+def _unwrap(angles, period):
+    # Unwraps the angles that are not NaN, since a NaN would make all later angles NaN
+    angles = np.asarray(angles, dtype=np.float64)
+    valid = ~np.isnan(angles)
+    if valid.all():
+        return np.unwrap(angles, period=period)
+    unwrapped = angles.copy()
+    unwrapped[valid] = np.unwrap(angles[valid], period=period)
+    return unwrapped
@@ -0,0 +1,277 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+import paho.mqtt.client as mqtt
+from mqtt_nmea_bridge import topics
+from mqtt_nmea_bridge.fleet import FleetCache
+from mqtt_nmea_bridge.subscribers import _DECODERS
+from queue import Queue, Empty
+import multiprocessing
+import threading
+import heapq
+
+
+# Put on the result queue by a worker process when it has stopped
+_WORKER_DONE = "__mnb_worker_done__"
+# Put on the result queue by a worker process for a message that could not be decoded, and for a
+# message that 'process' raised on
+_MALFORMED = "__mnb_malformed__"
+_PROCESS_FAILED = "__mnb_process_failed__"
+
+
+def shared_topic(group, topic):
+    '''
+    Returns the MQTT v5 / Mosquitto shared subscription filter of a topic filter.
+    '''
+    return f"$share/{group}/{topic}"
+
+
+def message_time(message):
+    '''
+    Returns the sensor time of a data object, which is the time of the first waypoint for trajectories.
+    '''
+    shipstates = getattr(message, "shipstates", None)
+    if shipstates is not None:
+        return shipstates[0].time if shipstates else float("-inf")
+    return message.time
+
+
+class SharedSubscriberPool:
+    '''
+    Decodes the messages of a fleet in several worker processes sharing one subscription.
+
+    Each worker process runs its own MQTT client subscribed to '$share/<group>/<filter>' for every
+    message kind, so the broker load-balances the messages between the workers and the decoding is
+    not limited by the GIL of a single process. The decoded messages, or the results of 'process',
+    are sent back to a collector thread in the parent process, which puts them in 'queue' and, when
+    no 'process' is given, in the per-vessel cache 'fleet'.
+
+    Messages of one vessel can be delivered to different workers and therefore arrive out of order.
+    With 'ordered=True', the collector buffers up to 'reorder_window' messages per vessel and
+    releases them sorted by their sensor time. A message older than the last message released for
+    its vessel arrived too late to be put in order. It is counted in 'late', and is dropped if
+    'drop_late' is True, or released out of order otherwise.
+
+    Messages that can not be decoded are dropped by the workers and counted in 'malformed', and
+    messages that 'process' raises an exception on are dropped and counted in 'failed'. If the
+    worker processes die without stopping, the collector stops when none of them is alive.
+
+    --------------------------------------------------------------------
+    Parameters:
+        client_id (str): Prefix of the client IDs. Worker i connects as '<client_id>_<i>'.
+        broker (str): The IP address of the MQTT broker.
+        port (int): The port number of the MQTT broker.
+        n_workers (int): Number of worker processes.
+        group (str): Name of the shared subscription group.
+        topic_scheme (TopicScheme): The topic templates. Defaults to 'vessel/{vessel_id}/<kind>'.
+        kinds (tuple of str): The message kinds to subscribe to.
+        process (callable): Called in the worker as process(vessel_id, kind, message). The return
+            value is sent to the parent instead of the message. Must be picklable.
+        ordered (bool): Release the messages of each vessel sorted by sensor time.
+        reorder_window (int): Number of messages buffered per vessel when ordered.
+        drop_late (bool): Drop the messages that arrive too late to be released in order.
+        history (int): Number of messages kept per vessel and message kind in 'fleet'.
+        client_factory (callable): Creates the MQTT client of a worker from its client ID.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, client_id, broker, port, n_workers=None, group="mnb", topic_scheme=None,
+                 kinds=topics.KINDS, process=None, ordered=False, reorder_window=16, drop_late=True,
+                 history=100, client_factory=mqtt.Client):
+        self.client_id = client_id
+        self.broker = broker
+        self.port = port
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.group = group
+        self.topic_scheme = topic_scheme or topics.DEFAULT_SCHEME
+        self.kinds = tuple(kinds)
+        self.process = process
+        self.ordered = ordered
+        self.reorder_window = reorder_window
+        self.drop_late = drop_late
+        self.late = 0
+        self.malformed = 0
+        self.failed = 0
+        self.client_factory = client_factory
+        self.queue = Queue()
+        self.fleet = FleetCache(history)
+        self._results = None
+        self._stop_event = None
+        self._workers = []
+        self._collector = None
+        self._buffers = {}
+        # Sensor time of the last message released per vessel
+        self._watermarks = {}
+        self._seq = 0
+
+    def start(self, username, password):
+        '''
+        Start the worker processes and the collector thread.
+        '''
+        self._results = multiprocessing.Queue()
+        self._stop_event = multiprocessing.Event()
+        self._workers = [
+            multiprocessing.Process(target=_worker_main,
+                                    args=(self, f"{self.client_id}_{i}", username, password),
+                                    daemon=True)
+            for i in range(self.n_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def stop(self, timeout=None):
+        '''
+        Stop the worker processes, wait for the collector to receive their last results, and flush
+        the reorder buffers.
+        '''
+        self._stop_event.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._collector.join(timeout)
+        self.flush()
+
+    def get(self):
+        '''
+        Return a result from the queue, if any is present, return 0 otherwise.
+        '''
+        try:
+            return self.queue.get_nowait()
+        except Empty:
+            return 0
+
+    @property
+    def buffered(self):
+        '''
+        Number of messages held back in the reorder buffers.
+        '''
+        return sum(len(buffer) for buffer in list(self._buffers.values()))
+
+    def flush(self):
+        '''
+        Release every buffered message, sorted by sensor time per vessel.
+        '''
+        for vessel_id, buffer in self._buffers.items():
+            while buffer:
+                self._release(vessel_id, buffer)
+
+    def _collect(self):
+        running = self.n_workers
+        while running > 0:
+            try:
+                item = self._results.get(timeout=0.5)
+            except Empty:
+                # A worker that died did not send '_WORKER_DONE', so only wait while a worker is alive
+                if not any(worker.is_alive() for worker in self._workers):
+                    print(f"Collector of '{self.client_id}' stopped, {running} worker processes died.")
+                    return
+                continue
+            if item == _WORKER_DONE:
+                running -= 1
+                continue
+            if item == _MALFORMED:
+                self.malformed += 1
+                continue
+            if item == _PROCESS_FAILED:
+                self.failed += 1
+                continue
+            self._add(*item)
+
+    def _add(self, vessel_id, kind, key, result):
+        if not self.ordered:
+            self._emit(vessel_id, kind, result)
+            return
+        # The buffered messages are never older than the watermark, so only a new message can be late
+        watermark = self._watermarks.get(vessel_id)
+        if watermark is not None and key < watermark:
+            self.late += 1
+            if not self.drop_late:
+                self._emit(vessel_id, kind, result)
+            return
+        buffer = self._buffers.setdefault(vessel_id, [])
+        self._seq += 1
+        heapq.heappush(buffer, (key, self._seq, kind, result))
+        if len(buffer) > self.reorder_window:
+            self._release(vessel_id, buffer)
+
+    def _release(self, vessel_id, buffer):
+        key, _, kind, result = heapq.heappop(buffer)
+        self._watermarks[vessel_id] = key
+        self._emit(vessel_id, kind, result)
+
+    def _emit(self, vessel_id, kind, result):
+        if self.process is None:
+            self.fleet.update(vessel_id, kind, result)
+        self.queue.put((vessel_id, kind, result))
+
+    def __getstate__(self):
+        # Only the configuration is needed by the worker processes
+        state = self.__dict__.copy()
+        for key in ("queue", "fleet", "_workers", "_collector", "_buffers", "_watermarks"):
+            state[key] = None
+        return state
+
+
+def _worker_main(pool, client_id, username, password):
+    '''
+    Entry point of a worker process. Decodes the messages of the shared subscription and sends the
+    results to the parent until the pool is stopped.
+    '''
+    results = pool._results
+    scheme = pool.topic_scheme
+    process = pool.process
+    subscriptions = [(shared_topic(pool.group, scheme.subscription(kind)), 0) for kind in pool.kinds]
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(subscriptions)
+        else:
+            print(f"Connect failed with return code {rc}")
+
+    def on_message(client, userdata, msg):
+        route = scheme.parse(msg.topic)
+        if route is None:
+            return
+        kind, vessel_id = route
+        # An exception would stop the network loop of the client, and the worker with it
+        try:
+            message = _DECODERS[kind](msg.payload.decode())
+            key = message_time(message)
+        except (ValueError, KeyError, TypeError, IndexError, AttributeError):
+            message = None
+        if message is None:
+            results.put(_MALFORMED)
+            return
+        if process is not None:
+            try:
+                message = process(vessel_id, kind, message)
+            except Exception as e:
+                print(f"'process' failed on a message of '{vessel_id}': {e!r}")
+                results.put(_PROCESS_FAILED)
+                return
+        results.put((vessel_id, kind, key, message))
+
+    client = pool.client_factory(client_id)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.username_pw_set(f"{username}", f"{password}")
+    client.connect(pool.broker, pool.port)
+    client.loop_start()
+    try:
+        pool._stop_event.wait()
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        results.put(_WORKER_DONE)
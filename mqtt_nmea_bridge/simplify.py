@@ -0,0 +1,350 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+'''
+Trajectory simplification, to publish fewer waypoints per horizon for the same tracking accuracy.
+
+The functions return the sorted indices of the kept waypoints, which always include the first and
+the last waypoint, so they can be applied to a Dataset with 'dataset[indices]' or to any list.
+'''
+from mqtt_nmea_bridge.datasets import Dataset
+from mqtt_nmea_bridge.kinematics import EARTH_RADIUS
+import numpy as np
+import heapq
+
+
+# Candidates checked one by one after each kept waypoint, before searching with NumPy
+_DIRECT_CHECKS = 8
+
+
+def local_metres(latitude, longitude):
+    '''
+    Projects latitudes and longitudes in degrees to north and east metres from the first point.
+
+    Uses an equirectangular projection at the mean latitude, which is accurate to well below a
+    metre over the few kilometres of a docking trajectory.
+
+    --------------------------------------------------------------------
+    Input:
+        latitude (array of floats): Latitudes in degrees.
+        longitude (array of floats): Longitudes in degrees.
+    Output:
+        points (np.ndarray): Array of shape (n, 2) of north and east coordinates in metres.
+    --------------------------------------------------------------------
+    '''
+    latitude = np.radians(np.asarray(latitude, dtype=np.float64))
+    longitude = np.radians(np.asarray(longitude, dtype=np.float64))
+    if latitude.size == 0:
+        return np.empty((0, 2))
+    north = (latitude - latitude[0]) * EARTH_RADIUS
+    east = (longitude - longitude[0]) * EARTH_RADIUS * np.cos(latitude.mean())
+    return np.column_stack((north, east))
+
+
+def actuator_change_indices(U, threshold):
+    '''
+    Keeps a waypoint if any actuator value has changed by more than 'threshold' since the last kept
+    waypoint. This is the filter of 'optimize_dataset_horizon' in the examples, with 'threshold'
+    equal to 'percentage / 100'.
+
+    Rows equal to the previous row are never kept, so only the rows where the actuators changed are
+    searched. After each kept waypoint, the next few candidates are checked directly, since the next
+    change is often close, and the rest are searched with NumPy in blocks that double in size.
+
+    --------------------------------------------------------------------
+    Input:
+        U (array of floats): Array of shape (n, nr_of_actuators) of actuator values.
+        threshold (float): The change required to keep a waypoint.
+    Output:
+        indices (np.ndarray): The indices of the kept waypoints.
+    --------------------------------------------------------------------
+    '''
+    U = np.asarray(U, dtype=np.float64)
+    if len(U) == 0:
+        return np.empty(0, dtype=np.intp)
+    # A row equal to the previous row has the same change as it, so it is kept only if the previous
+    # row is, and then its change is zero
+    candidates = np.flatnonzero((U[1:] != U[:-1]).any(axis=1)) + 1
+    C = U[candidates]
+    rows = C.tolist()
+    n = len(C)
+    kept = [0]
+    reference = U[0]
+    reference_list = reference.tolist()
+    start = 0
+    while start < n:
+        # Direct check of the next candidates
+        index = None
+        for i in range(start, min(start + _DIRECT_CHECKS, n)):
+            if any(abs(u - r) > threshold for u, r in zip(rows[i], reference_list)):
+                index = i
+                break
+        if index is None:
+            start = min(start + _DIRECT_CHECKS, n)
+            block = 64
+            while start < n:
+                end = min(start + block, n)
+                changed = np.flatnonzero((np.abs(C[start:end] - reference) > threshold).any(axis=1))
+                if changed.size:
+                    index = start + int(changed[0])
+                    break
+                start = end
+                block *= 2
+            if index is None:
+                break
+        kept.append(int(candidates[index]))
+        reference = C[index]
+        reference_list = rows[index]
+        start = index + 1
+    return np.asarray(kept, dtype=np.intp)
+
+
+def douglas_peucker_indices(points, tolerance):
+    '''
+    Ramer-Douglas-Peucker simplification of a polyline.
+
+    A waypoint is kept if it is further than 'tolerance' from the segment between the kept
+    waypoints around it. The distances to each segment are computed with NumPy.
+
+    --------------------------------------------------------------------
+    Input:
+        points (array of floats): Array of shape (n, 2) of coordinates in metres, e.g. from 'local_metres'.
+        tolerance (float): The maximum distance in metres from a removed waypoint to the simplified polyline.
+    Output:
+        indices (np.ndarray): The indices of the kept waypoints.
+    --------------------------------------------------------------------
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    if n <= 2:
+        return np.arange(n, dtype=np.intp)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = _segment_distances(points[first + 1:last], points[first], points[last])
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            index = first + 1 + i
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return np.flatnonzero(keep)
+
+
+def visvalingam_indices(points, min_area=None, n_points=None):
+    '''
+    Visvalingam-Whyatt simplification of a polyline.
+
+    The waypoint spanning the smallest triangle with its neighbours is removed repeatedly, until
+    every remaining triangle has an area of at least 'min_area', or 'n_points' waypoints remain.
+    The areas are kept in a heap, so the simplification costs O(n log n).
+
+    --------------------------------------------------------------------
+    Input:
+        points (array of floats): Array of shape (n, 2) of coordinates in metres.
+        min_area (float): The minimum triangle area in square metres of a kept waypoint.
+        n_points (int): The number of waypoints to keep, at least 2.
+    Output:
+        indices (np.ndarray): The indices of the kept waypoints.
+    --------------------------------------------------------------------
+    '''
+    if min_area is None and n_points is None:
+        raise ValueError("Either min_area or n_points must be given.")
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    target = 2 if n_points is None else max(2, n_points)
+    if n <= target:
+        return np.arange(n, dtype=np.intp)
+    # Python lists, since the loop accesses single elements
+    xy = points.tolist()
+    previous = list(range(-1, n - 1))
+    following = list(range(1, n + 1))
+    areas = [np.inf] + _triangle_areas(points[:-2], points[1:-1], points[2:]).tolist() + [np.inf]
+    heap = [(areas[i], i) for i in range(1, n - 1)]
+    heapq.heapify(heap)
+    removed = [False] * n
+    remaining = n
+    while heap and remaining > target:
+        area, i = heapq.heappop(heap)
+        if removed[i] or area != areas[i]:
+            # Outdated heap entry
+            continue
+        if min_area is not None and area >= min_area:
+            break
+        removed[i] = True
+        remaining -= 1
+        p, f = previous[i], following[i]
+        following[p] = f
+        previous[f] = p
+        # The areas of the neighbours are never decreased below the removed area, so that the
+        # removal order is consistent with the effective areas
+        for j in (p, f):
+            if 0 < j < n - 1:
+                new_area = max(area, _triangle_area(xy[previous[j]], xy[j], xy[following[j]]))
+                areas[j] = new_area
+                heapq.heappush(heap, (new_area, j))
+    return np.flatnonzero(~np.asarray(removed))
+
+
+def time_synchronized_indices(time, deviations, tolerances):
+    '''
+    Douglas-Peucker simplification with combined tolerances on several time-dependent signals.
+
+    Each removed waypoint is compared with the linear interpolation in time between the kept
+    waypoints around it, so the simplified trajectory stays within every tolerance at the time of
+    each original waypoint. This is the synchronized Euclidean distance for the position, and also
+    bounds the errors of the heading and the actuators.
+
+    --------------------------------------------------------------------
+    Input:
+        time (array of floats): The times of the waypoints, increasing.
+        deviations (lst of callables): For each signal, a function deviation(first, last) returning
+            the deviations of the waypoints between 'first' and 'last' from the interpolation.
+        tolerances (lst of floats): The tolerance of each signal.
+    Output:
+        indices (np.ndarray): The indices of the kept waypoints.
+    --------------------------------------------------------------------
+    '''
+    n = len(time)
+    if n <= 2:
+        return np.arange(n, dtype=np.intp)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        # The largest deviation relative to its tolerance, over all signals
+        error = np.zeros(last - first - 1)
+        for deviation, tolerance in zip(deviations, tolerances):
+            np.maximum(error, deviation(first, last) / tolerance, out=error)
+        i = int(np.argmax(error))
+        if error[i] > 1.0:
+            index = first + 1 + i
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return np.flatnonzero(keep)
+
+
+def simplify_indices(dataset, position_tolerance=None, heading_tolerance=None, actuator_tolerance=None):
+    '''
+    Simplifies a dataset with combined tolerances on the position, the heading and the actuators.
+
+    A tolerance of None is not checked. See 'time_synchronized_indices'.
+
+    --------------------------------------------------------------------
+    Input:
+        dataset (Dataset): The dataset, with latitude, longitude and heading in degrees.
+        position_tolerance (float): The maximum position error in metres.
+        heading_tolerance (float): The maximum heading error in degrees.
+        actuator_tolerance (float or array of floats): The maximum error of each actuator value.
+    Output:
+        indices (np.ndarray): The indices of the kept waypoints.
+    --------------------------------------------------------------------
+    '''
+    time = dataset.time
+    deviations = []
+    tolerances = []
+    if position_tolerance is not None:
+        points = local_metres(dataset.X[:, 0], dataset.X[:, 1])
+        deviations.append(lambda first, last: np.linalg.norm(_interpolation_errors(time, points, first, last), axis=1))
+        tolerances.append(position_tolerance)
+    if heading_tolerance is not None:
+        # Unwrapped, so that the interpolation does not turn the long way around
+        heading = np.degrees(np.unwrap(np.radians(dataset.X[:, 2])))[:, None]
+        deviations.append(lambda first, last: np.abs(_interpolation_errors(time, heading, first, last))[:, 0])
+        tolerances.append(heading_tolerance)
+    if actuator_tolerance is not None:
+        scale = np.broadcast_to(np.asarray(actuator_tolerance, dtype=np.float64), (dataset.U.shape[1],))
+        U = dataset.U / scale
+        deviations.append(lambda first, last: np.abs(_interpolation_errors(time, U, first, last)).max(axis=1))
+        tolerances.append(1.0)
+    if not deviations:
+        return np.arange(len(dataset), dtype=np.intp)
+    return time_synchronized_indices(time, deviations, tolerances)
+
+
+def simplify(dataset, method="combined", tolerance=None, position_tolerance=None, heading_tolerance=None,
+             actuator_tolerance=None, min_area=None, n_points=None):
+    '''
+    Simplifies a dataset with one of the methods of this module.
+
+    --------------------------------------------------------------------
+    Input:
+        dataset (Dataset): The dataset.
+        method (str): One of
+            'actuators': Keeps waypoints where an actuator changed by more than 'tolerance' since the last kept one.
+            'douglas_peucker': Keeps waypoints further than 'tolerance' metres from the simplified path.
+            'visvalingam': Keeps waypoints with a triangle area of at least 'min_area' square metres, or 'n_points' waypoints.
+            'combined': Keeps the trajectory within 'position_tolerance', 'heading_tolerance' and
+                'actuator_tolerance' at every original waypoint time.
+        tolerance (float): The tolerance of the 'actuators' and 'douglas_peucker' methods.
+        position_tolerance (float): In metres, for the 'combined' method.
+        heading_tolerance (float): In degrees, for the 'combined' method.
+        actuator_tolerance (float or array of floats): For the 'combined' method.
+        min_area (float): For the 'visvalingam' method.
+        n_points (int): For the 'visvalingam' method.
+    Output:
+        dataset (Dataset): The simplified dataset.
+    --------------------------------------------------------------------
+    '''
+    if method == "actuators":
+        indices = actuator_change_indices(dataset.U, tolerance)
+    elif method == "douglas_peucker":
+        indices = douglas_peucker_indices(local_metres(dataset.X[:, 0], dataset.X[:, 1]), tolerance)
+    elif method == "visvalingam":
+        indices = visvalingam_indices(local_metres(dataset.X[:, 0], dataset.X[:, 1]), min_area, n_points)
+    elif method == "combined":
+        indices = simplify_indices(dataset, position_tolerance, heading_tolerance, actuator_tolerance)
+    else:
+        raise ValueError(f"Unknown simplification method '{method}'.")
+    return Dataset(dataset.data[indices])
+
+
+def _segment_distances(points, start, end):
+    '''
+    Returns the distances from points to the segment between 'start' and 'end'.
+    '''
+    direction = end - start
+    length2 = direction @ direction
+    if length2 == 0.0:
+        return np.linalg.norm(points - start, axis=1)
+    t = np.clip((points - start) @ direction / length2, 0.0, 1.0)
+    return np.linalg.norm(points - (start + t[:, None] * direction), axis=1)
+
+
+def _interpolation_errors(time, values, first, last):
+    '''
+    Returns the errors of the values between 'first' and 'last' from the linear interpolation in
+    time between the values at 'first' and 'last'.
+    '''
+    span = time[last] - time[first]
+    t = (time[first + 1:last] - time[first]) / span if span > 0 else np.zeros(last - first - 1)
+    interpolated = values[first] + t[:, None] * (values[last] - values[first])
+    return values[first + 1:last] - interpolated
+
+
+def _triangle_areas(a, b, c):
+    return 0.5 * np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]))
+
+
+def _triangle_area(a, b, c):
+    return 0.5 * abs((b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1]))
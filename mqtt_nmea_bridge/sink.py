@@ -0,0 +1,291 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+'''
+SQLite sink for the decoded messages of the subscribers.
+
+A subscriber hands each decoded ShipState, WindState and Trajectory to the sinks attached with
+'Subscriber.attach'. 'SQLiteSink.put' only appends the message to a buffer, so the network thread
+of the subscriber is never blocked by the disk. A background thread writes the buffered messages in
+bulk transactions with prepared 'executemany' statements, when 'batch_size' messages are buffered or
+every 'flush_interval' seconds. The database is in WAL mode, so it can be read while it is written.
+
+    sink = SQLiteSink("history.db")
+    subscriber.attach(sink)
+    ...
+    sink.close()
+    ship_states = read_ship_states("history.db", topic="vessel/gunnerus/ship_state")
+'''
+import mqtt_nmea_bridge as mnb
+from collections import deque
+import threading
+import sqlite3
+import json
+import time
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ship_states (
+    topic TEXT, received REAL, time REAL, latitude REAL, longitude REAL, heading REAL, cog REAL, sog REAL,
+    nr_of_actuators INTEGER, actuator_values TEXT);
+CREATE INDEX IF NOT EXISTS ship_states_topic_time ON ship_states (topic, time);
+CREATE TABLE IF NOT EXISTS wind_states (
+    topic TEXT, received REAL, time REAL, speed REAL, direction REAL);
+CREATE INDEX IF NOT EXISTS wind_states_topic_time ON wind_states (topic, time);
+CREATE TABLE IF NOT EXISTS trajectories (
+    id INTEGER PRIMARY KEY, topic TEXT, received REAL, time REAL, nr_of_waypoints INTEGER);
+CREATE INDEX IF NOT EXISTS trajectories_topic_time ON trajectories (topic, time);
+CREATE TABLE IF NOT EXISTS waypoints (
+    trajectory_id INTEGER, waypoint INTEGER, time REAL, latitude REAL, longitude REAL, heading REAL, cog REAL,
+    sog REAL, nr_of_actuators INTEGER, actuator_values TEXT, PRIMARY KEY (trajectory_id, waypoint)) WITHOUT ROWID;
+'''
+
+_INSERT_SHIP_STATE = "INSERT INTO ship_states VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+_INSERT_WIND_STATE = "INSERT INTO wind_states VALUES (?, ?, ?, ?, ?)"
+_INSERT_TRAJECTORY = "INSERT INTO trajectories (topic, received, time, nr_of_waypoints) VALUES (?, ?, ?, ?)"
+_INSERT_WAYPOINT = "INSERT INTO waypoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+_SHIP_STATE_COLUMNS = "time, latitude, longitude, heading, cog, sog, nr_of_actuators, actuator_values"
+
+
+class SQLiteSink:
+    '''
+    Writes decoded messages to an SQLite database in bulk transactions from a background thread.
+
+    Messages put while 'queue_maxsize' messages are waiting to be written are counted in 'dropped'
+    instead of blocking the caller, as are messages put after 'close'. A message that can not be
+    converted to a row is counted in 'failed' and the rest of its batch is written. A batch that
+    fails to be written is rolled back and counted in 'failed'. In both cases the exception is kept
+    in 'error', and the writer carries on with the next batch.
+
+    --------------------------------------------------------------------
+    Parameters:
+        path (str): The database file. Created if it does not exist.
+        batch_size (int): Maximum number of messages per transaction. The writer is woken when as
+            many messages are waiting.
+        flush_interval (float): Maximum seconds between the transactions while messages are waiting.
+        queue_maxsize (int): Maximum number of messages waiting to be written.
+        synchronous (str): The SQLite 'synchronous' setting. 'NORMAL' is durable in WAL mode except
+            for the last transactions before a power loss, 'FULL' syncs every transaction.
+        clock (callable): Clock of the receive time stored with the messages.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, path, batch_size=1000, flush_interval=1.0, queue_maxsize=100000, synchronous="NORMAL",
+                 clock=time.time):
+        if batch_size < 1:
+            raise ValueError("The batch size must be at least 1.")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_maxsize = queue_maxsize
+        self._clock = clock
+        self._pending = deque()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.error = None
+        # Opened here so that a bad path or schema fails in the caller, but only used by the writer thread
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(f"PRAGMA synchronous={synchronous}")
+        self._connection.executescript(_SCHEMA)
+        self._thread = threading.Thread(target=self._run, name=f"SQLiteSink({path})", daemon=True)
+        self._thread.start()
+
+    def put(self, topic, message):
+        '''
+        Buffers a ShipState, WindState or Trajectory received on a topic for writing, without blocking.
+        Returns False if the message was dropped.
+        '''
+        pending = self._pending
+        if self._closed or len(pending) >= self.queue_maxsize:
+            with self._lock:
+                self.dropped += 1
+            return False
+        pending.append((topic, self._clock(), message))
+        if len(pending) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def flush(self, timeout=None):
+        '''
+        Waits until the messages put before the call are written. Returns False on a timeout.
+        '''
+        if self._closed:
+            return not self._thread.is_alive()
+        written = threading.Event()
+        self._pending.append(written)
+        self._wakeup.set()
+        return written.wait(timeout)
+
+    def close(self):
+        '''
+        Writes the buffered messages, stops the writer thread and closes the database.
+        '''
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            # Read before writing, so a message put before 'close' is always written
+            closed = self._closed
+            while self._pending:
+                self._write_batch()
+            if closed:
+                return
+
+    def _write_batch(self):
+        pending = self._pending
+        ship_states, wind_states, trajectories, flushed = [], [], [], []
+        taken = count = 0
+        while pending and taken < self.batch_size:
+            item = pending.popleft()
+            if isinstance(item, threading.Event):
+                flushed.append(item)
+                continue
+            topic, received, message = item
+            taken += 1
+            # A message that can not be converted is counted alone, and does not fail the batch
+            try:
+                if isinstance(message, mnb.ShipState):
+                    ship_states.append((topic, received) + _ship_state_row(message))
+                elif isinstance(message, mnb.WindState):
+                    wind_states.append((topic, received, message.time, message.speed, message.direction))
+                elif isinstance(message, mnb.Trajectory):
+                    shipstates = message.shipstates
+                    trajectories.append(((topic, received, shipstates[0].time if shipstates else None, len(shipstates)),
+                                         [_ship_state_row(shipstate) for shipstate in shipstates]))
+                else:
+                    raise TypeError(f"Can not write a message of type '{type(message).__name__}'.")
+                count += 1
+            except Exception as error:
+                self.failed += 1
+                self.error = error
+        connection = self._connection
+        try:
+            connection.execute("BEGIN")
+            connection.executemany(_INSERT_SHIP_STATE, ship_states)
+            connection.executemany(_INSERT_WIND_STATE, wind_states)
+            for trajectory, waypoints in trajectories:
+                # The id is given by SQLite in the transaction, so several sinks can share a database
+                trajectory_id = connection.execute(_INSERT_TRAJECTORY, trajectory).lastrowid
+                connection.executemany(_INSERT_WAYPOINT, ((trajectory_id, i) + row for i, row in enumerate(waypoints)))
+            connection.execute("COMMIT")
+            self.written += count
+            self.batches += 1
+        except Exception as error:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            self.failed += count
+            self.error = error
+        finally:
+            for event in flushed:
+                event.set()
+
+
+def read_ship_states(path, topic=None, start=None, end=None):
+    '''
+    Reads the ship states written by an SQLiteSink, sorted by time.
+
+    --------------------------------------------------------------------
+    Input:
+        path (str): The database file.
+        topic (str): Only read the ship states received on this topic.
+        start (float): Only read the ship states at or after this time.
+        end (float): Only read the ship states before this time.
+    Output:
+        ship_states (lst of ShipState): The ship states.
+    --------------------------------------------------------------------
+    '''
+    rows = _select(path, f"SELECT {_SHIP_STATE_COLUMNS} FROM ship_states", topic, start, end)
+    return [_ship_state(row) for row in rows]
+
+
+def read_wind_states(path, topic=None, start=None, end=None):
+    '''
+    Reads the wind states written by an SQLiteSink, sorted by time. See 'read_ship_states'.
+    '''
+    rows = _select(path, "SELECT time, speed, direction FROM wind_states", topic, start, end)
+    return [mnb.WindState(time=row[0], speed=row[1], direction=row[2]) for row in rows]
+
+
+def read_trajectories(path, topic=None, start=None, end=None):
+    '''
+    Reads the trajectories written by an SQLiteSink, sorted by the time of their first waypoint.
+    See 'read_ship_states'.
+    '''
+    connection = sqlite3.connect(path)
+    try:
+        trajectories = _select(connection, "SELECT id FROM trajectories", topic, start, end)
+        result = []
+        for (trajectory_id,) in trajectories:
+            rows = connection.execute(f"SELECT {_SHIP_STATE_COLUMNS} FROM waypoints WHERE trajectory_id = ? ORDER BY waypoint",
+                                      (trajectory_id,))
+            result.append(mnb.Trajectory([_ship_state(row) for row in rows]))
+        return result
+    finally:
+        connection.close()
+
+
+def _ship_state_row(shipstate):
+    return (shipstate.time, shipstate.latitude, shipstate.longitude, shipstate.heading, shipstate.cog, shipstate.sog,
+            shipstate.nr_of_actuators, json.dumps(shipstate.actuator_values, default=_to_list))
+
+
+def _to_list(values):
+    # Actuator values given as a NumPy array
+    if hasattr(values, "tolist"):
+        return values.tolist()
+    raise TypeError(f"Actuator values of type '{type(values).__name__}' can not be written.")
+
+
+def _ship_state(row):
+    return mnb.ShipState(time=row[0], latitude=row[1], longitude=row[2], heading=row[3], cog=row[4], sog=row[5],
+                         nr_of_actuators=row[6], actuator_values=json.loads(row[7]))
+
+
+def _select(database, query, topic, start, end):
+    # 'database' is a path, or an open connection that is left open
+    conditions, parameters = [], []
+    for condition, value in (("topic = ?", topic), ("time >= ?", start), ("time < ?", end)):
+        if value is not None:
+            conditions.append(condition)
+            parameters.append(value)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY time, rowid"
+    if isinstance(database, sqlite3.Connection):
+        return database.execute(query, parameters).fetchall()
+    connection = sqlite3.connect(database)
+    try:
+        return connection.execute(query, parameters).fetchall()
+    finally:
+        connection.close()
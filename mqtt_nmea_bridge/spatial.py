@@ -0,0 +1,358 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+'''
+Spatial index over the waypoints of a trajectory, for nearest segment, along-track progress and
+cross-track error queries at the rate of a controller.
+
+The segments between the waypoints are stored in a uniform grid in a local north-east plane, so a
+query only visits the cells around the vessel, and the grid is updated in place as the horizon
+moves: waypoints that are passed are dropped from the front, and new waypoints appended at the end.
+'''
+from mqtt_nmea_bridge.kinematics import EARTH_RADIUS
+from dataclasses import dataclass
+from bisect import bisect_right
+import numpy as np
+import math
+
+
+@dataclass
+class TrackPosition:
+    '''
+    Dataclass for the position of a vessel relative to a trajectory.
+
+    --------------------------------------------------------------------
+    Parameters:
+
+    segment (int): Index of the first waypoint of the nearest segment
+    fraction (float): Position along the nearest segment, from 0 at its first to 1 at its last waypoint
+    along_track (float): Distance in metres along the trajectory from its first waypoint to the nearest point
+    cross_track (float): Distance in metres to the nearest point, positive to starboard of the trajectory
+    nearest_waypoint (int): Index of the nearest waypoint
+    time (float): The time of the nearest point, interpolated between the waypoints of the segment
+    --------------------------------------------------------------------
+    '''
+    segment: int
+    fraction: float
+    along_track: float
+    cross_track: float
+    nearest_waypoint: int
+    time: float
+
+
+class TrajectoryIndex:
+    '''
+    Grid index over the segments of a trajectory.
+
+    The waypoints are projected to a north-east plane at 'origin', which is kept for the lifetime of
+    the index, so the positions stay comparable when the horizon moves. Each segment is stored in
+    the grid cells covered by its bounding box, and a query searches rings of cells outwards from
+    the vessel until no unvisited segment can be closer. The cost of a query depends on the number
+    of segments near the vessel, not on the length of the trajectory. Beyond 'max_rings' rings, i.e.
+    far off the trajectory, all segments are searched at once with NumPy instead.
+
+    --------------------------------------------------------------------
+    Parameters:
+        trajectory (Trajectory): The first trajectory. Can be None, see 'update' and 'append'.
+        cell_size (float): The size of the grid cells in metres. If None, the median distance
+            between the waypoints of the first trajectory is used, and at least 1 m.
+        origin (tuple of floats): Latitude and longitude in degrees of the plane. If None, the first waypoint.
+        max_rings (int): The number of rings of cells searched before searching all segments.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, trajectory=None, cell_size=None, origin=None, max_rings=8):
+        self.cell_size = cell_size
+        self.origin = origin
+        self.max_rings = max_rings
+        self._clear()
+        if trajectory is not None:
+            self.update(trajectory)
+
+    def _clear(self):
+        # Waypoints are numbered from 0 when added, and the first '_first' of them have been dropped
+        self._time = []
+        self._north = []
+        self._east = []
+        self._distance = []
+        self._first = 0
+        self._cells = {}
+        self._bounds = None
+        # A first waypoint before the stored waypoints, e.g. the current ship state, as (time, north, east)
+        self._head = None
+
+    def __len__(self):
+        return len(self._time) - self._first + (self._head is not None)
+
+    def to_local(self, latitude, longitude):
+        '''
+        Projects latitudes and longitudes in degrees to north and east metres in the plane of the index.
+        '''
+        if self.origin is None:
+            raise ValueError("The index has no origin before the first waypoint is added.")
+        latitude0, longitude0 = self.origin
+        north = np.radians(np.asarray(latitude, dtype=np.float64) - latitude0)*EARTH_RADIUS
+        east = np.radians(np.asarray(longitude, dtype=np.float64) - longitude0)*EARTH_RADIUS*math.cos(math.radians(latitude0))
+        return north, east
+
+    def update(self, trajectory):
+        '''
+        Moves the index to a new horizon of the same trajectory, like the horizons of a MovingTrajectory.
+
+        If the new horizon overlaps the indexed waypoints, the waypoints before its first waypoint
+        are dropped and the waypoints after the last indexed waypoint are appended, so only the
+        grid cells of the changed waypoints are updated. A first waypoint between the indexed
+        waypoints, like the current ship state of a moving trajectory, is kept outside of the grid.
+        Otherwise, e.g. for a new plan, the index is rebuilt.
+        '''
+        shipstates = trajectory.shipstates
+        if not shipstates:
+            self._clear()
+            return
+        time = [shipstate.time for shipstate in shipstates]
+        if len(self._time) > self._first and self._time[self._first] <= time[0] <= self._time[-1]:
+            new = bisect_right(time, self._time[-1])
+            self.drop_before(time[0])
+            if self._time[self._first] != time[0]:
+                north, east = self.to_local(shipstates[0].latitude, shipstates[0].longitude)
+                self._head = (time[0], float(north), float(east))
+            self._extend(shipstates[new:])
+            return
+        self._clear()
+        self._extend(shipstates)
+
+    def append(self, time, latitude, longitude):
+        '''
+        Appends waypoints at the end of the trajectory.
+
+        --------------------------------------------------------------------
+        Input:
+            time (float / array of floats): In seconds, after the last waypoint.
+            latitude (float / array of floats): In degrees.
+            longitude (float / array of floats): In degrees.
+        --------------------------------------------------------------------
+        '''
+        time = np.atleast_1d(np.asarray(time, dtype=np.float64))
+        latitude = np.atleast_1d(np.asarray(latitude, dtype=np.float64))
+        longitude = np.atleast_1d(np.asarray(longitude, dtype=np.float64))
+        if time.size == 0:
+            return
+        if self.origin is None:
+            self.origin = (float(latitude[0]), float(longitude[0]))
+        north, east = self.to_local(latitude, longitude)
+        if self.cell_size is None:
+            legs = np.hypot(np.diff(north), np.diff(east))
+            self.cell_size = max(float(np.median(legs)), 1.0) if legs.size else 1.0
+        for t, n, e in zip(time.tolist(), north.tolist(), east.tolist()):
+            self._append_point(t, n, e)
+
+    def drop_before(self, time):
+        '''
+        Drops the waypoints before a time, except the last one.
+        '''
+        if self._head is not None and self._head[0] < time:
+            self._head = None
+        last = len(self._time) - 1
+        while self._first < last and self._time[self._first] < time:
+            self._first += 1
+        # Compact when most of the stored waypoints are dropped, so the memory follows the horizon
+        if self._first > 64 and self._first > len(self._time) // 2:
+            self._compact()
+
+    def query(self, latitude, longitude):
+        '''
+        Finds the nearest point on the trajectory to a position.
+
+        --------------------------------------------------------------------
+        Input:
+            latitude (float): In degrees.
+            longitude (float): In degrees.
+        Output:
+            position (TrackPosition): The position relative to the trajectory, with the waypoint
+                indices counted from the first waypoint of the current horizon. None if the index is empty.
+        --------------------------------------------------------------------
+        '''
+        if len(self) == 0:
+            return None
+        # Scalar maths, as NumPy is slower than 'math' for a single position
+        latitude0, longitude0 = self.origin
+        north = math.radians(latitude - latitude0)*EARTH_RADIUS
+        east = math.radians(longitude - longitude0)*EARTH_RADIUS*math.cos(math.radians(latitude0))
+        return self.query_local(north, east)
+
+    def query_local(self, north, east):
+        '''
+        Finds the nearest point on the trajectory to a position in the plane of the index, see 'query'.
+        '''
+        if len(self) == 0:
+            return None
+        first = self._first
+        best = (math.inf, None, 0.0, 0.0)
+        best_point = (math.inf, None)
+        if self._head is not None:
+            # The segment from the first waypoint outside of the grid to the first stored waypoint
+            _, hn, he = self._head
+            best, best_point = _check(first - 1, hn, he, self._north[first], self._east[first], north, east, best, best_point)
+        elif len(self) == 1:
+            distance = math.hypot(north - self._north[first], east - self._east[first])
+            return TrackPosition(0, 0.0, 0.0, distance, 0, self._time[first])
+        if self._bounds is None:
+            return self._position(best, best_point)
+
+        c = self.cell_size
+        ci, cj = math.floor(north/c), math.floor(east/c)
+        (min_i, min_j), (max_i, max_j) = self._bounds
+        seen = set()
+        r = 0
+        while True:
+            for cell in _ring(ci, cj, r):
+                for k in self._cells.get(cell, ()):
+                    if k < first or k in seen:
+                        continue
+                    seen.add(k)
+                    best, best_point = _check(k, self._north[k], self._east[k], self._north[k + 1], self._east[k + 1],
+                                              north, east, best, best_point)
+            # Distance from the position to the outside of the searched square of cells
+            bound = min(north - (ci - r)*c, (ci + r + 1)*c - north, east - (cj - r)*c, (cj + r + 1)*c - east)
+            covered = ci - r <= min_i and ci + r >= max_i and cj - r <= min_j and cj + r >= max_j
+            if covered or (best[0] <= bound and best_point[0] <= bound):
+                break
+            r += 1
+            if r > self.max_rings:
+                return self._query_all(north, east)
+        return self._position(best, best_point)
+
+    def _query_all(self, north, east):
+        first = self._first
+        n = self._north[first:]
+        e = self._east[first:]
+        offset = first
+        if self._head is not None:
+            n = [self._head[1]] + n
+            e = [self._head[2]] + e
+            offset -= 1
+        n, e = np.array(n), np.array(e)
+        dn, de = np.diff(n), np.diff(e)
+        vn, ve = north - n[:-1], east - e[:-1]
+        length2 = dn*dn + de*de
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fraction = np.where(length2 > 0, np.clip((vn*dn + ve*de)/length2, 0.0, 1.0), 0.0)
+        pn, pe = vn - fraction*dn, ve - fraction*de
+        distances = np.hypot(pn, pe)
+        k = int(np.argmin(distances))
+        side = dn[k]*pe[k] - de[k]*pn[k]
+        distance = float(distances[k])
+        best = (distance, offset + k, float(fraction[k]), -distance if side < 0 else distance)
+        point_distances = np.hypot(north - n, east - e)
+        j = int(np.argmin(point_distances))
+        return self._position(best, (float(point_distances[j]), offset + j))
+
+    def _position(self, best, best_point):
+        # Segment and waypoint 'first - 1' are the segment from the head and the head
+        _, k, fraction, cross_track = best
+        first = self._first
+        if self._head is not None:
+            head_time, head_north, head_east = self._head
+            head_length = math.hypot(self._north[first] - head_north, self._east[first] - head_east)
+            offset = first - 1
+        else:
+            head_length = 0.0
+            offset = first
+        if k == first - 1:
+            t0, t1 = head_time, self._time[first]
+            along_track = fraction*head_length
+        else:
+            t0, t1 = self._time[k], self._time[k + 1]
+            along_track = head_length + self._distance[k] - self._distance[first] + fraction*(self._distance[k + 1] - self._distance[k])
+        return TrackPosition(segment=k - offset,
+                             fraction=fraction,
+                             along_track=along_track,
+                             cross_track=cross_track,
+                             nearest_waypoint=best_point[1] - offset,
+                             time=t0 + fraction*(t1 - t0))
+
+    def _extend(self, shipstates):
+        if not shipstates:
+            return
+        self.append([s.time for s in shipstates], [s.latitude for s in shipstates], [s.longitude for s in shipstates])
+
+    def _append_point(self, t, n, e):
+        if self._time:
+            if t < self._time[-1]:
+                raise ValueError("The waypoints must be added in time order.")
+            self._distance.append(self._distance[-1] + math.hypot(n - self._north[-1], e - self._east[-1]))
+        else:
+            self._distance.append(0.0)
+        self._time.append(t)
+        self._north.append(n)
+        self._east.append(e)
+        k = len(self._time) - 2
+        if k < 0:
+            return
+        c = self.cell_size
+        an, ae = self._north[k], self._east[k]
+        i0, i1 = sorted((math.floor(an/c), math.floor(n/c)))
+        j0, j1 = sorted((math.floor(ae/c), math.floor(e/c)))
+        cells = self._cells
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                cells.setdefault((i, j), []).append(k)
+        if self._bounds is None:
+            self._bounds = ((i0, j0), (i1, j1))
+        else:
+            (min_i, min_j), (max_i, max_j) = self._bounds
+            self._bounds = ((min(min_i, i0), min(min_j, j0)), (max(max_i, i1), max(max_j, j1)))
+
+    def _compact(self):
+        first = self._first
+        head = self._head
+        points = list(zip(self._time[first:], self._north[first:], self._east[first:]))
+        self._clear()
+        for t, n, e in points:
+            self._append_point(t, n, e)
+        self._head = head
+
+
+def _check(k, an, ae, bn, be, north, east, best, best_point):
+    # Compares the segment 'k' from waypoint k at (an, ae) to waypoint k + 1 at (bn, be) with the best so far
+    dn, de = bn - an, be - ae
+    vn, ve = north - an, east - ae
+    length2 = dn*dn + de*de
+    fraction = min(max((vn*dn + ve*de)/length2, 0.0), 1.0) if length2 > 0 else 0.0
+    pn, pe = vn - fraction*dn, ve - fraction*de
+    distance = math.hypot(pn, pe)
+    if distance < best[0]:
+        # Positive to starboard, i.e. to the right of the direction of the segment
+        side = dn*pe - de*pn
+        best = (distance, k, fraction, -distance if side < 0 else distance)
+    d = math.hypot(vn, ve)
+    if d < best_point[0]:
+        best_point = (d, k)
+    d = math.hypot(north - bn, east - be)
+    if d < best_point[0]:
+        best_point = (d, k + 1)
+    return best, best_point
+
+
+def _ring(ci, cj, r):
+    # The cells at Chebyshev distance 'r' from the cell (ci, cj)
+    if r == 0:
+        yield ci, cj
+        return
+    for j in range(cj - r, cj + r + 1):
+        yield ci - r, j
+        yield ci + r, j
+    for i in range(ci - r + 1, ci + r):
+        yield i, cj - r
+        yield i, cj + r
@@ -15,27 +15,74 @@
 #
 import paho.mqtt.client as mqtt
 import mqtt_nmea_bridge as mnb
-from queue import Queue
+from mqtt_nmea_bridge import topics, mqtt_str_utils, profiling
+from mqtt_nmea_bridge.fleet import FleetCache
+from mqtt_nmea_bridge.metrics import REGISTRY, ClientMetrics
+from mqtt_nmea_bridge.tracing import LatencyTracker
+from mqtt_nmea_bridge.wind import WindStatisticsTracker, DEFAULT_WINDOWS
+from queue import Queue, Full
+import time
+
+
+# Decoder of each message kind
+_DECODERS = {
+    topics.SHIP_STATE: mqtt_str_utils.from_mqtt_str_to_shipstate,
+    topics.TRAJECTORY: mqtt_str_utils.from_mqtt_str_to_traj,
+    topics.WIND_STATE: mqtt_str_utils.from_mqtt_str_to_windstate,
+}
 
 
 class Subscriber:
     '''
     Subscriber client parent class for subscribing to topics from an MQTT broker.
 
+    Messages that can not be decoded are counted as malformed and are not put in the queue. If the
+    queue has a maximum size, messages received while it is full are counted as dropped.
+
+    If a message has a header, the publish-to-delivery latency, sequence gaps and reorders are
+    tracked in 'latency'.
+
+    Every decoded message is also put in the sinks added with 'attach', e.g. a 'sink.SQLiteSink'.
+
     --------------------------------------------------------------------
     Parameters:
         client_id (str): The client ID to use when connecting to the broker.
         broker (str): The IP address of the MQTT broker.
         port (int): The port number of the MQTT broker.
+        vessel_id (str): Subscribe to the topics of this vessel, as given by 'topic_scheme'.
+        topic_scheme (TopicScheme): The topic templates. Defaults to 'vessel/{vessel_id}/<kind>'.
+        queue_maxsize (int): Maximum number of messages in the queue. 0 means unbounded.
+        metrics (MetricsRegistry): Registry for the message, byte, latency and error metrics. Defaults to 'metrics.REGISTRY'.
+        clock (callable): Clock of the receive time. Must be comparable with the clock of the publishers.
+        latency_window (int): Number of latencies kept for the rolling percentiles.
+        client_factory (callable): Creates the MQTT client from the client ID, e.g. 'LoopbackBroker.client'. Defaults to the paho Client.
+        qos (int): The maximum QoS level of the subscriptions.
     --------------------------------------------------------------------
     '''
-    def __init__(self, client_id, broker, port):
-        self.client = mqtt.Client(client_id)
+    kind = None
+    topic = None
+
+    def __init__(self, client_id, broker, port, vessel_id=None, topic_scheme=None, queue_maxsize=0, metrics=None,
+                 clock=time.monotonic, latency_window=1024, client_factory=mqtt.Client, qos=0):
+        self.client = client_factory(client_id)
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
+        self.client_id = client_id
+        self.metrics = ClientMetrics(metrics or REGISTRY)
+        self._topic_metrics = {}
+        self._queue_depth = self.metrics.queue_depth.labels(client_id)
+        self._dropped = self.metrics.dropped.labels(client_id)
+        self._connected = False
+        self._clock = clock
+        self.qos = qos
+        self.latency = LatencyTracker(latency_window)
         self.broker = broker
         self.port = port
-        self.queue = Queue()
+        self.queue = Queue(maxsize=queue_maxsize)
+        self.vessel_id = vessel_id
+        self.sinks = []
+        if self.kind is not None:
+            self.topic = topics.resolve_topic(self.kind, vessel_id, topic_scheme)
 
     def connect(self, username, password):
         self.client.username_pw_set(f"{username}", f"{password}")
@@ -44,6 +91,9 @@ class Subscriber:
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             print("Connected successfully.")
+            if self._connected:
+                self.metrics.reconnects.labels(self.client_id).inc()
+            self._connected = True
         else:
             print(f"Connect failed with return code {rc}")
 
@@ -56,15 +106,89 @@ class Subscriber:
     def loop_stop(self):
         self.client.loop_stop()
     
+    def attach(self, sink):
+        '''
+        Adds a sink, whose 'put(topic, message)' is called with every decoded message in the network
+        thread, so it must not block.
+        '''
+        self.sinks.append(sink)
+
     def get(self):
         '''
         Return a dataclass object from the queue, if any is present, return 0 otherwise.
         '''
         if not self.queue.empty():
-            return self.queue.get()
+            message = self.queue.get()
+            self._queue_depth.set(self.queue.qsize())
+            return message
         else:
             return 0
 
+    def _decode(self, msg, decoder):
+        '''
+        Decodes a received message, records the message, byte and decode latency metrics, and puts
+        the message in the sinks. Returns None if the message is malformed.
+        '''
+        received_at = self._clock()
+        with profiling.span(profiling.RECEIVE, msg.topic):
+            received, nbytes, decode_seconds, malformed = self._metrics_of(msg.topic)
+            received.inc()
+            nbytes.inc(len(msg.payload))
+            start = time.perf_counter()
+            try:
+                # Convert NMEA string to data object
+                with profiling.span(profiling.DECODE, msg.topic):
+                    message = decoder(msg.payload.decode())
+            except (ValueError, KeyError, TypeError, IndexError):
+                message = None
+            decode_seconds.observe(time.perf_counter() - start)
+            if message is None:
+                malformed.inc()
+            else:
+                if isinstance(message.header, dict):
+                    self._trace(message.header, received_at)
+                for sink in self.sinks:
+                    sink.put(msg.topic, message)
+        return message
+
+    def _trace(self, header, received_at):
+        '''
+        Records the latency, gaps, reorders, duplicates and restarts of a received message header.
+        '''
+        latency, event = self.latency.record(header, received_at)
+        if latency is not None:
+            self.metrics.delivery_seconds.labels(self.client_id).observe(latency)
+        if event == "gap":
+            self.metrics.sequence_gaps.labels(self.client_id).inc()
+        elif event == "reorder":
+            self.metrics.reorders.labels(self.client_id).inc()
+        elif event == "duplicate":
+            self.metrics.duplicates.labels(self.client_id).inc()
+        elif event == "restart":
+            self.metrics.publisher_restarts.labels(self.client_id).inc()
+
+    def _enqueue(self, message):
+        '''
+        Puts a message in the queue, or drops it if the queue is full.
+        '''
+        try:
+            with profiling.span(profiling.ENQUEUE):
+                self.queue.put_nowait(message)
+        except Full:
+            self._dropped.inc()
+        self._queue_depth.set(self.queue.qsize())
+
+    def _metrics_of(self, topic):
+        topic_metrics = self._topic_metrics.get(topic)
+        if topic_metrics is None:
+            topic_metrics = self._topic_metrics[topic] = (
+                self.metrics.messages_received.labels(self.client_id, topic),
+                self.metrics.bytes_received.labels(self.client_id, topic),
+                self.metrics.decode_seconds.labels(self.client_id, topic),
+                self.metrics.malformed.labels(self.client_id, topic),
+            )
+        return topic_metrics
+
 
 class TrajectorySubscriber(Subscriber):
     '''
@@ -75,20 +199,30 @@ class TrajectorySubscriber(Subscriber):
         client_id (str): The client ID to use when connecting to the broker.
         broker (str): The IP address of the MQTT broker.
         port (int): The port number of the MQTT broker.
+        vessel_id (str): Subscribe to the topics of this vessel. The legacy topic 'trajectory/topic' is used if not given.
+        topic_scheme (TopicScheme): The topic templates used with 'vessel_id'.
+        queue_maxsize (int): Maximum number of messages in the queue. 0 means unbounded.
+        metrics (MetricsRegistry): Registry for the metrics.
+        clock (callable): Clock of the receive time.
+        latency_window (int): Number of latencies kept for the rolling percentiles.
+        client_factory (callable): Creates the MQTT client from the client ID.
+        qos (int): The maximum QoS level of the subscriptions.
     --------------------------------------------------------------------
     '''
+    kind = topics.TRAJECTORY
+
     def on_connect(self, client, userdata, flags, rc):
-        topic = "trajectory/topic"
+        topic = self.topic
         super().on_connect(client, userdata, flags, rc)
         if rc == 0:
-            client.subscribe(topic)
+            client.subscribe(topic, self.qos)
             print(f"Subscribed to topic '{topic}'")
 
     def on_message(self, client, userdata, msg):
         # Convert NMEA string to Trajectory object
-        mqtt_str = msg.payload.decode()
-        trajectory = mnb.from_mqtt_str_to_traj(mqtt_str)
-        self.queue.put(trajectory)
+        trajectory = self._decode(msg, mnb.from_mqtt_str_to_traj)
+        if trajectory is not None:
+            self._enqueue(trajectory)
 
 
 class ShipStateSubscriber(Subscriber):
@@ -100,20 +234,30 @@ class ShipStateSubscriber(Subscriber):
         client_id (str): The client ID to use when connecting to the broker.
         broker (str): The IP address of the MQTT broker.
         port (int): The port number of the MQTT broker.
+        vessel_id (str): Subscribe to the topics of this vessel. The legacy topic 'ship_state/topic' is used if not given.
+        topic_scheme (TopicScheme): The topic templates used with 'vessel_id'.
+        queue_maxsize (int): Maximum number of messages in the queue. 0 means unbounded.
+        metrics (MetricsRegistry): Registry for the metrics.
+        clock (callable): Clock of the receive time.
+        latency_window (int): Number of latencies kept for the rolling percentiles.
+        client_factory (callable): Creates the MQTT client from the client ID.
+        qos (int): The maximum QoS level of the subscriptions.
     --------------------------------------------------------------------
     '''
+    kind = topics.SHIP_STATE
+
     def on_connect(self, client, userdata, flags, rc):
-        topic = "ship_state/topic"
+        topic = self.topic
         super().on_connect(client, userdata, flags, rc)
         if rc == 0:
-            client.subscribe(topic)
+            client.subscribe(topic, self.qos)
             print(f"Subscribed to topic '{topic}'")
 
     def on_message(self, client, userdata, msg):
         # Convert NMEA string to ShipState object
-        mqtt_str = msg.payload.decode()
-        ship_state = mnb.from_mqtt_str_to_shipstate(mqtt_str)
-        self.queue.put(ship_state)
+        ship_state = self._decode(msg, mnb.from_mqtt_str_to_shipstate)
+        if ship_state is not None:
+            self._enqueue(ship_state)
 
 
 class WindStateSubscriber(Subscriber):
@@ -125,17 +269,110 @@ class WindStateSubscriber(Subscriber):
         client_id (str): The client ID to use when connecting to the broker.
         broker (str): The IP address of the MQTT broker.
         port (int): The port number of the MQTT broker.
+        vessel_id (str): Subscribe to the topics of this vessel. The legacy topic 'wind_state/topic' is used if not given.
+        topic_scheme (TopicScheme): The topic templates used with 'vessel_id'.
+        queue_maxsize (int): Maximum number of messages in the queue. 0 means unbounded.
+        metrics (MetricsRegistry): Registry for the metrics.
+        clock (callable): Clock of the receive time.
+        latency_window (int): Number of latencies kept for the rolling percentiles.
+        client_factory (callable): Creates the MQTT client from the client ID.
+        qos (int): The maximum QoS level of the subscriptions.
+        statistics_windows (tuple of floats): The windows in seconds of the rolling wind statistics, see
+            'wind_statistics'. None to not keep statistics.
+        statistics_period (float): The period of the wind directions, 360 for degrees like the wire
+            format, 2*pi for radians.
     --------------------------------------------------------------------
     '''
+    kind = topics.WIND_STATE
+
+    def __init__(self, client_id, broker, port, vessel_id=None, topic_scheme=None, queue_maxsize=0, metrics=None,
+                 clock=time.monotonic, latency_window=1024, client_factory=mqtt.Client, qos=0,
+                 statistics_windows=DEFAULT_WINDOWS, statistics_period=360.0):
+        super().__init__(client_id, broker, port, vessel_id=vessel_id, topic_scheme=topic_scheme,
+                         queue_maxsize=queue_maxsize, metrics=metrics, clock=clock, latency_window=latency_window,
+                         client_factory=client_factory, qos=qos)
+        self.statistics = None if statistics_windows is None else WindStatisticsTracker(statistics_windows, statistics_period)
+
+    def wind_statistics(self, window=None, now=None):
+        '''
+        Return the rolling statistics of the received wind states over a window, or over all
+        windows as a dict by window if 'window' is None. See 'WindStatisticsTracker.statistics'.
+        '''
+        if self.statistics is None:
+            raise ValueError("The subscriber was created with 'statistics_windows=None'.")
+        return self.statistics.statistics(window, now)
+
     def on_connect(self, client, userdata, flags, rc):
-        topic = "wind_state/topic"
+        topic = self.topic
         super().on_connect(client, userdata, flags, rc)
         if rc == 0:
-            client.subscribe(topic)
+            client.subscribe(topic, self.qos)
             print(f"Subscribed to topic '{topic}'")
             
     def on_message(self, client, userdata, msg):
         # Convert NMEA string to WindState object
-        mqtt_str = msg.payload.decode()
-        wind_state = mnb.from_mqtt_str_to_windstate(mqtt_str)
-        self.queue.put(wind_state)
+        wind_state = self._decode(msg, mnb.from_mqtt_str_to_windstate)
+        if wind_state is not None:
+            if self.statistics is not None:
+                self.statistics.add(wind_state)
+            self._enqueue(wind_state)
+
+
+class FleetSubscriber(Subscriber):
+    '''
+    Client class for subscribing to the messages of every vessel on an MQTT broker.
+
+    One wildcard subscription is made per message kind, and each received message is routed to a
+    per-vessel cache of the latest messages and their histories, keyed by the vessel ID in the topic.
+    The messages are not put in the queue; use 'latest', 'history' or 'fleet' instead.
+
+    --------------------------------------------------------------------
+    Parameters:
+        client_id (str): The client ID to use when connecting to the broker.
+        broker (str): The IP address of the MQTT broker.
+        port (int): The port number of the MQTT broker.
+        topic_scheme (TopicScheme): The topic templates. Defaults to 'vessel/{vessel_id}/<kind>'.
+        kinds (tuple of str): The message kinds to subscribe to.
+        history (int): Number of messages kept per vessel and message kind.
+        metrics (MetricsRegistry): Registry for the metrics.
+        clock (callable): Clock of the receive time.
+        latency_window (int): Number of latencies kept for the rolling percentiles.
+        client_factory (callable): Creates the MQTT client from the client ID.
+        qos (int): The maximum QoS level of the subscriptions.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, client_id, broker, port, topic_scheme=None, kinds=topics.KINDS, history=100, metrics=None,
+                 clock=time.monotonic, latency_window=1024, client_factory=mqtt.Client, qos=0):
+        super().__init__(client_id, broker, port, metrics=metrics, clock=clock, latency_window=latency_window,
+                         client_factory=client_factory, qos=qos)
+        self.topic_scheme = topic_scheme or topics.DEFAULT_SCHEME
+        self.kinds = tuple(kinds)
+        self.fleet = FleetCache(history)
+
+    def on_connect(self, client, userdata, flags, rc):
+        super().on_connect(client, userdata, flags, rc)
+        if rc == 0:
+            subscriptions = [(self.topic_scheme.subscription(kind), self.qos) for kind in self.kinds]
+            client.subscribe(subscriptions)
+            print(f"Subscribed to topics {[topic for topic, _ in subscriptions]}")
+
+    def on_message(self, client, userdata, msg):
+        route = self.topic_scheme.parse(msg.topic)
+        if route is None:
+            return
+        kind, vessel_id = route
+        message = self._decode(msg, _DECODERS[kind])
+        if message is not None:
+            self.fleet.update(vessel_id, kind, message)
+
+    def latest(self, vessel_id, kind):
+        '''
+        Return the latest message of a kind from a vessel, or None if none has been received.
+        '''
+        return self.fleet.latest(vessel_id, kind)
+
+    def history(self, vessel_id, kind):
+        '''
+        Return the history of a message kind from a vessel, oldest first.
+        '''
+        return self.fleet.history(vessel_id, kind)
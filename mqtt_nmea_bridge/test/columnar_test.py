@@ -0,0 +1,36 @@
+from mqtt_nmea_bridge.columnar import ColumnarDataset, convert_dataset
+from mqtt_nmea_bridge.datasets import load_dataset
+import numpy as np
+import pytest
+import os
+
+DATASET = "example_data/example_trajectory_noisy_model.csv"
+
+
+def test_round_trip_and_time_window(tmp_path):
+    path = str(tmp_path / "dataset.mnbcol")
+    csv = load_dataset(DATASET, cache=False)
+    columnar = convert_dataset(DATASET, path, block_size=100)
+    assert len(columnar) == len(csv)
+    assert isinstance(columnar.time, np.memmap)
+    assert np.array_equal(columnar.to_dataset().data, csv.data)
+
+    start = csv.time[100] + 1e-9
+    window = columnar.window(start, 10.0)
+    mask = (csv.time >= start) & (csv.time < start + 10.0)
+    assert np.array_equal(window.data, csv.data[mask])
+    assert sum(len(block) for block in columnar.blocks(64, start=csv.time[10])) == len(csv) - 10
+
+
+def test_failed_conversion_is_incomplete(tmp_path):
+    csv_path = str(tmp_path / "broken.csv")
+    with open(DATASET) as f:
+        lines = [next(f) for _ in range(301)]
+    with open(csv_path, "w") as f:
+        f.writelines(lines + ["not, a, data, point\n"])
+    path = str(tmp_path / "broken.mnbcol")
+    with pytest.raises(ValueError):
+        convert_dataset(csv_path, path, block_size=100)
+    assert not os.path.exists(os.path.join(path, "meta.json"))
+    with pytest.raises(FileNotFoundError):
+        ColumnarDataset(path)
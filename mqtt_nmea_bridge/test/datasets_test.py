@@ -0,0 +1,58 @@
+from mqtt_nmea_bridge.datasets import load_dataset, parse_dataset, read_blocks, CACHE_SUFFIX
+import numpy as np
+import pytest
+import shutil
+import os
+
+DATASET = "example_data/example_trajectory_noisy_model.csv"
+
+
+def _parse_line(line):
+    # The original per-field parser, kept as an independent reference for the vectorized one
+    line = line.strip().replace("\"", "").replace("[", "").replace("]", "").split(",")
+    time = float(line[0])
+    X = [float(x) for x in line[1:7]]
+    CS = [float(line[7]), float(line[8])]
+    U = [float(u) for u in line[9:]]
+    return [time, X, CS, U]
+
+
+def test_matches_line_parser(tmp_path):
+    path = str(tmp_path / "dataset.csv")
+    shutil.copy(DATASET, path)
+    dataset = load_dataset(path)
+    with open(path, "r") as f:
+        next(f)
+        expected = [_parse_line(line) for line in f if line.strip()]
+    assert dataset.to_list() == expected
+    assert dataset.nr_of_actuators == 7
+    assert dataset.X.shape == (len(dataset), 6)
+    assert os.path.exists(path + CACHE_SUFFIX)
+
+
+def test_cache_is_invalidated_on_change(tmp_path):
+    path = str(tmp_path / "dataset.csv")
+    shutil.copy(DATASET, path)
+    first = load_dataset(path)
+    with open(path, "r") as f:
+        lines = f.readlines()
+    with open(path, "w") as f:
+        f.writelines(lines[:11])
+    # Changing the size invalidates the sidecar even if the modification time is unchanged
+    stat = os.stat(path + CACHE_SUFFIX)
+    assert len(load_dataset(path)) == 10
+    assert os.stat(path + CACHE_SUFFIX).st_size < stat.st_size
+    assert np.array_equal(load_dataset(path).data, first.data[:10])
+
+
+def test_ragged_rows_are_rejected():
+    text = 'timestamp,X,CS,U\n0.5,"[1, 2, 3, 4, 5, 6]","[7, 8]","[0.1, 0.2]"\n1.0,"[1, 2, 3, 4, 5, 6]","[7, 8]","[0.1]"\n'
+    with pytest.raises(ValueError):
+        parse_dataset(text)
+
+
+def test_blocks_match_full_load():
+    dataset = load_dataset(DATASET, cache=False)
+    blocks = list(read_blocks(DATASET, block_size=100))
+    assert [len(block) for block in blocks[:-1]] == [100] * (len(blocks) - 1)
+    assert np.array_equal(np.concatenate([block.data for block in blocks]), dataset.data)
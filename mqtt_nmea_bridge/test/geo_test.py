@@ -0,0 +1,29 @@
+from mqtt_nmea_bridge import geo
+from mqtt_nmea_bridge.datasets import load_dataset
+import numpy as np
+import pytest
+
+pytest.importorskip("pyproj")
+
+DATASET = "example_data/example_docking_trajectory.csv"
+
+
+def test_utm_zones():
+    assert geo.utm_crs(51.29, 4.26) == "EPSG:32631"
+    assert geo.utm_crs(63.43, 10.39) == "EPSG:32632"  # Trondheim, in the widened zone 32
+    assert geo.utm_crs(78.22, 15.65) == "EPSG:32633"  # Svalbard
+    assert geo.utm_crs(-33.9, 18.4) == "EPSG:32734"
+
+
+def test_batched_transform_matches_point_by_point():
+    dataset = load_dataset(DATASET)[::100]
+    latitude, longitude = dataset.X[:, 0], dataset.X[:, 1]
+    points, crs = geo.latlon_to_utm(latitude, longitude)
+    assert crs == "EPSG:32631"
+    single = [geo.latlon_to_utm(lat, lon, crs)[0][0] for lat, lon in zip(latitude, longitude)]
+    np.testing.assert_allclose(points, single)
+    assert geo.transformer(geo.WGS84, crs) is geo.transformer(geo.WGS84, crs)
+    lat, lon = geo.utm_to_latlon(points, crs)
+    np.testing.assert_allclose(lat, latitude, atol=1e-9)
+    np.testing.assert_allclose(lon, longitude, atol=1e-9)
+    np.testing.assert_allclose(geo.latlon_to_ned(latitude, longitude, points[0], crs)[0], [0.0, 0.0])
@@ -0,0 +1,42 @@
+import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge.datasets import load_dataset
+
+DATASET = "example_data/example_docking_trajectory.csv"
+
+
+def test_horizon_matches_linear_scan():
+    dataset = load_dataset(DATASET)[::10]
+    times = dataset.time.tolist()
+    moving_trajectory = mnb.MovingTrajectory(dataset.to_list(), 300)
+    for timestamp in [times[0], times[5] + 0.1, 100.0, 1000.0, times[-1] - 1.0]:
+        moving_trajectory.update_moving_trajectory([timestamp, [60.0, 10.0, 0.0, 0, 0, 0], [0.0, 0.0], [0.0] * 7])
+        inside = [t for t in times if timestamp <= t]
+        end = next((i for i, t in enumerate(inside) if t >= timestamp + 300), len(inside) - 1)
+        expected = inside[:end + 1]
+        if expected[0] != timestamp:
+            expected = [timestamp] + expected
+        assert [shipstate.time for shipstate in moving_trajectory.trajectory.shipstates] == expected
+    moving_trajectory.update_moving_trajectory([times[-1] + 1.0, [60.0, 10.0, 0.0, 0, 0, 0], [0.0, 0.0], [0.0] * 7])
+    assert len(moving_trajectory) == 0
+
+
+def test_waypoints_are_reused_between_horizons():
+    dataset = load_dataset(DATASET)
+    moving_trajectory = mnb.MovingTrajectory(dataset, 300)
+    first = moving_trajectory.trajectory.shipstates
+    moving_trajectory.update_moving_trajectory(dataset[100])
+    second = moving_trajectory.trajectory.shipstates
+    assert second[0] is first[100]
+    assert len(second) == len(moving_trajectory)
+
+
+def test_only_the_horizon_is_cached():
+    dataset = load_dataset(DATASET)
+    moving_trajectory = mnb.MovingTrajectory(dataset, 30)
+    for index in range(0, len(dataset), 50):
+        moving_trajectory.update_moving_trajectory(dataset[index])
+        moving_trajectory.trajectory
+        start, end = moving_trajectory.indices
+        assert set(moving_trajectory._shipstates) == set(range(start, end))
+    moving_trajectory.update_moving_trajectory(dataset[0])
+    assert len(moving_trajectory._shipstates) == 0
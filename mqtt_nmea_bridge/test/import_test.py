@@ -0,0 +1,23 @@
+import mqtt_nmea_bridge as mnb
+import subprocess
+import sys
+
+
+def _loaded_modules(statements):
+    script = f"import sys\n{statements}\nprint(' '.join(sorted(sys.modules)))"
+    return set(subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout.split())
+
+
+def test_codecs_and_data_classes_do_not_load_paho():
+    loaded = _loaded_modules("import mqtt_nmea_bridge as mnb\n"
+                             "from mqtt_nmea_bridge import mqtt_str_utils, ShipState, Trajectory, WindState\n"
+                             "mnb.from_mqtt_str_to_shipstate")
+    assert "paho.mqtt.client" not in loaded and "numpy" not in loaded
+    assert "mqtt_nmea_bridge.publishers" not in loaded
+
+
+def test_public_names_resolve():
+    for name in mnb.__all__:
+        assert getattr(mnb, name) is not None
+    assert mnb.loopback.LoopbackBroker is mnb.LoopbackBroker
+    assert "ShipStatePublisher" in dir(mnb)
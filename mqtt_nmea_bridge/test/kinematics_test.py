@@ -0,0 +1,44 @@
+import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge import kinematics
+from mqtt_nmea_bridge.datasets import load_dataset
+import numpy as np
+import pytest
+
+DATASET = "example_data/example_docking_trajectory.csv"
+
+
+def _track(course, speed, n=50, dt=0.5, latitude=63.4, longitude=10.4):
+    # Straight track at a constant course and speed, in a local plane
+    t = np.arange(n)*dt
+    north = speed*t*np.cos(np.radians(course))
+    east = speed*t*np.sin(np.radians(course))
+    lat = latitude + np.degrees(north/kinematics.EARTH_RADIUS)
+    lon = longitude + np.degrees(east/(kinematics.EARTH_RADIUS*np.cos(np.radians(latitude))))
+    return t, lat, lon
+
+
+@pytest.mark.parametrize("method", kinematics.METHODS)
+def test_course_and_speed_of_straight_track(method):
+    t, lat, lon = _track(-135.0, 3.0)
+    cog, sog = kinematics.course_and_speed(t, lat, lon, method)
+    np.testing.assert_allclose(cog, -135.0, atol=0.01)
+    np.testing.assert_allclose(sog, 3.0, rtol=1e-3)
+
+
+def test_speed_matches_dataset_and_estimator():
+    dataset = load_dataset(DATASET)
+    cog, sog = kinematics.course_and_speed(dataset.time, dataset.X[:, 0], dataset.X[:, 1])
+    assert np.median(np.abs(sog - dataset.CS[:, 1])) < 0.01
+    estimator = kinematics.CourseSpeedEstimator()
+    estimated = [estimator.update(*row) for row in dataset.data[:, :3].tolist()]
+    np.testing.assert_allclose([s for _, s in estimated[1:]], sog[1:], rtol=1e-6, atol=1e-9)
+
+
+def test_fill_missing_course_and_speed():
+    t, lat, lon = _track(90.0, 2.0, n=5)
+    trajectory = mnb.Trajectory([mnb.ShipState(time=ti, latitude=a, longitude=b, heading=90.0, cog=None, sog=None,
+                                               nr_of_actuators=1, actuator_values=[0.0]) for ti, a, b in zip(t, lat, lon)])
+    trajectory.shipstates[2].sog = 5.0
+    kinematics.fill_course_and_speed(trajectory)
+    assert [round(s.cog, 3) for s in trajectory.shipstates] == [90.0]*5
+    assert [round(s.sog, 3) for s in trajectory.shipstates] == [2.0, 2.0, 5.0, 2.0, 2.0]
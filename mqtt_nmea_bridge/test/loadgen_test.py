@@ -0,0 +1,21 @@
+from mqtt_nmea_bridge.benchmarks import loadgen
+from mqtt_nmea_bridge.loopback import LoopbackBroker
+
+
+def test_loopback_run():
+    broker = LoopbackBroker()
+    try:
+        report = loadgen.run(n_vessels=3, ship_state_rate=5.0, wind_state_rate=1.0, trajectory_rate=1.0, horizon=5,
+                             duration=1.0, qos=1, client_factory=broker.client, subscribe=True, verbose=False)
+    finally:
+        broker.close()
+    assert report["sent_by_kind"] == {"ship_state": 15, "trajectory": 3, "wind_state": 3}
+    assert report["sent"] == report["received"] == report["acked"] == 21
+    assert report["failed"] == 0 and report["unacked"] == 0 and report["sequence_gaps"] == 0
+
+
+def test_wind_direction_in_degrees():
+    vessel = loadgen.SyntheticVessel("v", 0)
+    directions = [vessel.wind_state(float(t)).direction for t in range(0, 1000, 7)]
+    assert all(-180.0 <= direction < 180.0 for direction in directions)
+    assert min(abs(direction) for direction in directions) > 169.0
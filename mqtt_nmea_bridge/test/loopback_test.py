@@ -0,0 +1,126 @@
+import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge.loopback import LoopbackBroker, topic_matches
+import time
+
+
+def _wait_for(condition, timeout=5.0):
+    start = time.monotonic()
+    while not condition() and time.monotonic() - start < timeout:
+        time.sleep(0.001)
+    return condition()
+
+
+def _ship_state(t):
+    return mnb.ShipState(time=t, latitude=51.29, longitude=4.26, heading=-140.0, cog=-62.0, sog=1.0,
+                         nr_of_actuators=7, actuator_values=[0.5]*7)
+
+
+def test_topic_matches():
+    assert topic_matches("vessel/+/ship_state", "vessel/v1/ship_state")
+    assert topic_matches("vessel/#", "vessel/v1/ship_state")
+    assert topic_matches("#", "ship_state/topic")
+    assert not topic_matches("vessel/+", "vessel/v1/ship_state")
+    assert not topic_matches("+/topic", "$SYS/topic")
+
+
+def test_publisher_to_subscriber():
+    broker = LoopbackBroker()
+    publisher = mnb.ShipStatePublisher("pub", "localhost", 1883, client_factory=broker.client)
+    subscriber = mnb.ShipStateSubscriber("sub", "localhost", 1883, client_factory=broker.client)
+    subscriber.connect("sub", "password")
+    publisher.connect("pub", "password")
+    assert _wait_for(lambda: subscriber._connected and publisher._connected)
+
+    for t in range(100):
+        publisher.publish(_ship_state(t))
+    received = []
+    assert _wait_for(lambda: received.extend(iter(subscriber.get, 0)) or len(received) == 100)
+    assert [ship_state.time for ship_state in received] == list(range(100))
+    assert subscriber.latency.count == 100 and subscriber.latency.gaps == 0
+    broker.close()
+
+
+def test_wildcard_and_shared_subscriptions():
+    broker = LoopbackBroker()
+    fleet = mnb.FleetSubscriber("fleet", "localhost", 1883, client_factory=broker.client)
+    fleet.connect("fleet", "password")
+    shared = []
+    for i in range(2):
+        client = broker.client(f"shared_{i}")
+        client.on_message = lambda client, userdata, msg, i=i: shared.append(i)
+        client.connect()
+        client.subscribe("$share/group/vessel/+/ship_state")
+    assert _wait_for(lambda: fleet._connected)
+
+    publishers = [mnb.ShipStatePublisher(f"pub_{v}", "localhost", 1883, vessel_id=f"v{v}", client_factory=broker.client)
+                  for v in range(10)]
+    for publisher in publishers:
+        publisher.connect("pub", "password")
+    for t in range(10):
+        for publisher in publishers:
+            publisher.publish(_ship_state(t))
+    assert _wait_for(lambda: len(shared) == 100 and all(fleet.latest(f"v{v}", "ship_state") is not None and
+                                                        fleet.latest(f"v{v}", "ship_state").time == 9 for v in range(10)))
+    # Each shared message is delivered to one member of the group
+    assert shared.count(0) == 50 and shared.count(1) == 50
+    broker.close()
+
+
+def test_qos1_is_delivered_despite_loss():
+    broker = LoopbackBroker(loss=0.3, latency=0.001, retry_interval=0.001, seed=1)
+    publisher = mnb.WindStatePublisher("pub", "localhost", 1883, client_factory=broker.client, qos=1)
+    subscriber = mnb.WindStateSubscriber("sub", "localhost", 1883, client_factory=broker.client, qos=1)
+    subscriber.connect("sub", "password")
+    publisher.connect("pub", "password")
+    assert _wait_for(lambda: subscriber._connected and publisher._connected)
+
+    infos = [publisher.client.publish(publisher.topic, mnb.from_windstate_to_mqtt_str(mnb.WindState(t, 5.0, 0.1)), 1)
+             for t in range(200)]
+    assert all(info.wait_for_publish(5) for info in infos)
+    assert _wait_for(lambda: subscriber.queue.qsize() == 200)
+    assert broker.stats["lost"] > 0 and broker.stats["retransmitted"] == broker.stats["lost"]
+    broker.close()
+
+
+def test_qos0_is_dropped_on_loss():
+    broker = LoopbackBroker(loss=0.5, seed=2)
+    received = []
+    subscriber = broker.client("sub")
+    subscriber.on_message = lambda client, userdata, msg: received.append(msg.payload)
+    subscriber.connect()
+    subscriber.subscribe("test/#")
+    publisher = broker.client("pub")
+    publisher.connect()
+    for i in range(200):
+        publisher.publish("test/topic", str(i))
+    assert _wait_for(lambda: len(received) + broker.stats["lost"] == 200)
+    assert 0 < len(received) < 200
+    broker.close()
+
+
+def test_failing_callback_does_not_stop_the_dispatcher():
+    broker = LoopbackBroker()
+    received = []
+
+    def on_message(client, userdata, msg):
+        if msg.payload == b"1":
+            raise ValueError("Bad message.")
+        received.append(msg.payload)
+
+    failing = broker.client("failing")
+    failing.on_connect = lambda client, userdata, flags, rc: 1/0
+    failing.on_message = on_message
+    failing.connect()
+    failing.subscribe("test/#")
+    subscriber = broker.client("sub")
+    subscriber.on_message = lambda client, userdata, msg: received.append(msg.payload)
+    subscriber.connect()
+    subscriber.subscribe("test/#")
+    publisher = broker.client("pub")
+    publisher.connect()
+    for i in range(3):
+        publisher.publish("test/topic", str(i))
+    assert _wait_for(lambda: len(received) == 5)
+    assert sorted(received) == [b"0", b"0", b"1", b"2", b"2"]
+    assert broker.stats["callback_errors"] == 2
+    broker.close()
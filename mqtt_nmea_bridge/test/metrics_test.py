@@ -0,0 +1,60 @@
+from mqtt_nmea_bridge.metrics import MetricsRegistry
+from urllib.error import HTTPError
+from urllib.request import urlopen
+import pytest
+
+
+def test_render_counters_and_gauges():
+    registry = MetricsRegistry()
+    counter = registry.counter("mnb_test_total", "Messages on a topic.", ("client_id", "topic"))
+    counter.labels("sub", 'odd "topic"\\with\nnewline').inc(2)
+    counter.labels(client_id="sub", topic="plain").inc(0.5)
+    registry.gauge("mnb_test_depth", "Queue depth\\in \"messages\"\nper client.").labels().set(3)
+    assert registry.render().splitlines() == [
+        "# HELP mnb_test_total Messages on a topic.",
+        "# TYPE mnb_test_total counter",
+        'mnb_test_total{client_id="sub",topic="odd \\"topic\\"\\\\with\\nnewline"} 2',
+        'mnb_test_total{client_id="sub",topic="plain"} 0.5',
+        '# HELP mnb_test_depth Queue depth\\\\in "messages"\\nper client.',
+        "# TYPE mnb_test_depth gauge",
+        "mnb_test_depth 3",
+    ]
+    with pytest.raises(ValueError):
+        registry.gauge("mnb_test_total", "Another type.")
+    with pytest.raises(ValueError):
+        counter.labels("sub")
+
+
+def test_render_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("mnb_test_seconds", "Latency.", ("client_id",), buckets=(0.1, 0.01, 1.0))
+    child = histogram.labels("sub")
+    for value in (0.005, 0.01, 0.05, 0.5, 0.5, 2.0):
+        child.observe(value)
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'mnb_test_seconds_bucket{client_id="sub",le="0.01"} 2',
+        'mnb_test_seconds_bucket{client_id="sub",le="0.1"} 3',
+        'mnb_test_seconds_bucket{client_id="sub",le="1"} 5',
+        'mnb_test_seconds_bucket{client_id="sub",le="+Inf"} 6',
+        'mnb_test_seconds_sum{client_id="sub"} 3.065',
+        'mnb_test_seconds_count{client_id="sub"} 6',
+    ]
+
+
+def test_http_server():
+    registry = MetricsRegistry()
+    registry.counter("mnb_test_total", "Messages.").labels().inc()
+    server = registry.start_http_server(port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urlopen(f"{url}/metrics", timeout=5) as response:
+            assert response.status == 200
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert response.read().decode() == registry.render()
+        with pytest.raises(HTTPError) as error:
+            urlopen(f"{url}/other", timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,38 @@
+import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge import profiling
+import cProfile
+import pstats
+
+
+def _ship_state(t):
+    return mnb.ShipState(time=t, latitude=63.4, longitude=10.4, heading=0.0, cog=0.0, sog=1.0,
+                         nr_of_actuators=2, actuator_values=[0.1, 0.2])
+
+
+def test_sampling_and_callback():
+    calls = []
+    with profiling.Profiler(sample_every=3, spans=(profiling.SERIALIZE, profiling.PARSE),
+                            callback=lambda name, key, seconds: calls.append(name)) as profiler:
+        assert profiling.active() is profiler
+        for t in range(9):
+            mnb.from_mqtt_str_to_shipstate(mnb.from_shipstate_to_mqtt_str(_ship_state(t)))
+    assert profiling.active() is None
+    assert calls.count(profiling.SERIALIZE) == 3 and calls.count(profiling.PARSE) == 3
+    summary = profiler.summary()
+    assert set(summary) == {profiling.SERIALIZE, profiling.PARSE}
+    assert summary[profiling.PARSE]["count"] == 3
+    assert profiling.span(profiling.PARSE) is profiling._NULL_SPAN
+
+
+def test_nested_cprofile_spans():
+    profile = cProfile.Profile()
+    broker = mnb.LoopbackBroker()
+    subscriber = mnb.ShipStateSubscriber("sub", "localhost", 1883, client_factory=broker.client)
+    with profiling.Profiler(context=profiling.cprofile_context(profile)):
+        # Receive, decode and parse are nested spans on the same thread
+        subscriber.on_message(None, None, mnb.loopback.LoopbackMessage("ship_state/topic",
+                                                                        mnb.from_shipstate_to_mqtt_str(_ship_state(0)).encode()))
+    broker.close()
+    assert subscriber.get() == _ship_state(0)
+    functions = {function for _, _, function in pstats.Stats(profile).stats}
+    assert "from_mqtt_str_to_shipstate" in functions
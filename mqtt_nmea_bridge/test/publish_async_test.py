@@ -0,0 +1,100 @@
+from mqtt_nmea_bridge.loopback import LoopbackBroker
+from mqtt_nmea_bridge.publishers import Publisher
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import time
+
+
+class _SlowPublisher(Publisher):
+    # Later messages are encoded faster, so the workers finish them out of order
+    def encode(self, message, header=None):
+        if message < 0:
+            raise ValueError("Can not encode a negative message.")
+        time.sleep(0.002 * (10 - message % 10))
+        return str(message)
+
+
+def _connect(broker, executor=None):
+    received = []
+    listener = broker.client("listener")
+    listener.connect()
+    listener.on_message = lambda client, userdata, msg: received.append((msg.topic, int(msg.payload)))
+    listener.subscribe("test/#", 1)
+    publisher = _SlowPublisher("pub", "localhost", 1883, executor=executor, client_factory=broker.client, qos=1)
+    publisher.connect("", "")
+    return publisher, received
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return condition()
+
+
+def test_publish_async_keeps_the_order_per_topic():
+    broker = LoopbackBroker()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        publisher, received = _connect(broker, executor)
+        futures = [publisher.publish_async(i, f"test/{i % 2}") for i in range(40)]
+        for future in futures:
+            future.result(5.0)
+        assert _wait_for(lambda: len(received) == 40)
+    broker.close()
+    for topic in ("test/0", "test/1"):
+        assert [i for t, i in received if t == topic] == [i for i in range(40) if f"test/{i % 2}" == topic]
+
+
+def test_publish_async_encode_error():
+    broker = LoopbackBroker()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        publisher, received = _connect(broker, executor)
+        futures = [publisher.publish_async(i, "test/0") for i in (1, -1, 2)]
+        with pytest.raises(ValueError):
+            futures[1].result(5.0)
+        assert futures[0].result(5.0).rc == 0 and futures[2].result(5.0).rc == 0
+        assert _wait_for(lambda: len(received) == 2)
+    broker.close()
+    assert [i for _, i in received] == [1, 2]
+
+
+def test_loop_stop_shuts_down_the_own_executor_only():
+    broker = LoopbackBroker()
+    publisher, received = _connect(broker)
+    futures = [publisher.publish_async(i, "test/0") for i in range(10)]
+    executor = publisher._executor
+    publisher.loop_stop()
+    # The pending messages are published before the executor is shut down
+    assert all(future.done() and future.exception() is None for future in futures)
+    assert publisher._executor is None
+    with pytest.raises(RuntimeError):
+        executor.submit(print)
+    assert _wait_for(lambda: len(received) == 10)
+
+    with ThreadPoolExecutor(max_workers=1) as shared:
+        publisher, _ = _connect(broker, shared)
+        publisher.publish_async(0, "test/0").result(5.0)
+        publisher.loop_stop()
+        assert shared.submit(lambda: 1).result() == 1
+    broker.close()
+
+
+def test_publish_async_sends_outside_the_lock():
+    broker = LoopbackBroker()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        publisher, received = _connect(broker, executor)
+        send = publisher._send
+        chained = []
+
+        def _send(topic, payload, *args):
+            # A send that publishes again, e.g. from a callback, must not wait for the lock
+            if topic == "test/0":
+                chained.append(publisher.publish_async(int(payload) + 100, "test/1"))
+            return send(topic, payload, *args)
+
+        publisher._send = _send
+        publisher.publish_async(1, "test/0").result(5.0)
+        assert chained[0].result(5.0).rc == 0
+        assert _wait_for(lambda: len(received) == 2)
+    broker.close()
+    assert sorted(i for _, i in received) == [1, 101]
@@ -0,0 +1,103 @@
+from mqtt_nmea_bridge.replay import ReplayScheduler, merge_streams, replay_streams
+import pytest
+
+
+class FakeClock:
+    '''
+    Clock that only advances when slept on or when a send takes time. Every sleep overshoots by
+    'overshoot' seconds, like a real sleep call.
+    '''
+    def __init__(self, overshoot=0.001):
+        self.now = 100.0
+        self.overshoot = overshoot
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds + self.overshoot
+
+
+@pytest.mark.parametrize("sim_speed", [1.0, 2.0, 10.0])
+def test_scheduler_does_not_drift(sim_speed):
+    clock = FakeClock()
+    sent = []
+
+    def send(item):
+        sent.append((item, clock.now))
+        # Each send takes 3 ms, and one send takes longer than the time to the next deadline
+        clock.now += 0.05 if item == 10 else 0.003
+
+    scheduler = ReplayScheduler(sim_speed=sim_speed, clock=clock, sleep=clock.sleep)
+    events = [(1000.0 + 0.1*i, i) for i in range(500)]
+    stats = scheduler.run(events, send)
+
+    start = sent[0][1]
+    lateness = [now - (start + (t - 1000.0)/sim_speed) for (t, _), (_, now) in zip(events, sent)]
+    assert [item for item, _ in sent] == list(range(500))
+    assert min(lateness) >= 0.0
+    # Only the items right after the slow send are late, and the lateness does not accumulate
+    late = [i for i, value in enumerate(lateness) if value > clock.overshoot + 1e-9]
+    assert all(11 <= i <= 11 + 0.05*sim_speed/0.1 for i in late)
+    assert abs(lateness[-1]) <= clock.overshoot + 1e-9
+    assert stats.sent == 500 and stats.span == pytest.approx(49.9)
+    assert stats.elapsed == pytest.approx(49.9/sim_speed, abs=0.01)
+    assert stats.target_rate == pytest.approx(499*sim_speed/49.9)
+
+
+def test_scheduler_stop_and_invalid_speed():
+    clock = FakeClock()
+    scheduler = ReplayScheduler(clock=clock, sleep=clock.sleep)
+    sent = []
+
+    def send(item):
+        sent.append(item)
+        if item == 4:
+            scheduler.stop()
+
+    assert scheduler.run(((float(i), i) for i in range(10)), send).sent == 5
+    assert sent == [0, 1, 2, 3, 4]
+    with pytest.raises(ValueError):
+        ReplayScheduler(sim_speed=0.0)
+
+
+def test_merge_streams_orders_by_time_and_breaks_ties_by_stream():
+    a = [(0.0, "a0"), (1.0, "a1"), (1.0, "a2"), (3.0, "a3")]
+    b = [(0.5, "b0"), (1.0, "b1"), (2.0, "b2")]
+    c = [(1.0, "c0"), (5.0, "c1")]
+    merged = list(merge_streams(a, b, c))
+    assert [item for _, item in merged] == ["a0", "b0", "a1", "a2", "b1", "c0", "b2", "a3", "c1"]
+    assert list(merge_streams()) == [] and list(merge_streams([], b)) == b
+
+
+def test_merge_streams_is_lazy():
+    pulled = []
+
+    def stream(name, step):
+        for i in range(1000000):
+            pulled.append(name)
+            yield i*step, name
+
+    merged = merge_streams(stream("slow", 10.0), stream("fast", 1.0))
+    events = [next(merged) for _ in range(25)]
+    assert [t for t, _ in events] == sorted(t for t, _ in events)
+    # Only one event per stream is read ahead of the merged output
+    assert len(pulled) <= 25 + 2
+
+
+def test_replay_streams_routes_each_stream_to_its_publisher():
+    class Recorder:
+        def __init__(self, name, log):
+            self.name = name
+            self.log = log
+
+        def publish(self, item):
+            self.log.append((self.name, item))
+
+    log = []
+    clock = FakeClock()
+    streams = [([(float(i), i) for i in range(0, 10, 2)], Recorder("ship", log)),
+               ([(float(i), i) for i in range(1, 10, 3)], Recorder("wind", log))]
+    stats = replay_streams(streams, ReplayScheduler(sim_speed=5.0, clock=clock, sleep=clock.sleep))
+    assert log == [("ship", 0), ("wind", 1), ("ship", 2), ("ship", 4), ("wind", 4), ("ship", 6), ("wind", 7), ("ship", 8)]
+    assert stats.sent == 8 and stats.span == 8.0
@@ -0,0 +1,40 @@
+import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge import resample
+from mqtt_nmea_bridge.datasets import Dataset, load_dataset
+from datetime import datetime, timezone
+import numpy as np
+
+DATASET = "example_data/example_docking_trajectory.csv"
+
+
+def test_uniform_grid_of_dataset():
+    dataset = load_dataset(DATASET)
+    resampled = resample.resample_dataset(dataset, 5.0)
+    np.testing.assert_allclose(np.diff(resampled.time), 5.0)
+    assert resampled.time[0] == dataset.time[0] and resampled.time[-1] <= dataset.time[-1]
+    # On a grid of the sample times, the dataset is unchanged
+    same = resample.resample_dataset(dataset, grid=dataset.time[::10])
+    np.testing.assert_allclose(same.data, dataset.data[::10], atol=1e-9)
+
+
+def test_angles_wrap_and_actuators_hold():
+    rows = [[0.0, 60.0, 10.0, 170.0, 0, 0, 0, -179.0, 1.0, 0.0],
+            [10.0, 60.0, 10.0, -170.0, 0, 0, 0, 179.0, 2.0, 50.0]]
+    resampled = resample.resample_dataset(Dataset(rows), 2.5)
+    np.testing.assert_allclose(resampled.X[:, 2], [170.0, 175.0, -180.0, -175.0, -170.0])
+    np.testing.assert_allclose(resampled.CS[:, 0], [-179.0, -179.5, -180.0, 179.5, 179.0])
+    np.testing.assert_allclose(resampled.U[:, 0], [0.0, 0.0, 0.0, 0.0, 50.0])
+
+
+def test_trajectory_and_time_conversion():
+    epoch = datetime(2023, 6, 1, tzinfo=timezone.utc)
+    shipstates = [mnb.ShipState(time=epoch.timestamp() + t, latitude=60.0 + t*1e-5, longitude=10.0, heading=0.0, cog=None,
+                                sog=1.0, nr_of_actuators=2, actuator_values=[t, -t]) for t in [0.0, 1.0, 3.0]]
+    relative, start = resample.to_relative_time([s.time for s in shipstates], epoch)
+    assert start == epoch.timestamp() and relative.tolist() == [0.0, 1.0, 3.0]
+    trajectory = resample.shift_time(mnb.Trajectory(shipstates), -start)
+    resampled = resample.resample_trajectory(trajectory, 0.5)
+    assert [s.time for s in resampled.shipstates] == [0.0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0]
+    assert [s.actuator_values for s in resampled.shipstates][3] == [1.0, -1.0]
+    assert resampled.shipstates[1].cog is None and resampled.shipstates[1].sog == 1.0
+    np.testing.assert_allclose(resample.to_absolute_time(1.5, start), epoch.timestamp() + 1.5)
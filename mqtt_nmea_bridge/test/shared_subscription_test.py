@@ -0,0 +1,187 @@
+import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge.shared import SharedSubscriberPool, _WORKER_DONE
+import multiprocessing
+import threading
+import queue
+import pytest
+import time
+import os
+
+
+class SharedQueueBroker:
+    '''
+    Broker stand-in for a single shared subscription group.
+
+    Every published message is put on one inter-process queue, which the clients of all worker
+    processes consume from. Like a shared subscription, each message is delivered to exactly one client.
+    '''
+    def __init__(self):
+        self.queue = multiprocessing.Queue()
+
+    def publish(self, topic, payload):
+        self.queue.put((topic, payload.encode()))
+
+    def client(self, client_id):
+        return _SharedQueueClient(self.queue)
+
+
+class _Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class _SharedQueueClient:
+    def __init__(self, queue):
+        self._queue = queue
+        self._running = False
+        self._thread = None
+        self.on_connect = None
+        self.on_message = None
+
+    def username_pw_set(self, username, password):
+        pass
+
+    def connect(self, broker, port):
+        self.on_connect(self, None, {}, 0)
+
+    def subscribe(self, topics):
+        pass
+
+    def loop_start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while self._running:
+            try:
+                topic, payload = self._queue.get(timeout=0.05)
+            except Exception:
+                continue
+            self.on_message(self, None, _Message(topic, payload))
+
+    def loop_stop(self):
+        self._running = False
+        self._thread.join()
+
+    def disconnect(self):
+        pass
+
+
+def _waypoint_count(vessel_id, kind, message):
+    # Only a small result is sent back, so the parent is not the bottleneck
+    return (message.shipstates[0].time, len(message.shipstates))
+
+
+def _failing_count(vessel_id, kind, message):
+    if message.shipstates[0].time == 3:
+        raise RuntimeError("Can not process the message.")
+    return _waypoint_count(vessel_id, kind, message)
+
+
+def _trajectory(t0, n):
+    return mnb.Trajectory([mnb.ShipState(time=t0 + i, latitude=51.29 + 1e-5*i, longitude=4.26, heading=-140.0,
+                                         cog=-62.0, sog=1.0, nr_of_actuators=7, actuator_values=[0.5]*7)
+                           for i in range(n)])
+
+
+def _run(n_workers, n_messages, n_vessels=4, waypoints=200, ordered=False, reorder_window=16):
+    broker = SharedQueueBroker()
+    scheme = mnb.TopicScheme()
+    pool = SharedSubscriberPool("sub", "localhost", 1883, n_workers=n_workers, process=_waypoint_count,
+                                ordered=ordered, reorder_window=reorder_window, client_factory=broker.client)
+    payloads = [(scheme.topic("trajectory", f"v{i % n_vessels}"), mnb.from_traj_to_mqtt_str(_trajectory(i, waypoints)))
+                for i in range(n_messages)]
+    pool.start("sub", "password")
+    start = time.perf_counter()
+    for topic, payload in payloads:
+        broker.publish(topic, payload)
+    while pool.queue.qsize() + pool.buffered < n_messages and time.perf_counter() - start < 60:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    pool.stop()
+    results = list(iter(pool.get, 0))
+    return elapsed, results
+
+
+def test_all_messages_are_decoded_once():
+    _, results = _run(n_workers=2, n_messages=200, waypoints=10)
+    assert sorted(result[2][0] for result in results) == list(range(200))
+    assert all(result[2][1] == 10 for result in results)
+
+
+def test_ordered_per_vessel():
+    # The window covers every message of a vessel, so the order does not depend on the scheduling of the workers
+    _, results = _run(n_workers=2, n_messages=200, waypoints=10, ordered=True, reorder_window=50)
+    for vessel_id in ["v0", "v1", "v2", "v3"]:
+        times = [result[2][0] for result in results if result[0] == vessel_id]
+        assert times == sorted(times)
+
+
+@pytest.mark.parametrize("drop_late", [True, False])
+def test_late_messages_after_watermark(drop_late):
+    # Arrivals of two vessels out of order by more than the window of 2, collected without workers
+    arrivals = [3, 1, 2, 5, 4, 0, 9, 8, 7, 6, 10]
+    pool = SharedSubscriberPool("sub", "localhost", 1883, n_workers=1, ordered=True, reorder_window=2,
+                                drop_late=drop_late)
+    pool._results = queue.Queue()
+    for key in arrivals:
+        for vessel_id in ("v0", "v1"):
+            pool._results.put((vessel_id, "ship_state", key, key))
+    pool._results.put(_WORKER_DONE)
+    pool._collect()
+    pool.flush()
+    results = list(iter(pool.get, 0))
+    assert pool.late == 2*2  # 0 and 6 arrive after a later message was released
+    for vessel_id in ("v0", "v1"):
+        keys = [result[2] for result in results if result[0] == vessel_id]
+        if drop_late:
+            assert keys == [1, 2, 3, 4, 5, 7, 8, 9, 10]
+        else:
+            assert sorted(keys) == sorted(arrivals)
+
+
+def test_collector_stops_when_workers_die():
+    pool = SharedSubscriberPool("sub", "localhost", 1883, n_workers=1)
+    pool._results = queue.Queue()
+    pool._workers = [multiprocessing.Process(target=os._exit, args=(1,))]
+    pool._workers[0].start()
+    pool._workers[0].join()
+    collector = threading.Thread(target=pool._collect, daemon=True)
+    collector.start()
+    collector.join(5.0)
+    assert not collector.is_alive()
+
+
+def _cpu_count():
+    # 'sched_getaffinity' is not available on macOS and Windows
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def test_malformed_messages_do_not_stop_the_workers():
+    broker = SharedQueueBroker()
+    topic = mnb.TopicScheme().topic("trajectory", "v0")
+    pool = SharedSubscriberPool("sub", "localhost", 1883, n_workers=1, process=_failing_count,
+                                client_factory=broker.client)
+    pool.start("sub", "password")
+    for payload in (b"\xff\xfe", b"not json", b'{"type": "TRAJECTORY"}'):
+        broker.queue.put((topic, payload))
+    for i in range(5):
+        broker.publish(topic, mnb.from_traj_to_mqtt_str(_trajectory(i, 3)))
+    start = time.perf_counter()
+    while pool.queue.qsize() < 4 and time.perf_counter() - start < 10:
+        time.sleep(0.001)
+    pool.stop()
+    assert sorted(result[2][0] for result in iter(pool.get, 0)) == [0, 1, 2, 4]
+    assert pool.malformed == 3 and pool.failed == 1
+
+
+@pytest.mark.skipif(_cpu_count() < 2, reason="needs at least 2 cores")
+def test_throughput_scales_with_workers():
+    n_workers = min(4, _cpu_count())
+    single, _ = _run(n_workers=1, n_messages=400)
+    multi, _ = _run(n_workers=n_workers, n_messages=400)
+    assert single / multi > 1 + 0.25 * (n_workers - 1)
@@ -0,0 +1,50 @@
+from mqtt_nmea_bridge import simplify
+from mqtt_nmea_bridge.datasets import load_dataset
+import numpy as np
+
+DATASET = "example_data/example_docking_trajectory.csv"
+
+
+def _actuator_filter(U, threshold):
+    # The point by point filter of 'optimize_dataset_horizon' in the examples
+    kept = [0]
+    for i in range(1, len(U)):
+        if any(abs(u - r) > threshold for u, r in zip(U[i], U[kept[-1]])):
+            kept.append(i)
+    return kept
+
+
+def test_actuator_filter_matches_point_by_point():
+    U = load_dataset(DATASET).U
+    for threshold in [0.0001, 0.001, 0.05, 0.2]:
+        assert simplify.actuator_change_indices(U, threshold).tolist() == _actuator_filter(U.tolist(), threshold)
+
+
+def test_douglas_peucker_within_tolerance():
+    dataset = load_dataset(DATASET)
+    points = simplify.local_metres(dataset.X[:, 0], dataset.X[:, 1])
+    indices = simplify.douglas_peucker_indices(points, 1.0)
+    assert indices[0] == 0 and indices[-1] == len(points) - 1
+    for first, last in zip(indices[:-1], indices[1:]):
+        distances = simplify._segment_distances(points[first + 1:last], points[first], points[last])
+        assert distances.size == 0 or distances.max() <= 1.0
+
+
+def test_combined_tolerances_hold_at_every_waypoint():
+    dataset = load_dataset(DATASET)
+    indices = simplify.simplify_indices(dataset, position_tolerance=0.5, heading_tolerance=2.0, actuator_tolerance=0.05)
+    assert len(indices) < len(dataset) / 10
+    # Interpolate the simplified trajectory at the original waypoint times
+    time = dataset.time
+    points = simplify.local_metres(dataset.X[:, 0], dataset.X[:, 1])
+    interpolated = np.column_stack([np.interp(time, time[indices], points[indices, k]) for k in range(2)])
+    assert np.linalg.norm(interpolated - points, axis=1).max() <= 0.5 + 1e-9
+    for j in range(dataset.nr_of_actuators):
+        assert np.abs(np.interp(time, time[indices], dataset.U[indices, j]) - dataset.U[:, j]).max() <= 0.05 + 1e-9
+
+
+def test_visvalingam_keeps_requested_number_of_points():
+    dataset = load_dataset(DATASET)
+    points = simplify.local_metres(dataset.X[:, 0], dataset.X[:, 1])
+    indices = simplify.visvalingam_indices(points, n_points=100)
+    assert len(indices) == 100 and indices[0] == 0 and indices[-1] == len(points) - 1
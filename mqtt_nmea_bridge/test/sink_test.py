@@ -0,0 +1,82 @@
+import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge.loopback import LoopbackBroker
+from mqtt_nmea_bridge.sink import SQLiteSink, read_ship_states, read_wind_states, read_trajectories
+import numpy as np
+import sqlite3
+import time
+
+
+def _shipstate(t):
+    return mnb.ShipState(time=float(t), latitude=63.4 + t*1e-5, longitude=10.4, heading=0.5, cog=None, sog=2.0,
+                         nr_of_actuators=2, actuator_values=[float(t), -1.5])
+
+
+def test_sqlite_sink_round_trip(tmp_path):
+    path = str(tmp_path / "history.db")
+    with SQLiteSink(path, batch_size=64, flush_interval=0.01) as sink:
+        for t in range(200):
+            sink.put("vessel/a/ship_state", _shipstate(t))
+            sink.put("vessel/a/wind_state", mnb.WindState(time=float(t), speed=3.0, direction=-1.0))
+        sink.put("vessel/a/trajectory", mnb.Trajectory([_shipstate(t) for t in range(5)]))
+        assert sink.flush(5.0)
+        # Readable while the sink is open
+        assert len(read_wind_states(path, start=10.0, end=20.0)) == 10
+    assert sink.written == 401 and sink.dropped == 0 and sink.failed == 0
+    assert sink.batches >= 401 // 64
+    assert read_ship_states(path, topic="vessel/a/ship_state") == [_shipstate(t) for t in range(200)]
+    assert read_ship_states(path, topic="vessel/b/ship_state") == []
+    assert read_trajectories(path) == [mnb.Trajectory([_shipstate(t) for t in range(5)])]
+    assert sqlite3.connect(path).execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert not sink.put("vessel/a/ship_state", _shipstate(0)) and sink.dropped == 1
+
+
+def test_subscriber_attached_sink(tmp_path):
+    path = str(tmp_path / "fleet.db")
+    broker = LoopbackBroker()
+    sink = SQLiteSink(path, flush_interval=0.01)
+    publisher = mnb.ShipStatePublisher("pub", "localhost", 1883, vessel_id="a", client_factory=broker.client)
+    subscriber = mnb.FleetSubscriber("sub", "localhost", 1883, client_factory=broker.client)
+    subscriber.attach(sink)
+    subscriber.connect("sub", "password")
+    publisher.connect("pub", "password")
+    start = time.monotonic()
+    while not (subscriber._connected and publisher._connected) and time.monotonic() - start < 5.0:
+        time.sleep(0.001)
+    for t in range(50):
+        publisher.publish(_shipstate(t))
+    start = time.monotonic()
+    while sink.written < 50 and time.monotonic() - start < 5.0:
+        sink.flush(1.0)
+    sink.close()
+    broker.close()
+    assert read_ship_states(path, topic="vessel/a/ship_state") == [_shipstate(t) for t in range(50)]
+
+
+def test_sqlite_sink_survives_bad_messages(tmp_path):
+    path = str(tmp_path / "history.db")
+    with SQLiteSink(path, batch_size=4, flush_interval=10.0) as sink:
+        array_state = _shipstate(0)
+        array_state.actuator_values = np.array([0.0, -1.5])
+        bad_state = _shipstate(1)
+        bad_state.actuator_values = [object()]
+        for message in (array_state, bad_state, "not a message", _shipstate(2)):
+            sink.put("vessel/a/ship_state", message)
+        assert sink.flush(5.0)
+        sink.put("vessel/a/ship_state", _shipstate(3))
+        assert sink.flush(5.0)
+    assert sink.written == 3 and sink.failed == 2 and isinstance(sink.error, TypeError)
+    assert read_ship_states(path) == [_shipstate(t) for t in (0, 2, 3)]
+
+
+def test_sqlite_sinks_share_a_database(tmp_path):
+    path = str(tmp_path / "history.db")
+    sinks = [SQLiteSink(path, flush_interval=0.01) for _ in range(2)]
+    for i in range(10):
+        for sink in sinks:
+            sink.put("vessel/a/trajectory", mnb.Trajectory([_shipstate(t) for t in range(i, i + 3)]))
+        for sink in sinks:
+            assert sink.flush(5.0)
+    for sink in sinks:
+        sink.close()
+        assert sink.written == 10 and sink.failed == 0
+    assert len(read_trajectories(path)) == 20
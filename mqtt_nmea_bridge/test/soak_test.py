@@ -0,0 +1,18 @@
+from mqtt_nmea_bridge.benchmarks.soak import run, SoakLimits
+
+
+def test_short_soak_passes():
+    report = run(duration=1.5, ship_state_rate=100, wind_state_rate=20, trajectory_rate=2, horizon=50,
+                 sample_interval=0.25, warmup=0.5, limits=SoakLimits(max_queue_depth=50, max_horizon_cache=51),
+                 verbose=False)
+    assert report.passed, report.violations
+    assert report.samples[-1].received["ship_state"] > 100
+    assert 0 < report.samples[-1].horizon_cache <= 51
+    assert report.top_allocators
+
+
+def test_stalled_consumer_fails_on_queue_depth():
+    report = run(duration=1.5, ship_state_rate=100, wind_state_rate=20, trajectory_rate=0, sample_interval=0.25,
+                 warmup=0.25, limits=SoakLimits(max_queue_depth=50), consume=False, trace_malloc=False, verbose=False)
+    assert not report.passed
+    assert any("ship_state queue" in violation for violation in report.violations)
@@ -0,0 +1,53 @@
+import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge import spatial
+from mqtt_nmea_bridge.datasets import load_dataset
+import numpy as np
+
+DATASET = "example_data/example_docking_trajectory.csv"
+
+
+def _linear_scan(index, trajectory, latitude, longitude):
+    north, east = index.to_local([s.latitude for s in trajectory.shipstates], [s.longitude for s in trajectory.shipstates])
+    qn, qe = index.to_local(latitude, longitude)
+    dn, de = np.diff(north), np.diff(east)
+    vn, ve = qn - north[:-1], qe - east[:-1]
+    length2 = dn*dn + de*de
+    fraction = np.where(length2 > 0, np.clip((vn*dn + ve*de)/np.where(length2 > 0, length2, 1.0), 0.0, 1.0), 0.0)
+    return np.hypot(vn - fraction*dn, ve - fraction*de).min(), int(np.hypot(qn - north, qe - east).argmin())
+
+
+def test_queries_match_linear_scan_as_the_horizon_moves():
+    dataset = load_dataset(DATASET)
+    moving_trajectory = mnb.MovingTrajectory(dataset, 600)
+    index = spatial.TrajectoryIndex(moving_trajectory.trajectory)
+    rng = np.random.default_rng(0)
+    for step in range(0, len(dataset) - 1500, 499):
+        # Every other horizon starts between two waypoints of the dataset
+        data_point = dataset[step]
+        data_point[0] += 0.2*(step % 2)
+        moving_trajectory.update_moving_trajectory(data_point)
+        trajectory = moving_trajectory.trajectory
+        index.update(trajectory)
+        assert len(index) == len(trajectory.shipstates)
+        for k in rng.integers(len(trajectory.shipstates), size=10):
+            shipstate = trajectory.shipstates[k]
+            latitude = shipstate.latitude + rng.normal(0, 1e-4)
+            longitude = shipstate.longitude + rng.normal(0, 1e-4)
+            position = index.query(latitude, longitude)
+            distance, nearest = _linear_scan(index, trajectory, latitude, longitude)
+            assert abs(abs(position.cross_track) - distance) < 1e-6
+            assert position.nearest_waypoint == nearest
+
+
+def test_progress_and_cross_track_sign():
+    # Northbound track of 100 m at 1 m/s
+    index = spatial.TrajectoryIndex(cell_size=5.0, origin=(63.4, 10.4))
+    north = np.linspace(0.0, 100.0, 11)
+    index.append(north, 63.4 + np.degrees(north/spatial.EARTH_RADIUS), np.full(11, 10.4))
+    latitude = 63.4 + np.degrees(42.0/spatial.EARTH_RADIUS)
+    east_of_track = 10.4 + np.degrees(3.0/(spatial.EARTH_RADIUS*np.cos(np.radians(63.4))))
+    position = index.query(latitude, east_of_track)
+    assert position.segment == 4 and position.nearest_waypoint == 4
+    assert abs(position.along_track - 42.0) < 1e-6 and abs(position.time - 42.0) < 1e-6
+    assert abs(position.cross_track - 3.0) < 1e-6
+    assert index.query(latitude, 2*10.4 - east_of_track).cross_track < 0
@@ -0,0 +1,46 @@
+from mqtt_nmea_bridge.tracing import LatencyTracker, make_header
+
+
+def _record(tracker, publisher_id, seqs, session=None):
+    return [tracker.record(make_header(publisher_id, seq, 0.0, session), 0.0)[1] for seq in seqs]
+
+
+def test_gaps_and_reorders_per_publisher():
+    tracker = LatencyTracker()
+    assert _record(tracker, "a", [1, 2, 5, 3, 6]) == [None, None, "gap", "reorder", None]
+    assert _record(tracker, "b", [1, 4]) == [None, "gap"]
+    assert tracker.gaps == 2 and tracker.reorders == 1
+    assert tracker.missing_by_publisher() == {"a": 1, "b": 2}
+    # A reorder of one publisher does not fill the gap of another
+    assert _record(tracker, "b", [4, 2]) == ["duplicate", "reorder"]
+    assert tracker.missing_by_publisher() == {"a": 1, "b": 1} and tracker.missing == 2
+
+
+def test_duplicates_and_restarts():
+    tracker = LatencyTracker(max_reorder=10)
+    assert _record(tracker, "a", range(1, 51)) == [None]*50
+    assert _record(tracker, "a", [50, 45]) == ["duplicate", "duplicate"]
+    # The publisher restarted, and its new sequence is tracked without reorders
+    assert _record(tracker, "a", range(1, 21)) == ["restart"] + [None]*19
+    assert tracker.duplicates == 2 and tracker.restarts == 1 and tracker.reorders == 0 and tracker.gaps == 0
+    assert tracker.count == 72
+
+
+def test_restart_with_new_session():
+    tracker = LatencyTracker(max_reorder=100)
+    assert _record(tracker, "a", range(1, 51), session="s1") == [None]*50
+    # Within the reorder distance, but the new session tells the restart apart from duplicates
+    assert _record(tracker, "a", range(1, 21), session="s2") == ["restart"] + [None]*19
+    assert _record(tracker, "a", [20, 25], session="s2") == ["duplicate", "gap"]
+    assert tracker.restarts == 1 and tracker.duplicates == 1 and tracker.missing == 4
+
+
+def test_percentiles():
+    tracker = LatencyTracker(window=100)
+    assert tracker.percentiles() == {50: None, 90: None, 99: None}
+    for i in range(200):
+        tracker.record({"sent": 0.0}, (i % 100 + 1)/1000)
+    assert tracker.percentiles((1, 50, 90, 100)) == {1: 0.001, 50: 0.05, 90: 0.09, 100: 0.1}
+    assert tracker.percentile(99) == 0.099
+    tracker.reset()
+    assert tracker.count == 0 and tracker.percentile(50) is None
@@ -0,0 +1,59 @@
+import mqtt_nmea_bridge as mnb
+from mqtt_nmea_bridge.loopback import LoopbackBroker
+from mqtt_nmea_bridge.wind import RollingWindow, WindStatisticsTracker
+import numpy as np
+import math
+import time
+
+
+def test_rolling_window_matches_rescan():
+    rng = np.random.default_rng(0)
+    times = np.cumsum(rng.uniform(0.05, 0.5, 5000))
+    speeds = rng.uniform(0.0, 15.0, times.size)
+    directions = math.pi - 0.3 + rng.normal(0.0, 0.2, times.size)  # Around south, where the angle wraps
+    rolling_window = RollingWindow(10.0, period=2*math.pi)
+    for i, (t, speed, direction) in enumerate(zip(times, speeds, directions)):
+        rolling_window.add(t, speed, direction)
+        if i % 97 == 0:
+            inside = times > t - 10.0
+            inside[i + 1:] = False
+            statistics = rolling_window.statistics()
+            assert statistics.count == inside.sum()
+            assert statistics.gust == speeds[inside].max() and statistics.lull == speeds[inside].min()
+            assert abs(statistics.mean_speed - speeds[inside].mean()) < 1e-9
+            assert abs(statistics.std_speed - speeds[inside].std()) < 1e-6
+            mean_direction = math.atan2(np.sin(directions[inside]).sum(), np.cos(directions[inside]).sum())
+            assert abs(statistics.mean_direction - mean_direction) < 1e-9
+
+
+def test_wind_state_subscriber_statistics():
+    broker = LoopbackBroker()
+    publisher = mnb.WindStatePublisher("pub", "localhost", 1883, client_factory=broker.client)
+    subscriber = mnb.WindStateSubscriber("sub", "localhost", 1883, client_factory=broker.client, statistics_windows=(10.0, 60.0))
+    subscriber.connect("sub", "password")
+    publisher.connect("pub", "password")
+    start = time.monotonic()
+    while not (subscriber._connected and publisher._connected) and time.monotonic() - start < 5.0:
+        time.sleep(0.001)
+    for t in range(100):
+        publisher.publish(mnb.WindState(time=float(t), speed=float(t % 20), direction=180.0 if t % 2 else -175.0))
+    start = time.monotonic()
+    while subscriber.wind_statistics(60.0).count < 60 and time.monotonic() - start < 5.0:
+        time.sleep(0.001)
+    statistics = subscriber.wind_statistics()
+    assert statistics[10.0].count == 10 and statistics[60.0].count == 60
+    assert statistics[10.0].gust == 19.0 and statistics[10.0].lull == 10.0
+    assert abs(statistics[60.0].mean_direction + 177.5) < 1e-9
+    assert subscriber.wind_statistics(10.0, now=200.0).count == 0
+    broker.close()
+
+
+def test_invalid_wind_states_are_skipped():
+    tracker = WindStatisticsTracker((10.0,))
+    assert tracker.add(mnb.WindState(time=0.0, speed=4.0, direction=350.0))
+    for speed, direction in [(None, 0.0), (5.0, None), (float("nan"), 0.0), (5.0, float("inf"))]:
+        assert not tracker.add(mnb.WindState(time=1.0, speed=speed, direction=direction))
+    assert tracker.add(mnb.WindState(time=2.0, speed=6.0, direction=10.0))
+    statistics = tracker.statistics(10.0, now=5.0)
+    assert tracker.skipped == 4 and statistics.count == 2 and statistics.mean_speed == 5.0
+    assert abs(statistics.mean_direction) < 1e-9
@@ -0,0 +1,112 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+
+# Message kinds
+SHIP_STATE = "ship_state"
+TRAJECTORY = "trajectory"
+WIND_STATE = "wind_state"
+KINDS = (SHIP_STATE, TRAJECTORY, WIND_STATE)
+
+# Topics used when no vessel ID is given
+LEGACY_TOPICS = {
+    SHIP_STATE: "ship_state/topic",
+    TRAJECTORY: "trajectory/topic",
+    WIND_STATE: "wind_state/topic",
+}
+
+VESSEL_ID = "{vessel_id}"
+
+
+class TopicScheme:
+    '''
+    Topic templates for a fleet of vessels, with one template per message kind.
+
+    Each template must contain the segment '{vessel_id}', e.g. 'vessel/{vessel_id}/ship_state'.
+    The vessel ID segment is replaced by '+' in the subscription filters, so one subscription per
+    message kind covers every vessel on the broker. Incoming topics are mapped back to their
+    message kind and vessel ID with a dictionary lookup.
+
+    --------------------------------------------------------------------
+    Parameters:
+        ship_state (str): Topic template for ship states.
+        trajectory (str): Topic template for trajectories.
+        wind_state (str): Topic template for wind states.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, ship_state="vessel/{vessel_id}/ship_state",
+                 trajectory="vessel/{vessel_id}/trajectory",
+                 wind_state="vessel/{vessel_id}/wind_state"):
+        self.templates = {SHIP_STATE: ship_state, TRAJECTORY: trajectory, WIND_STATE: wind_state}
+        # (number of segments, vessel ID index) -> {remaining segments: kind}
+        self._layouts = {}
+        for kind, template in self.templates.items():
+            segments = template.split("/")
+            if segments.count(VESSEL_ID) != 1 or "+" in segments or "#" in segments:
+                raise ValueError(f"Topic template '{template}' must contain exactly one '{VESSEL_ID}' segment and no wildcards.")
+            index = segments.index(VESSEL_ID)
+            rest = tuple(segments[:index] + segments[index+1:])
+            layout = self._layouts.setdefault((len(segments), index), {})
+            if rest in layout:
+                raise ValueError(f"Topic templates for '{layout[rest]}' and '{kind}' are equal.")
+            layout[rest] = kind
+
+    def topic(self, kind, vessel_id):
+        '''
+        Returns the topic of a message kind for a vessel.
+        '''
+        vessel_id = str(vessel_id)
+        if "/" in vessel_id or "+" in vessel_id or "#" in vessel_id:
+            raise ValueError(f"Vessel ID '{vessel_id}' can not contain '/', '+' or '#'.")
+        return self.templates[kind].replace(VESSEL_ID, vessel_id)
+
+    def subscription(self, kind):
+        '''
+        Returns the wildcard subscription filter matching a message kind for every vessel.
+        '''
+        return self.templates[kind].replace(VESSEL_ID, "+")
+
+    def parse(self, topic):
+        '''
+        Maps a topic to its message kind and vessel ID.
+
+        --------------------------------------------------------------------
+        Input:
+            topic (str): The topic of a received message.
+        Output:
+            tuple: kind (str), vessel_id (str), or None if the topic does not match any template.
+        --------------------------------------------------------------------
+        '''
+        segments = topic.split("/")
+        n = len(segments)
+        for (length, index), layout in self._layouts.items():
+            if length != n:
+                continue
+            kind = layout.get(tuple(segments[:index] + segments[index+1:]))
+            if kind is not None:
+                return kind, segments[index]
+        return None
+
+
+DEFAULT_SCHEME = TopicScheme()
+
+
+def resolve_topic(kind, vessel_id=None, scheme=None):
+    '''
+    Returns the topic of a message kind, which is the legacy topic if no vessel ID is given.
+    '''
+    if vessel_id is None:
+        return LEGACY_TOPICS[kind]
+    return (scheme or DEFAULT_SCHEME).topic(kind, vessel_id)
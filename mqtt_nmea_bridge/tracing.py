@@ -0,0 +1,217 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+from collections import deque
+import threading
+import math
+import os
+
+
+def new_session():
+    '''
+    Returns a random session ID, which tells the sequences of a restarted publisher apart.
+    '''
+    return os.urandom(8).hex()
+
+
+def make_header(publisher_id, seq, sent, session=None):
+    '''
+    Creates the transport header of a message.
+
+    The header is added to the JSON message as:
+    {
+        "type": ...,
+        "body": ...,
+        "header": {
+            "pub": PUBLISHER_ID,
+            "seq": SEQUENCE_NUMBER, # Increases by one for each message of the publisher
+            "sent": SEND_TIME, # Monotonic clock in seconds, only comparable on the same host
+            "ses": SESSION_ID # Random ID of the sequence, new when the publisher restarts. Optional
+        }
+    }
+
+    --------------------------------------------------------------------
+    Input:
+        publisher_id (str): The client ID of the publisher.
+        seq (int): The sequence number of the message.
+        sent (float): The send timestamp in seconds.
+        session (str): The session ID of the sequence, see 'new_session'. Left out if None.
+    Output:
+        header (dict): The header.
+    --------------------------------------------------------------------
+    '''
+    header = {"pub": publisher_id, "seq": seq, "sent": sent}
+    if session is not None:
+        header["ses"] = session
+    return header
+
+
+class LatencyTracker:
+    '''
+    Tracks publish-to-delivery latency, sequence gaps and reorders from the message headers.
+
+    The latency is the receive time minus the send time in the header, so the publisher and
+    subscriber clocks must be comparable. The percentiles are computed over the last 'window' messages.
+
+    The sequence numbers are tracked per publisher. A message whose sequence number skips ahead of
+    the next expected one opens a gap, and the skipped messages are counted as missing from that
+    publisher. A skipped message that arrives later is counted as a reorder, and is no longer
+    missing. A sequence number that was already received is counted as a duplicate. A message with
+    a new session ID is a restart of the publisher, which starts a new sequence; the messages still
+    missing from the previous sequence stay missing. For a header without a session ID, a sequence
+    number more than 'max_reorder' below the highest one received from the publisher is taken as a
+    restart instead.
+
+    --------------------------------------------------------------------
+    Parameters:
+        window (int): Number of latencies kept for the rolling percentiles.
+        max_reorder (int): The largest reorder distance. Older skipped messages are not remembered.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, window=1024, max_reorder=100):
+        self._latencies = deque(maxlen=window)
+        self._sequences = {}
+        self._lock = threading.Lock()
+        self.max_reorder = max_reorder
+        self.count = 0
+        self.gaps = 0
+        self.reorders = 0
+        self.duplicates = 0
+        self.restarts = 0
+
+    @property
+    def missing(self):
+        '''
+        Number of skipped messages of all publishers that have not arrived.
+        '''
+        with self._lock:
+            return sum(sequence.missing for sequence in self._sequences.values())
+
+    def missing_by_publisher(self):
+        '''
+        Returns the number of skipped messages that have not arrived, by publisher ID.
+        '''
+        with self._lock:
+            return {publisher_id: sequence.missing for publisher_id, sequence in self._sequences.items()}
+
+    def record(self, header, received):
+        '''
+        Records a received message.
+
+        --------------------------------------------------------------------
+        Input:
+            header (dict): The header of the message.
+            received (float): The receive timestamp, on the clock of the send timestamp.
+        Output:
+            latency (float): The latency of the message in seconds, or None if the header has no send time.
+            event (str): 'gap', 'reorder', 'duplicate', 'restart' or None.
+        --------------------------------------------------------------------
+        '''
+        sent = header.get("sent")
+        seq = header.get("seq")
+        latency = None if sent is None else received - sent
+        event = None
+        with self._lock:
+            self.count += 1
+            if latency is not None:
+                self._latencies.append(latency)
+            if seq is not None:
+                publisher_id = header.get("pub")
+                session = header.get("ses")
+                sequence = self._sequences.get(publisher_id)
+                if sequence is None:
+                    self._sequences[publisher_id] = _Sequence(seq, session)
+                elif session != sequence.session:
+                    self.restarts += 1
+                    sequence.restart(seq, session)
+                    event = "restart"
+                else:
+                    event = self._record_seq(sequence, seq)
+        return latency, event
+
+    def _record_seq(self, sequence, seq):
+        last = sequence.last
+        if seq == last + 1:
+            sequence.last = seq
+            return None
+        if seq > last + 1:
+            self.gaps += 1
+            sequence.missing += seq - last - 1
+            # Only the skipped messages that can still arrive as a reorder are remembered
+            sequence.skipped.update(range(max(last + 1, seq - self.max_reorder), seq))
+            if len(sequence.skipped) > 2*self.max_reorder:
+                sequence.skipped = {s for s in sequence.skipped if s >= seq - self.max_reorder}
+            sequence.last = seq
+            return "gap"
+        if seq in sequence.skipped:
+            sequence.skipped.discard(seq)
+            sequence.missing -= 1
+            self.reorders += 1
+            return "reorder"
+        if sequence.session is None and last - seq > self.max_reorder:
+            self.restarts += 1
+            sequence.restart(seq, None)
+            return "restart"
+        self.duplicates += 1
+        return "duplicate"
+
+    def percentiles(self, qs=(50, 90, 99)):
+        '''
+        Returns the latency percentiles over the window, in seconds.
+
+        --------------------------------------------------------------------
+        Input:
+            qs (tuple of floats): The percentiles, between 0 and 100.
+        Output:
+            percentiles (dict): Percentile -> latency, or None for each percentile if nothing is recorded.
+        --------------------------------------------------------------------
+        '''
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return {q: None for q in qs}
+        n = len(latencies)
+        # Nearest-rank percentiles
+        return {q: latencies[min(n - 1, max(0, math.ceil(q / 100 * n) - 1))] for q in qs}
+
+    def percentile(self, q):
+        return self.percentiles((q,))[q]
+
+    def reset(self):
+        with self._lock:
+            self._latencies.clear()
+            self._sequences.clear()
+            self.count = 0
+            self.gaps = 0
+            self.reorders = 0
+            self.duplicates = 0
+            self.restarts = 0
+
+
+class _Sequence:
+    # The sequence numbers received from one publisher
+    __slots__ = ("last", "session", "missing", "skipped")
+
+    def __init__(self, seq, session):
+        self.last = seq
+        self.session = session
+        self.missing = 0
+        self.skipped = set()
+
+    def restart(self, seq, session):
+        # The messages still missing from the previous sequence stay missing
+        self.last = seq
+        self.session = session
+        self.skipped = set()
@@ -0,0 +1,222 @@
+# MIT License
+# Copyright (c) 2023 Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# Norwegian University of Science and Technology (NTNU)
+# Department of Engineering Cybernetics
+# Author: Simon J. N. Lexau
+#
+# --------------------------------------------------------------------------------
+#
+# See the LICENSE file in the project root for full license information.
+#
+# --------------------------------------------------------------------------------
+#
+'''
+Rolling wind statistics over sliding time windows, updated in constant time per wind state.
+
+The mean and standard deviation of the speed are kept as running sums, the gust and lull as
+monotonic deques, and the direction as running sums of its sine and cosine, so the statistics can
+be read at any time without keeping and rescanning the raw history.
+
+The directions are in degrees like the 'direction' of the wind state messages. Give
+'period=2*math.pi' for radians.
+'''
+from dataclasses import dataclass
+from collections import deque
+import threading
+import math
+
+
+DEFAULT_WINDOWS = (10.0, 60.0, 600.0)
+
+
+@dataclass
+class WindStatistics:
+    '''
+    Dataclass for the statistics of the wind over a time window.
+
+    --------------------------------------------------------------------
+    Parameters:
+
+    window (float): The length of the window in seconds
+    count (int): Number of wind states in the window
+    mean_speed (float): In m/s
+    std_speed (float): Standard deviation of the speed in m/s
+    gust (float): Highest speed in m/s
+    lull (float): Lowest speed in m/s
+    mean_direction (float): Circular mean of the direction, in the unit of the directions (degrees by default)
+    steadiness (float): Length of the mean direction vector, from 0 for varying to 1 for a constant direction
+    --------------------------------------------------------------------
+    '''
+    window: float
+    count: int = 0
+    mean_speed: float = None
+    std_speed: float = None
+    gust: float = None
+    lull: float = None
+    mean_direction: float = None
+    steadiness: float = None
+
+
+class RollingWindow:
+    '''
+    Statistics of the wind states of the last 'window' seconds.
+
+    The time of a wind state is the time in the message. The window ends at the latest time, and a
+    wind state older than the latest one is counted as received at the latest time.
+
+    --------------------------------------------------------------------
+    Parameters:
+        window (float): The length of the window in seconds.
+        period (float): The period of the directions, 360 for degrees, 2*pi for radians.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, window, period=360.0):
+        if window <= 0:
+            raise ValueError("The window must be positive.")
+        self.window = window
+        self.period = period
+        self._to_radians = 2*math.pi/period
+        self._samples = deque()
+        # Decreasing and increasing speeds, the first ones being the gust and the lull of the window
+        self._max = deque()
+        self._min = deque()
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._sum_sin = 0.0
+        self._sum_cos = 0.0
+        self._removed = 0
+        self._latest = -math.inf
+
+    def add(self, time, speed, direction):
+        '''
+        Adds a wind state, with the time in seconds, the speed in m/s and the direction in the unit of 'period'.
+        Raises ValueError, without changing the window, if a value is not a finite number.
+        '''
+        if not (_is_finite(time) and _is_finite(speed) and _is_finite(direction)):
+            raise ValueError(f"Invalid wind state with time {time!r}, speed {speed!r} and direction {direction!r}.")
+        time = max(time, self._latest)
+        self._latest = time
+        angle = direction*self._to_radians
+        sin, cos = math.sin(angle), math.cos(angle)
+        self._samples.append((time, speed, sin, cos))
+        self._sum += speed
+        self._sum_sq += speed*speed
+        self._sum_sin += sin
+        self._sum_cos += cos
+        while self._max and self._max[-1][1] <= speed:
+            self._max.pop()
+        self._max.append((time, speed))
+        while self._min and self._min[-1][1] >= speed:
+            self._min.pop()
+        self._min.append((time, speed))
+        self.expire(time)
+
+    def expire(self, now):
+        '''
+        Removes the wind states older than 'window' seconds before 'now'.
+        '''
+        start = now - self.window
+        samples = self._samples
+        while samples and samples[0][0] <= start:
+            _, speed, sin, cos = samples.popleft()
+            self._sum -= speed
+            self._sum_sq -= speed*speed
+            self._sum_sin -= sin
+            self._sum_cos -= cos
+            self._removed += 1
+        while self._max and self._max[0][0] <= start:
+            self._max.popleft()
+        while self._min and self._min[0][0] <= start:
+            self._min.popleft()
+        # The running sums accumulate rounding errors as samples are removed. Summing the window
+        # again after as many removals as there are samples keeps the cost O(1) per sample.
+        if self._removed > len(samples) + 64:
+            self._resum()
+
+    def statistics(self):
+        count = len(self._samples)
+        if count == 0:
+            return WindStatistics(self.window)
+        mean = self._sum/count
+        variance = max(self._sum_sq/count - mean*mean, 0.0)
+        return WindStatistics(window=self.window,
+                              count=count,
+                              mean_speed=mean,
+                              std_speed=math.sqrt(variance),
+                              gust=self._max[0][1],
+                              lull=self._min[0][1],
+                              mean_direction=math.atan2(self._sum_sin, self._sum_cos)/self._to_radians,
+                              steadiness=min(math.hypot(self._sum_sin, self._sum_cos)/count, 1.0))
+
+    def _resum(self):
+        samples = self._samples
+        self._sum = math.fsum(s[1] for s in samples)
+        self._sum_sq = math.fsum(s[1]*s[1] for s in samples)
+        self._sum_sin = math.fsum(s[2] for s in samples)
+        self._sum_cos = math.fsum(s[3] for s in samples)
+        self._removed = 0
+
+
+class WindStatisticsTracker:
+    '''
+    Rolling wind statistics over several time windows, safe to update and read from different threads.
+
+    Wind states with a time, speed or direction that is not a finite number, e.g. None, are counted
+    in 'skipped' and do not change the statistics.
+
+    --------------------------------------------------------------------
+    Parameters:
+        windows (tuple of floats): The lengths of the windows in seconds.
+        period (float): The period of the directions, 360 for degrees, 2*pi for radians.
+    --------------------------------------------------------------------
+    '''
+    def __init__(self, windows=DEFAULT_WINDOWS, period=360.0):
+        self._windows = {window: RollingWindow(window, period) for window in windows}
+        self._lock = threading.Lock()
+        self.skipped = 0
+
+    @property
+    def windows(self):
+        return tuple(self._windows)
+
+    def add(self, wind_state):
+        '''
+        Adds a WindState to all windows. Returns False if it was skipped.
+        '''
+        time, speed, direction = wind_state.time, wind_state.speed, wind_state.direction
+        with self._lock:
+            if not (_is_finite(time) and _is_finite(speed) and _is_finite(direction)):
+                self.skipped += 1
+                return False
+            for rolling_window in self._windows.values():
+                rolling_window.add(time, speed, direction)
+        return True
+
+    def statistics(self, window=None, now=None):
+        '''
+        Returns the statistics of a window, or of all windows as a dict by window if 'window' is None.
+
+        --------------------------------------------------------------------
+        Input:
+            window (float): The length of the window, one of 'windows'.
+            now (float): Expire the wind states older than the window before this time, on the
+                clock of the wind state times. The time of the latest wind state if None.
+        Output:
+            statistics (WindStatistics / dict of WindStatistics): The statistics.
+        --------------------------------------------------------------------
+        '''
+        with self._lock:
+            selected = self._windows.values() if window is None else [self._windows[window]]
+            statistics = {}
+            for rolling_window in selected:
+                if now is not None:
+                    rolling_window.expire(now)
+                statistics[rolling_window.window] = rolling_window.statistics()
+        return statistics if window is None else statistics[window]
+
+
+def _is_finite(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
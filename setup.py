@@ -10,15 +10,19 @@ setup(
     long_description=open('README.md').read(),
     long_description_content_type='text/markdown',
     packages=find_packages(),
+    python_requires='>=3.7',  # Dataclasses and the module '__getattr__' of the package
     install_requires=[
         'paho-mqtt==1.6.1',  # Add other dependencies here
+        'numpy>=1.21',
     ],
+    extras_require={
+        'geo': ['pyproj'],  # Coordinate transforms in 'mqtt_nmea_bridge.geo'
+    },
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Science/Research',
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: 3.9',